@@ -1,5 +1,6 @@
 import click
 import octopusai.commands.bug_detection_command as bug_detection_command
+import octopusai.commands.bug_batch_command as bug_batch_command
 
 def print_banner():
     """
@@ -30,6 +31,7 @@ def run():
 
 main.add_command(run)
 run.add_command(bug_detection_command.bug_detection)
+run.add_command(bug_batch_command.bug_batch)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,250 @@
+import asyncio
+import csv
+import io
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+import traceback
+from collections import Counter, defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, TextIO
+
+import click
+
+# State fields copied into the aggregated results, the rest (diff, PR details, ...) stays in the run log.
+RESULT_STATE_FIELDS = ["repo_dir", "pr_local_branch", "bug_present", "fixes_verified", "fixed_files", "pull_request_summary"]
+# Modes of the bug command which run unattended, the sequential flow's tasks ask for human input
+MODES = ("hierarchical", "pipeline")
+
+
+def read_manifest(path: str) -> List[Dict[str, Any]]:
+    """
+    Read a batch manifest, either CSV with a header row or JSONL, with the columns
+    repo, pr_number, active_branch and optionally mode, requirement_id, clone_mode.
+    """
+    with open(path, newline="") as f:
+        if path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    jobs = []
+    for i, row in enumerate(rows, start=1):
+        row = {k.strip(): v.strip() if isinstance(v, str) else v for k, v in row.items() if k and v not in (None, "")}
+        missing = [k for k in ("repo", "pr_number", "active_branch") if k not in row]
+        if missing:
+            raise click.BadParameter(f"Manifest entry {i} is missing {', '.join(missing)}", param_hint="MANIFEST")
+        row.setdefault("mode", "hierarchical")
+        if row["mode"] == "sequential":
+            raise click.BadParameter(f"Manifest entry {i} has mode 'sequential', which asks for human input and cannot run "
+                                     f"in a batch, use one of {', '.join(MODES)}", param_hint="MANIFEST")
+        if row["mode"] not in MODES:
+            raise click.BadParameter(f"Manifest entry {i} has an unknown mode {row['mode']!r}, expected one of {', '.join(MODES)}",
+                                     param_hint="MANIFEST")
+        jobs.append(row)
+    return jobs
+
+
+def _run_dir_name(job: Dict[str, Any], index: int) -> str:
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", job["repo"])
+    return f"{index:03d}-{slug}-pr{job['pr_number']}-{job['mode']}"
+
+
+def _run_job(job: Dict[str, Any], run_dir: str) -> Dict[str, Any]:
+    """
+    Run one flow inside `run_dir`. Executed in a fresh worker process: the working directory and
+    stdout/stderr (including those of subprocesses) are redirected for the lifetime of the process.
+    """
+    os.makedirs(run_dir, exist_ok=True)
+    os.chdir(run_dir)
+    log = open("run.log", "w", buffering=1)
+    os.dup2(log.fileno(), sys.stdout.fileno())
+    os.dup2(log.fileno(), sys.stderr.fileno())
+
+    inputs = _flow_inputs(job)
+    result = {"job": job, "run_dir": run_dir, "status": "ok", "error": None}
+    start = time.perf_counter()
+    try:
+        flow = _flow_module(job).main(inputs=inputs)
+        _set_state(result, flow)
+    except Exception as e:
+        traceback.print_exc()
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["elapsed_s"] = round(time.perf_counter() - start, 3)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return result
+
+
+def _flow_inputs(job: Dict[str, Any]) -> Dict[str, Any]:
+    if job["mode"] not in MODES:
+        raise ValueError(f"Unknown mode {job['mode']!r}, expected one of {', '.join(MODES)}")
+    inputs = {k: v for k, v in job.items() if k != "mode"}
+    inputs["crew_mode"] = job["mode"]
+    return inputs
+
+
+def _flow_module(job: Dict[str, Any]):
+    # Both modes run in the hierarchical flow
+    import octopusai.crews.bug_detection_hierarchical as flow_module
+    return flow_module
+
+
+def _set_state(result: Dict[str, Any], flow) -> None:
+    state = flow.state.model_dump()
+    result["state"] = {k: state.get(k) for k in RESULT_STATE_FIELDS if k in state}
+
+
+def _record(result: Dict[str, Any], index: int, total: int, results: List[Dict[str, Any]], results_file: TextIO) -> None:
+    job = result["job"]
+    result["index"] = index
+    results.append(result)
+    results_file.write(json.dumps(result) + "\n")
+    results_file.flush()
+    click.echo(f"[{index}/{total}] {result['status']} {job['repo']}#{job['pr_number']} ({job['mode']})"
+               f" in {result.get('elapsed_s', '?')}s")
+
+
+def run_batch(jobs: List[Dict[str, Any]], output_dir: str, results_path: str, workers: int, per_repo: int) -> List[Dict[str, Any]]:
+    """
+    Run the jobs on a process pool with at most `workers` runs in total and `per_repo` runs per repository.
+    Each finished run is appended to `results_path` (JSONL) as soon as it completes.
+    """
+    pending = deque((i, job, os.path.abspath(os.path.join(output_dir, _run_dir_name(job, i))))
+                    for i, job in enumerate(jobs, start=1))
+    running_per_repo = Counter()
+    futures = {}
+    results = []
+
+    # One process per run keeps module level state (LLMs, tools, cwd) isolated between runs.
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, max_tasks_per_child=1) as pool, \
+            open(results_path, "a") as results_file:
+        while pending or futures:
+            blocked = deque()
+            while pending and len(futures) < workers:
+                i, job, run_dir = pending.popleft()
+                if running_per_repo[job["repo"]] >= per_repo:
+                    blocked.append((i, job, run_dir))
+                    continue
+                running_per_repo[job["repo"]] += 1
+                futures[pool.submit(_run_job, job, run_dir)] = (i, job, run_dir)
+                click.echo(f"[{i}/{len(jobs)}] started {job['repo']}#{job['pr_number']} ({job['mode']}) -> {run_dir}")
+            pending.extendleft(reversed(blocked))
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                i, job, run_dir = futures.pop(future)
+                running_per_repo[job["repo"]] -= 1
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # The worker itself died (e.g. killed by the OOM killer)
+                    result = {"job": job, "run_dir": run_dir, "status": "error", "error": f"{type(e).__name__}: {e}"}
+                _record(result, i, len(jobs), results, results_file)
+    return results
+
+
+# Log file of the run executing in the current context (asyncio task, and threads started with to_thread)
+_run_log: ContextVar[Optional[TextIO]] = ContextVar("run_log", default=None)
+
+
+class _RunOutput(io.TextIOBase):
+    """
+    sys.stdout/sys.stderr replacement writing to the log of the current run, or to the original stream outside of runs.
+    Output written by subprocesses directly to the file descriptors is not redirected.
+    """
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+
+    def write(self, text: str) -> int:
+        return (_run_log.get() or self.stream).write(text)
+
+    def flush(self) -> None:
+        (_run_log.get() or self.stream).flush()
+
+    def isatty(self) -> bool:
+        return False
+
+
+async def _run_job_async(job: Dict[str, Any], run_dir: str) -> Dict[str, Any]:
+    """
+    Run one flow in the current event loop, logging to `run_dir`/run.log. The crew's output log is
+    written to `run_dir` as well (output_dir input), the process working directory is shared.
+    """
+    os.makedirs(run_dir, exist_ok=True)
+    inputs = _flow_inputs(job)
+    inputs["output_dir"] = run_dir
+    result = {"job": job, "run_dir": run_dir, "status": "ok", "error": None}
+    start = time.perf_counter()
+    with open(os.path.join(run_dir, "run.log"), "w", buffering=1) as log:
+        _run_log.set(log)
+        try:
+            flow = await _flow_module(job).main_async(inputs=inputs)
+            _set_state(result, flow)
+        except Exception as e:
+            traceback.print_exc()
+            result["status"] = "error"
+            result["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            _run_log.set(None)
+    result["elapsed_s"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+async def run_batch_async(jobs: List[Dict[str, Any]], output_dir: str, results_path: str, workers: int, per_repo: int) -> List[Dict[str, Any]]:
+    """
+    Run the jobs as concurrent flows in one event loop, which share the imported modules and clients.
+    Jobs mostly wait on LLM and GitHub I/O, so `workers` can be much higher than with the process pool.
+    """
+    slots = asyncio.Semaphore(workers)
+    repo_slots = defaultdict(lambda: asyncio.Semaphore(per_repo))
+    results = []
+
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = _RunOutput(stdout), _RunOutput(stderr)
+    try:
+        with open(results_path, "a") as results_file:
+            async def run(i: int, job: Dict[str, Any]) -> None:
+                run_dir = os.path.abspath(os.path.join(output_dir, _run_dir_name(job, i)))
+                # The repository slot first, a run waiting for it must not hold a global slot
+                async with repo_slots[job["repo"]], slots:
+                    click.echo(f"[{i}/{len(jobs)}] started {job['repo']}#{job['pr_number']} ({job['mode']}) -> {run_dir}")
+                    result = await _run_job_async(job, run_dir)
+                _record(result, i, len(jobs), results, results_file)
+
+            await asyncio.gather(*(run(i, job) for i, job in enumerate(jobs, start=1)))
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+    return results
+
+
+@click.command("bug-batch")
+@click.argument("manifest", type=click.Path(exists=True, dir_okay=False))
+@click.option("--workers", "-w", type=click.IntRange(min=1), default=8, show_default=True, help="Maximum number of concurrent runs")
+@click.option("--per_repo", "-p", type=click.IntRange(min=1), default=4, show_default=True, help="Maximum number of concurrent runs per repository")
+@click.option("--output_dir", "-o", type=click.Path(file_okay=False), default="batch_runs", show_default=True, help="Directory for per-run working directories and logs")
+@click.option("--results", "results_path", type=click.Path(dir_okay=False), default=None, help="Aggregated results file (JSONL), defaults to <output_dir>/results.jsonl")
+@click.option("--executor", "-e", type=click.Choice(["process", "async"]), default="process", show_default=True, help="One process per run, or all runs as concurrent flows in one event loop")
+def bug_batch(manifest: str, workers: int, per_repo: int, output_dir: str, results_path: str, executor: str):
+    """Run the bug detection workflow for every PR in a CSV/JSONL manifest."""
+    jobs = read_manifest(manifest)
+    os.makedirs(output_dir, exist_ok=True)
+    results_path = results_path or os.path.join(output_dir, "results.jsonl")
+    click.echo(f"Running {len(jobs)} bug detection runs with {workers} {executor} workers ({per_repo} per repository)...")
+
+    start = time.perf_counter()
+    if executor == "async":
+        results = asyncio.run(run_batch_async(jobs, output_dir, results_path, workers, per_repo))
+    else:
+        results = run_batch(jobs, output_dir, results_path, workers, per_repo)
+    elapsed = time.perf_counter() - start
+
+    failed = [r for r in results if r["status"] != "ok"]
+    click.echo(f"Finished {len(results)} runs in {elapsed:.1f}s, {len(failed)} failed. Results: {results_path}")
@@ -2,6 +2,7 @@ import click
 import octopusai.crews.bug_detection_flow as sequential
 import octopusai.crews.bug_detection_hierarchical as hierarchical
 from crewai_tools import MCPServerAdapter
+from octopusai.tools.triage import TRIAGE_POLICIES
 
 
 @click.command("bug")
@@ -9,9 +10,16 @@ from crewai_tools import MCPServerAdapter
 @click.argument("pr_number")
 @click.argument("active_branch")
 @click.option("--requirement_id", "-r", help="Requirement ID for the Pull Request (PR)")
-@click.option("--mode", "-m", type=click.Choice(["sequential", "hierarchical"]), default="sequential", help="Choose the bug detection mode")
+@click.option("--mode", "-m", type=click.Choice(["sequential", "hierarchical", "pipeline"]), default="sequential", help="Choose the bug detection mode: one agent after another, a manager delegating to the specialists, or the specialists in fixed review, QA, fix, verify and git steps")
+@click.option("--clone_mode", "-c", type=click.Choice(["mirror", "full", "sparse"]), default="mirror", help="How to clone the repository: shared clone of a local mirror, plain full clone, or partial sparse clone of the PR's files")
+@click.option("--sparse_path", "-s", multiple=True, help="Extra path to check out in sparse clone mode (repeatable), defaults to python_testcases")
+@click.option("--context_budget", "-b", type=click.IntRange(min=1000), default=12000, show_default=True, help="Token budget of the review context (hierarchical and pipeline modes)")
+@click.option("--triage", "-t", "triage_policy", type=click.Choice(TRIAGE_POLICIES), default="evidence", show_default=True, help="Run the impacted tests and static checks before the crew: off, add them as evidence, or also skip the crew for clean PRs (hierarchical and pipeline modes)")
+@click.option("--triage_host_tests", is_flag=True, default=False, help="Run the PR's tests (pre-triage and evaluation) on the host when Docker is not available for the sandbox; the tests are code of the PR")
+@click.option("--llm_cache", is_flag=True, default=False, help="Answer repeated LLM calls from the on-disk completion cache (hierarchical and pipeline modes)")
+@click.option("--plan_cache", is_flag=True, default=False, help="Reuse the crew plan of earlier PRs with the same language, file count and diff size instead of planning again (hierarchical mode)")
 @click.pass_context
-def bug_detection(ctx: click.Context, repo: str, pr_number: str, active_branch: str, requirement_id: str, mode: str):
+def bug_detection(ctx: click.Context, repo: str, pr_number: str, active_branch: str, requirement_id: str, mode: str, clone_mode: str, sparse_path: tuple, context_budget: int, triage_policy: str, triage_host_tests: bool, llm_cache: bool, plan_cache: bool):
     """Run the bug detection workflow."""
     click.echo("Running Bug Detection Workflow...")
     inputs={
@@ -19,7 +27,18 @@ def bug_detection(ctx: click.Context, repo: str, pr_number: str, active_branch:
         "pr_number": pr_number,
         "active_branch": active_branch,
         "requirement_id": requirement_id,
+        "clone_mode": clone_mode,
+        "context_token_budget": context_budget,
+        "llm_cache": llm_cache,
+        "triage_policy": triage_policy,
+        "triage_host_tests": triage_host_tests,
+        "plan_cache": plan_cache,
     }
+    if sparse_path:
+        inputs["sparse_extra_paths"] = list(sparse_path)
+    if mode != "sequential":
+        # The pipeline runs in the hierarchical flow, with the same setup and agents but no manager
+        inputs["crew_mode"] = mode
     click.echo(f"Inputs: {inputs}")
 
     if mode == "sequential":
@@ -1,10 +1,15 @@
 from crewai import Flow, Agent, Task, Crew, Process
-from crewai.flow.flow import start, listen
+from crewai.flow.flow import and_, start, listen
 from crewai_tools import DirectoryReadTool, FileReadTool, FileWriterTool
-from pydantic import BaseModel
+from typing import List
+from pydantic import BaseModel, Field
+import asyncio
 import json
+import os
 import octopusai.tools.langchain_github as langchain_gh
 import octopusai.tools.git_tool as git_tool
+from octopusai.tools.diff_model import PullRequestDiff, parse_diff
+from octopusai.tools.github_graphql import PullRequestInfo, fetch_pull_request
 from crewai_tools import MCPServerAdapter
 
 class FlowState(BaseModel):
@@ -15,10 +20,16 @@ class FlowState(BaseModel):
     requirement_id: str | None = None
     repo_url: str | None = None
     repo_dir: str | None = None
+    pull_request: PullRequestInfo | None = None
     pr_details: dict | None = None
-    pr_diff: str | None = None
+    pr_diff: str | None = None # Rendered diff without lockfiles, vendored, binary and generated files
+    diff: PullRequestDiff | None = None
     pr_local_branch: str | None = None
+    clone_mode: str = "mirror" # mirror | full | sparse
+    sparse_extra_paths: List[str] = Field(default_factory=lambda: ["python_testcases"])
     pull_request_query: str | None = None
+    prd: str | None = None # Product requirement document of requirement_id, fetched through get_prd_tool
+    output_dir: str | None = None # Directory of the flow plot, the working directory by default
     #code_fix_patch: str | None = None
 
 
@@ -38,53 +49,94 @@ class BugDetectionFlow(Flow[FlowState]):
     def initialize(self):
         print("Initializing Bug Detection Flow...")
         print(json.dumps(self.state.model_dump(), indent=2))
+        self._pull_request_task = None
         self.state.repo_url = f"https://github.com/{self.state.repo}"
+        # Known up front, so cloning and diffing do not wait for the PR details
+        self.state.pr_local_branch = f"pr-{self.state.pr_number}"
         return self.state
 
-    
+    async def _fetch_pull_request(self) -> PullRequestInfo:
+        # Shared by get_pr_details and sparse clones, which need the changed paths
+        if self._pull_request_task is None:
+            self._pull_request_task = asyncio.ensure_future(
+                asyncio.to_thread(fetch_pull_request, self.state.repo, self.state.pr_number))
+        return await self._pull_request_task
+
+    # get_pr_details, clone_repository and get_prd run concurrently
     @listen(initialize)
-    def get_pr_details(self):
-        pr = langchain_gh.GetPullRequest()
-        pr_details = pr._run(repo=self.state.repo, pr_number=self.state.pr_number)
-        pr_local_branch = f"pr-{self.state.pr_number}"
+    async def get_pr_details(self):
+        self.state.pull_request = await self._fetch_pull_request()
+        pr_details = self.state.pull_request.summary()
         print(f"Pull Request Details: {pr_details}")
         self.state.pr_details = pr_details
-        self.state.pr_local_branch = pr_local_branch
         return pr_details
 
-    @listen(get_pr_details)
-    def clone_repository(self):
-        print(f"Cloning repository: {self.state.repo_url}")
-        git = git_tool.Clone(self.state.repo_url)
-        repo_dir = git._run()
+    @listen(initialize)
+    async def clone_repository(self):
+        print(f"Cloning repository: {self.state.repo_url} (mode: {self.state.clone_mode})")
+        sparse_paths = None
+        if self.state.clone_mode == "sparse":
+            pull_request = await self._fetch_pull_request()
+            sparse_paths = pull_request.file_paths()
+            if pull_request.has_renames():
+                # GraphQL does not report the previous path of renamed files, the base branch needs it
+                sparse_paths = await asyncio.to_thread(langchain_gh.ListPullRequestFilePaths()._run,
+                                                       repo=self.state.repo, pr_number=self.state.pr_number)
+            sparse_paths += self.state.sparse_extra_paths
+            print(f"Sparse checkout paths: {sparse_paths}")
+        git = git_tool.Clone(self.state.repo_url,
+                             use_mirror=self.state.clone_mode == "mirror",
+                             sparse_paths=sparse_paths,
+                             pr_number=self.state.pr_number)
+        repo_dir = await asyncio.to_thread(git._run)
         print("Repository cloned successfully to:", repo_dir)
         self.state.repo_dir = repo_dir
         return repo_dir 
 
+    @listen(initialize)
+    async def get_prd(self):
+        if self.get_prd_tool is None or not self.state.requirement_id:
+            return None
+        try:
+            prd = await asyncio.to_thread(self.get_prd_tool.run, requirement_id=self.state.requirement_id)
+        except Exception as e:
+            print(f"Error fetching the product requirement document: {str(e)}")
+            return None
+        self.state.prd = str(prd)
+        return self.state.prd
+
     @listen(clone_repository)
-    def get_pr_diff(self):
+    async def get_pr_diff(self):
         print(f"Getting diff for PR: {self.state.pr_number}")
         git = git_tool.Diff()
-        diff = git._run(repo_dir=self.state.repo_dir, pr_number=self.state.pr_number, pr_local_branch=self.state.pr_local_branch, incremental=True)
+        diff = await asyncio.to_thread(git._run, repo_dir=self.state.repo_dir, pr_number=self.state.pr_number,
+                                       pr_local_branch=self.state.pr_local_branch, incremental=True)
+        if diff.startswith("Error"):
+            self.state.pr_diff = diff
+        else:
+            self.state.diff = parse_diff(diff)
+            self.state.pr_diff = self.state.diff.render()
         print(f"{'>' * 30 } Diff {'>' * 30 }")
-        print(diff)
+        if self.state.diff:
+            print(self.state.diff.summary())
+        print(self.state.pr_diff)
         print(f"{'<' * 30 } Diff {'<' * 30 }")
-        self.state.pr_diff = diff
-        return diff
+        return self.state.pr_diff
     
     #### @listen(clone_repository)
     #### def get_repo_languages(self):
 
-    @listen(clone_repository)
-    def checkout_pr(self):
+    # The diff step fetches the PR branch, checking out before it would fail
+    @listen(get_pr_diff)
+    async def checkout_pr(self):
         print(f"Checking out PR branch: {self.state.pr_local_branch}")
         git = git_tool.Checkout()
-        git._run(repo_dir=self.state.repo_dir, branch_name=self.state.pr_local_branch)
+        await asyncio.to_thread(git._run, repo_dir=self.state.repo_dir, branch_name=self.state.pr_local_branch)
         print(f"Checked out to branch: {self.state.pr_local_branch}")
         return self.state.pr_local_branch
     
-    @listen(get_pr_diff)
-    def bug_detection(self):
+    @listen(and_(checkout_pr, get_pr_details, get_prd))
+    async def bug_detection(self):
 
         reviewer_tools = [
             DirectoryReadTool(),
@@ -168,6 +220,7 @@ class BugDetectionFlow(Flow[FlowState]):
             located in {self.state.repo_dir} for bugs and code quality issues.
             Your should refer to the product requirement document if available, to make sure the code changes are aligned with the requirements.
             The product requirement document is available in the tool {self.get_prd_tool.name}, you should understand that the only required field of this tool is requirement_id {self.state.requirement_id}.
+            {f"The product requirement document: {self.state.prd}" if self.state.prd else ""}
             The PR diff is as follows:\n{self.state.pr_diff}\nDeep dive into the diff and only check the code changes made in this PR.
             Run the code in a safe environment to make sure your findings are accurate.
             Provide a detailed report of the findings, including explanations for each identified issue.
@@ -241,19 +294,20 @@ class BugDetectionFlow(Flow[FlowState]):
             verbose=True,
             cache=False,
         )
-        result = crew.kickoff()
+        result = await crew.kickoff_async()
         self.state.pull_request_query = pull_request_query_generation.output.raw
         print(result.token_usage)
         return result.raw
     
     @listen(bug_detection)
-    def create_pull_request(self):
+    async def create_pull_request(self):
         print(f"Creating pull request with query: {self.state.pull_request_query}")
         pr = langchain_gh.CreatePullRequest()
-        pr_response = pr._run(repo=self.state.repo, 
-                              pr_query=self.state.pull_request_query, 
-                              src_branch=self.state.pr_local_branch, 
-                              dest_branch=self.state.active_branch)
+        pr_response = await asyncio.to_thread(pr._run,
+                                              repo=self.state.repo,
+                                              pr_query=self.state.pull_request_query,
+                                              src_branch=self.state.pr_local_branch,
+                                              dest_branch=self.state.active_branch)
         print(f"Pull Request created successfully: {pr_response}")
         print(f"State: {json.dumps(self.state.model_dump(), indent=2)}")
         return pr_response
@@ -265,8 +319,24 @@ def main(inputs=None, mcp_tools=None):
         flow.get_prd_tool = mcp_tools["get_prd"]
     # Inputs will be assigned to the flow state by CrewAI
     flow.kickoff(inputs=inputs)
-    flow.plot("bug_detection_flow")
-    print("Flow visualization saved to bug_detection_flow.html")
+    _plot(flow)
+    return flow
+
+async def main_async(inputs=None, mcp_tools=None):
+    """
+    main() for callers running several flows in one event loop.
+    """
+    flow = BugDetectionFlow()
+    if mcp_tools:
+        flow.get_prd_tool = mcp_tools["get_prd"]
+    await flow.kickoff_async(inputs=inputs)
+    _plot(flow)
+    return flow
+
+def _plot(flow: BugDetectionFlow):
+    filename = os.path.join(flow.state.output_dir or "", "bug_detection_flow")
+    flow.plot(filename)
+    print(f"Flow visualization saved to {filename}.html")
 
 if __name__ == "__main__":
     with MCPServerAdapter(BugDetectionFlow.mcp_server_params) as mcp_tools:
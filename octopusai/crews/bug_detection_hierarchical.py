@@ -1,17 +1,32 @@
+import asyncio
 import os, sys
 from datetime import datetime
 import time
 import re, subprocess
 import json
-from typing import Optional, Any, Dict, List
-from crewai import Flow, Agent, Task, Crew, Process, LLM
-from crewai.flow.flow import start, listen, router
-from crewai_tools import FileReadTool, FileWriterTool,SerplyWebSearchTool
+from typing import Optional, Any, Dict, List, Literal
+from crewai import Flow, Agent, Task, Process
+from crewai.flow.flow import and_, start, listen, router
+from crewai.types.usage_metrics import UsageMetrics
+from crewai_tools import SerplyWebSearchTool
 from pydantic import BaseModel, Field
 import octopusai.tools.langchain_github as langchain_gh
 import octopusai.tools.git_tool as git_tool
+from octopusai.tools.diff_model import PullRequestDiff, parse_diff
+from octopusai.tools.github_graphql import PullRequestInfo, fetch_pull_request
 from octopusai.tools.directory_read import DirectoryReadTool
+from octopusai.tools.file_cache import CachedFileEditTool, CachedFileWriterTool, RunFileCache
+from octopusai.tools.file_read import FileReadTool
+from octopusai.tools.symbol_index import SymbolSearchTool, get_symbol_index
+from octopusai.tools.code_search import CodeSearchTool, get_code_search_index, related_code
+from octopusai.llm_cache import CachedLLM, completion_cache
+from octopusai.plan_cache import PlanCachedCrew, pr_shape
 from octopusai.tools.code_interpreter_with_timeout import CodeInterpreterTool
+from octopusai.tools.context_packer import count_tokens, pack_review_context
+from octopusai.tools.test_runner import run_pytest, run_pytest_in_sandbox, to_test_path
+from octopusai.tools.test_impact import TestImpactTool, select_tests
+from octopusai.tools.triage import TriageReport, triage
+from octopusai.crews.bug_detection_pipeline import PipelineContext, run_pipeline
 from crewai_tools import MCPServerAdapter
 
 def _strip_code_fence(s: str) -> str:
@@ -38,17 +53,27 @@ def _repo_has_changes(repo_dir: str) -> bool:
     )
     return res.stdout.strip() != ""
 
-def _commit_and_push(repo_dir: str, branch: str, message: str) -> Optional[str]:
-    commit = git_tool.Commit()
-    push = git_tool.Push()
-    commit._run(repo_dir=repo_dir, commit_message=message)
-    push._run(repo_dir=repo_dir, branch_name=branch)
+def _head_commit(repo_dir: str) -> Optional[str]:
     h = subprocess.run(
         ["git", "-C", repo_dir, "rev-parse", "HEAD"],
         capture_output=True, text=True
     )
     return h.stdout.strip() or None
 
+def _diff_since(repo_dir: str, commit: str) -> PullRequestDiff:
+    res = subprocess.run(
+        ["git", "-C", repo_dir, "diff", commit],
+        capture_output=True, text=True, check=True
+    )
+    return parse_diff(res.stdout)
+
+def _commit_and_push(repo_dir: str, branch: str, message: str) -> Optional[str]:
+    commit = git_tool.Commit()
+    push = git_tool.Push()
+    commit._run(repo_dir=repo_dir, commit_message=message)
+    push._run(repo_dir=repo_dir, branch_name=branch)
+    return _head_commit(repo_dir)
+
 class CrewResultModel(BaseModel):
     bugs_found: bool
     review_results: Optional[Dict[str, Any]] = None
@@ -58,6 +83,7 @@ class CrewResultModel(BaseModel):
     pull_request_summary: Optional[str] = None
     involved_agents: List[str] = Field(default_factory=list)
     workflow_steps_completed: List[str] = Field(default_factory=list)
+    fixes_verified: Optional[bool] = None # pipeline: whether QA verified the fixes, None if not reported
 
 class FlowState(BaseModel):
     """State model"""
@@ -67,39 +93,58 @@ class FlowState(BaseModel):
     requirement_id: str | None = None
     repo_url: str | None = None
     repo_dir: str | None = None
+    pull_request: PullRequestInfo | None = None
     pr_details: dict | None = None
-    pr_diff: str | None = None
+    pr_diff: str | None = None # Rendered diff without lockfiles, vendored, binary and generated files
+    diff: PullRequestDiff | None = None
     pr_local_branch: str | None = None
+    clone_mode: str = "mirror" # mirror | full | sparse
+    sparse_extra_paths: List[str] = Field(default_factory=lambda: ["python_testcases"])
+    context_token_budget: int = 12000
+    llm_cache: bool = False # Also enabled by OCTOPUSAI_LLM_CACHE=1
+    plan_cache: bool = False # Reuse the crew plan of earlier PRs of the same shape, also enabled by OCTOPUSAI_PLAN_CACHE=1
+    review_context: str | None = None
+    prd: str | None = None # Product requirement document of requirement_id, fetched through get_prd_tool
+    output_dir: str | None = None # Directory of the crew output log, the working directory by default
+    pr_head: str | None = None # Commit of the PR head, before any fixes
+    impacted_tests: List[str] = Field(default_factory=list) # Existing tests reaching the code changed by the PR
+    triage_policy: str = "evidence" # off | evidence | skip_clean, see octopusai.tools.triage
+    triage_timeout_s: int = 60
+    triage_host_tests: bool = False # Run the PR's tests (pre-triage and evaluation) on the host when Docker is not available for the sandbox
+    triage: TriageReport | None = None
+    crew_mode: Literal["hierarchical", "pipeline"] = "hierarchical" # hierarchical: manager delegating | pipeline: fixed review -> QA -> fix -> verify -> git steps
+    max_fix_rounds: int = 2 # pipeline: fix attempts until QA verifies the fixes
     pull_request_summary: str | None = None
     bug_present: bool = False
+    fixes_verified: bool | None = None
     fixed_files: List[str] = Field(default_factory=list)
 
-llm_default = LLM(
+llm_default = CachedLLM(
     #model="openai/gpt-3.5-turbo",
     model="openai/gpt-4o",
     temperature=0.0,
     top_p=1.0,
 )
 
-llm_planning = LLM(
+llm_planning = CachedLLM(
     model="openai/gpt-4o",
 )
 
-llm_manager = LLM(
+llm_manager = CachedLLM(
     model="openai/o3-mini",
 )
 
-llm_bug_detection_and_repair = LLM(
+llm_bug_detection_and_repair = CachedLLM(
     model="openai/gpt-4o",
     temperature=0.1,
 )
 
-llm_qa= LLM(
+llm_qa= CachedLLM(
     model="openai/gpt-4o",
     temperature=0.1,
 )
 
-llm_git_summary = LLM(
+llm_git_summary = CachedLLM(
     model="openai/gpt-4o",
 )
 
@@ -119,79 +164,178 @@ class BugDetectionFlow(Flow[FlowState]):
     def initialize(self):
         print("Initializing Bug Detection Flow...")
         print(json.dumps(self.state.model_dump(), indent=2))
+        self._setup_started = time.perf_counter()
+        self._pull_request_task = None
         self.state.repo_url = f"https://github.com/{self.state.repo}"
+        # Known up front, so cloning and diffing do not wait for the PR details
+        self.state.pr_local_branch = f"pr-{self.state.pr_number}-fix-{datetime.now().strftime('%y%m%d%H%M%S')}"
+        completion_cache.start_run(enabled=True if self.state.llm_cache else None)
+        completion_cache.set_volatile(branch=self.state.pr_local_branch)
         return self.state
 
-    
+    async def _fetch_pull_request(self) -> PullRequestInfo:
+        # Shared by get_pr_details and sparse clones, which need the changed paths
+        if self._pull_request_task is None:
+            self._pull_request_task = asyncio.ensure_future(
+                asyncio.to_thread(fetch_pull_request, self.state.repo, self.state.pr_number))
+        return await self._pull_request_task
+
+    # get_pr_details, clone_repository and get_prd run concurrently
     @listen(initialize)
-    def get_pr_details(self):
-        pr = langchain_gh.GetPullRequest()
-        pr_details = pr._run(repo=self.state.repo, pr_number=self.state.pr_number)
-        pr_local_branch = f"pr-{self.state.pr_number}-fix-{datetime.now().strftime('%y%m%d%H%M%S')}"
+    async def get_pr_details(self):
+        self.state.pull_request = await self._fetch_pull_request()
+        pr_details = self.state.pull_request.summary()
         print(f"Pull Request Details: {pr_details}")
         self.state.pr_details = pr_details
-        self.state.pr_local_branch = pr_local_branch
         return pr_details
 
-    @listen(get_pr_details)
-    def clone_repository(self):
-        print(f"Cloning repository: {self.state.repo_url}")
-        git = git_tool.Clone(self.state.repo_url)
-        repo_dir = git._run()
+    @listen(initialize)
+    async def clone_repository(self):
+        print(f"Cloning repository: {self.state.repo_url} (mode: {self.state.clone_mode})")
+        sparse_paths = None
+        if self.state.clone_mode == "sparse":
+            pull_request = await self._fetch_pull_request()
+            sparse_paths = pull_request.file_paths()
+            if pull_request.has_renames():
+                # GraphQL does not report the previous path of renamed files, the base branch needs it
+                sparse_paths = await asyncio.to_thread(langchain_gh.ListPullRequestFilePaths()._run,
+                                                       repo=self.state.repo, pr_number=self.state.pr_number)
+            sparse_paths += self.state.sparse_extra_paths
+            print(f"Sparse checkout paths: {sparse_paths}")
+        git = git_tool.Clone(self.state.repo_url,
+                             use_mirror=self.state.clone_mode == "mirror",
+                             sparse_paths=sparse_paths,
+                             pr_number=self.state.pr_number)
+        repo_dir = await asyncio.to_thread(git._run)
         print("Repository cloned successfully to:", repo_dir)
         self.state.repo_dir = repo_dir
+        completion_cache.set_volatile(repo_dir=repo_dir)
         return repo_dir 
 
+    @listen(initialize)
+    async def get_prd(self):
+        if self.get_prd_tool is None or not self.state.requirement_id:
+            return None
+        try:
+            prd = await asyncio.to_thread(self.get_prd_tool.run, requirement_id=self.state.requirement_id)
+        except Exception as e:
+            print(f"Error fetching the product requirement document: {str(e)}")
+            return None
+        self.state.prd = str(prd)
+        return self.state.prd
+
     @listen(clone_repository)
-    def get_pr_diff(self):
+    async def get_pr_diff(self):
         print(f"Getting diff for PR: {self.state.pr_number}")
         git = git_tool.Diff()
-        diff = git._run(repo_dir=self.state.repo_dir, pr_number=self.state.pr_number, pr_local_branch=self.state.pr_local_branch, incremental=True)
+        diff = await asyncio.to_thread(git._run, repo_dir=self.state.repo_dir, pr_number=self.state.pr_number,
+                                       pr_local_branch=self.state.pr_local_branch, incremental=True)
+        if diff.startswith("Error"):
+            self.state.pr_diff = diff
+        else:
+            self.state.diff = parse_diff(diff)
+            self.state.pr_diff = self.state.diff.render()
         print(f"{'>' * 30 } Diff {'>' * 30 }")
-        print(diff)
+        if self.state.diff:
+            print(self.state.diff.summary())
+        print(self.state.pr_diff)
         print(f"{'<' * 30 } Diff {'<' * 30 }")
-        self.state.pr_diff = diff
-        return diff
+        return self.state.pr_diff
 
     @listen(get_pr_diff)
-    def checkout_pr(self):
+    async def checkout_pr(self):
         print(f"Checking out PR branch: {self.state.pr_local_branch}")
         git = git_tool.Checkout()
-        git._run(repo_dir=self.state.repo_dir, branch_name=self.state.pr_local_branch)
+        await asyncio.to_thread(git._run, repo_dir=self.state.repo_dir, branch_name=self.state.pr_local_branch)
+        self.state.pr_head = await asyncio.to_thread(_head_commit, self.state.repo_dir)
         print(f"Checked out to branch: {self.state.pr_local_branch}")
         return self.state.pr_local_branch
-    
-    @router(checkout_pr)
-    def bug_detection(self):
 
+    @listen(checkout_pr)
+    async def index_repository(self):
+        start = time.perf_counter()
+        index = await asyncio.to_thread(get_symbol_index, self.state.repo_dir)
+        print(f"Symbol index of {index.commit[:12]}: {len(index.files)} files in {time.perf_counter() - start:.2f}s")
+        await asyncio.to_thread(get_code_search_index, self.state.repo_dir)
+        return index.commit
+
+    @listen(index_repository)
+    async def pre_triage(self):
+        if self.state.diff is None:
+            return None
+        try:
+            self.state.impacted_tests = list(await asyncio.to_thread(select_tests, self.state.repo_dir, [self.state.diff]))
+            print(f"Tests reaching the changes: {self.state.impacted_tests}")
+        except Exception as e:
+            print(f"Error selecting the impacted tests: {str(e)}")
+        if self.state.triage_policy == "off":
+            return None
+        sandbox = self._test_sandbox()
+        try:
+            report = await asyncio.to_thread(triage, self.state.repo_dir, self.state.diff, self.state.impacted_tests,
+                                             timeout_s=self.state.triage_timeout_s, sandbox=sandbox,
+                                             allow_host=self.state.triage_host_tests)
+        finally:
+            await asyncio.to_thread(sandbox.close_pools)
+        print(f"{'>' * 30 } Pre-triage ({report.duration_s}s) {'>' * 30 }")
+        print(report.render())
+        print(f"{'<' * 30 } Pre-triage {'<' * 30 }")
+        self.state.triage = report
+        return report.clean
+
+    def _test_sandbox(self) -> CodeInterpreterTool:
+        # The PR's tests run in a sandbox container with the repository mounted read-only
+        return CodeInterpreterTool(
+            unsafe_mode=False,
+            repo_dir=self.state.repo_dir,
+            requirements_file=os.path.join(self.state.repo_dir, "requirements.txt"),
+            container_pool_size=1,
+        )
+
+    @listen(and_(pre_triage, get_pr_details, get_prd))
+    async def build_review_context(self):
+        related = []
+        if self.state.diff is not None:
+            try:
+                related = await asyncio.to_thread(related_code, self.state.repo_dir, self.state.diff)
+            except Exception as e:
+                print(f"Error searching related code: {str(e)}")
+        context = await asyncio.to_thread(
+            pack_review_context,
+            self.state.repo_dir,
+            self.state.pr_details or {},
+            diff=self.state.diff,
+            budget=self.state.context_token_budget,
+            raw_diff=self.state.pr_diff,
+            related=related,
+            evidence=self.state.triage.render() if self.state.triage else None,
+        )
+        print(f"Review context: ~{count_tokens(context)} tokens (budget {self.state.context_token_budget})")
+        print(f"Setup took {time.perf_counter() - self._setup_started:.2f}s")
+        self.state.review_context = context
+        return context
+
+    @router(build_review_context)
+    def triage_gate(self):
+        if self.state.triage_policy == "skip_clean" and self.state.triage is not None and self.state.triage.clean:
+            print("Pre-triage: the impacted tests pass and the static checks are clean, skipping the crew.")
+            return "No bugs found"
+        return "Needs review"
+
+    def _build_agents(self, file_cache: RunFileCache, code_interpreter: CodeInterpreterTool) -> Dict[str, Agent]:
+        """
+        The specialist agents, shared by the hierarchical crew and the pipeline.
+        """
         reviewer_tools = [
-            DirectoryReadTool(directory=self.state.repo_dir, ignored=[".git", "__pycache__", "json_testcases", "python_testcases"]),
-            FileReadTool(), 
+            DirectoryReadTool(directory=self.state.repo_dir, ignored=[".git", "__pycache__", "json_testcases", "python_testcases"], file_cache=file_cache),
+            FileReadTool(root_dir=self.state.repo_dir, file_cache=file_cache, reader="Senior Code Reviewer"),
+            SymbolSearchTool(repo_dir=self.state.repo_dir),
+            CodeSearchTool(repo_dir=self.state.repo_dir),
             SerplyWebSearchTool()
         ]
         #if self.get_prd_tool:
             #reviewer_tools.append(self.get_prd_tool)
     
-        # Manager Agent
-        manager = Agent(
-            role="Engineering Team Lead",
-            goal="""
-            Coordinate the bug detection and fixing process by managing the team of specialists.
-            Ensure proper workflow execution and quality standards.
-            """,
-            backstory="""
-            You are an experienced engineering team lead with 15+ years of experience managing 
-            development teams and ensuring code quality. You understand the full software 
-            development lifecycle and can effectively coordinate between code reviewers, 
-            developers, QA engineers, and Git specialists.
-            """,
-            verbose=True,
-            llm=llm_manager,
-            allow_delegation=True,
-            max_retry_limit=4,
-            cache=False,
-        )
-
         # Agents
         code_reviewer = Agent(
             role="Senior Code Reviewer",
@@ -219,9 +363,11 @@ class BugDetectionFlow(Flow[FlowState]):
             You are a senior Python developer with more than 10 years of experience in Python development.
             """,
             tools=[
-                DirectoryReadTool(directory=self.state.repo_dir, ignored=[".git", "__pycache__", "json_testcases", "python_testcases"]),
-                FileReadTool(),
-                FileWriterTool(),
+                DirectoryReadTool(directory=self.state.repo_dir, ignored=[".git", "__pycache__", "json_testcases", "python_testcases"], file_cache=file_cache),
+                FileReadTool(root_dir=self.state.repo_dir, file_cache=file_cache, reader="Senior Python Developer"),
+                SymbolSearchTool(repo_dir=self.state.repo_dir),
+                CachedFileEditTool(file_cache=file_cache, root_dir=self.state.repo_dir),
+                CachedFileWriterTool(file_cache=file_cache),
             ],
             verbose=True,
             llm=llm_bug_detection_and_repair,
@@ -243,9 +389,10 @@ class BugDetectionFlow(Flow[FlowState]):
             Your specialty is automated testing, and you are proficient in Python.
             """,
             tools=[
-                DirectoryReadTool(directory=self.state.repo_dir, ignored=[".git", "__pycache__", "json_testcases", "python_testcases"]),
-                FileReadTool(),
-                CodeInterpreterTool(unsafe_mode=False)
+                DirectoryReadTool(directory=self.state.repo_dir, ignored=[".git", "__pycache__", "json_testcases", "python_testcases"], file_cache=file_cache),
+                FileReadTool(root_dir=self.state.repo_dir, file_cache=file_cache, reader="Senior QA Engineer"),
+                TestImpactTool(repo_dir=self.state.repo_dir),
+                code_interpreter
             ],
             verbose=True,
             llm=llm_qa,
@@ -269,15 +416,24 @@ class BugDetectionFlow(Flow[FlowState]):
             llm=llm_git_summary,
         )
 
-        bug_detection_and_fix_task = Task(
-            description=f"""
+        return {
+            "reviewer": code_reviewer,
+            "developer": python_developer,
+            "qa": qa_engineer,
+            "git": git_specialist,
+        }
 
-            Lead the complete bug detection and fixing process for pull request #{self.state.pr_number},
-            the PR details is {json.dumps(self.state.pr_details, indent=2)}\n
+    def _prd_section(self) -> str:
+        if not self.state.prd:
+            return ""
+        return f"""
+            The product requirement document {self.state.requirement_id}, check that the changes meet it:
 
-            The PR diff is:
-            {self.state.pr_diff}
+            {self.state.prd}
+            """
 
+    def _file_access_instructions(self) -> str:
+        return f"""
             **IMPORTANT PATH INFORMATION:**
             - Repository root directory: {self.state.repo_dir}
             - Current working branch: {self.state.pr_local_branch}
@@ -285,10 +441,113 @@ class BugDetectionFlow(Flow[FlowState]):
             
             **FILE ACCESS INSTRUCTIONS:**
             - When using DirectoryReadTool, use relative paths from repository root (e.g., "src/", "tests/", or "." for root)
-            - When using FileReadTool, you MUST use ABSOLUTE paths: {self.state.repo_dir}/relative_path and read the whole file
-            - When using FileWriterTool, you MUST use ABSOLUTE paths: {self.state.repo_dir}/relative_path
+            - The review context already contains the changed code; only use FileReadTool for code it does not contain
+            - Use the symbol search tool to find where a function or class is defined, called or imported instead of searching files
+            - Use the code search tool to find code related to the change by keywords, e.g. other places handling the same data
+            - When using FileReadTool, prefer reading a function or class with 'symbol', or a line range with 'start_line'/'end_line', over whole files
+            - When using FileReadTool, you MUST use ABSOLUTE paths: {self.state.repo_dir}/relative_path
+            - Change existing files with the file edit tool, replacing the exact snippet you read (e.g. a function) with the fixed one
+            - FileWriterTool overwrites the WHOLE file: only use it for new files, or after reading the whole file, never after reading a symbol or line range
+            - When using the file edit tool or FileWriterTool, you MUST use ABSOLUTE paths: {self.state.repo_dir}/relative_path
             - If you see a file path like "a/file.py" in the diff, the actual file is at {self.state.repo_dir}/a/file.py
+            """
+
+    def _qa_instructions(self, code_interpreter: CodeInterpreterTool) -> str:
+        impacted_tests = ", ".join(self.state.impacted_tests[:30]) or "none found"
+        return f"""
+            - The quality of tests is crucial. ALWAYS think about edge cases and potential failure points, like empty inputs, boundary values, etc.
+            - Everytime you run a code snippet, you MUST analyze the output and report any errors or issues found.
+            - Never save test cases to the repository, ALWAYS run them in the safe code interpreter environment.
+            - In the code interpreter the repository is mounted read-only and is on the PYTHONPATH: import the code under test by its module path relative to the repository root (e.g. "a/file.py" -> "from a.file import ..."), do not copy it into the snippet. Imports always see the current files, including applied fixes.
+            - The code interpreter keeps its state between runs: import the code under test and define test helpers once, later snippets can use them without repeating them.
+            - Existing tests reaching the changed code: {impacted_tests}. Run these first, e.g. pytest.main(["-p", "no:cacheprovider", "{code_interpreter.repo_mount_path}/<test id>"]) in the code interpreter, use the test finding tool for the tests of other code.
+            - Never make up test results, ALWAYS run the tests and give feedback along with the code you have changed based on the actual results.
+            - When all the tests pass, you need to distinguish the code is the original code or the fixed code.
+            """
+
+    def _pipeline_context(self, code_interpreter: CodeInterpreterTool) -> PipelineContext:
+        return PipelineContext(
+            pr_number=self.state.pr_number,
+            repo_dir=self.state.repo_dir,
+            review_context=self.state.review_context or "",
+            prd_section=self._prd_section(),
+            file_access=self._file_access_instructions(),
+            qa_instructions=self._qa_instructions(code_interpreter),
+            output_dir=self.state.output_dir,
+        )
+
+    @router("Needs review")
+    async def bug_detection(self):
+
+        # Shared by the file tools of all agents for this run
+        file_cache = RunFileCache()
+        code_interpreter = CodeInterpreterTool(
+            unsafe_mode=False,
+            persistent_session=True,
+            repo_dir=self.state.repo_dir,
+            requirements_file=os.path.join(self.state.repo_dir, "requirements.txt"),
+        )
+        agents = self._build_agents(file_cache, code_interpreter)
 
+        start = time.perf_counter()
+        try:
+            if self.state.crew_mode == "pipeline":
+                result = await run_pipeline(agents, self._pipeline_context(code_interpreter),
+                                            max_fix_rounds=self.state.max_fix_rounds)
+                model = CrewResultModel(**result.output)
+                raw, token_usage = result.raw, result.token_usage
+            else:
+                model, raw, token_usage = await self._run_hierarchical_crew(agents, code_interpreter)
+        finally:
+            await asyncio.to_thread(code_interpreter.close)
+            # The sandbox containers mount this run's clone, they are of no use to other runs
+            await asyncio.to_thread(code_interpreter.close_pools)
+        end = time.perf_counter()
+
+        elapsed_ms = (end - start) * 1000
+        print(f"Crew executed time: {elapsed_ms:.3f} ms")
+        return await self._complete(model, raw, token_usage, elapsed_ms, file_cache)
+
+    async def _run_hierarchical_crew(self, agents: Dict[str, Agent], code_interpreter: CodeInterpreterTool):
+        # Manager Agent
+        manager = Agent(
+            role="Engineering Team Lead",
+            goal="""
+            Coordinate the bug detection and fixing process by managing the team of specialists.
+            Ensure proper workflow execution and quality standards.
+            """,
+            backstory="""
+            You are an experienced engineering team lead with 15+ years of experience managing 
+            development teams and ensuring code quality. You understand the full software 
+            development lifecycle and can effectively coordinate between code reviewers, 
+            developers, QA engineers, and Git specialists.
+            """,
+            verbose=True,
+            llm=llm_manager,
+            allow_delegation=True,
+            max_retry_limit=4,
+            cache=False,
+        )
+
+        # The PR specific parts of the task, planned with placeholders when the plan cache is used
+        values = {
+            "pr_number": self.state.pr_number,
+            "review_context": self.state.review_context,
+            "prd_section": self._prd_section(),
+            "file_access": self._file_access_instructions(),
+            "qa_instructions": self._qa_instructions(code_interpreter),
+        }
+        placeholders = {name: f"<{name.replace('_', ' ')} of the pull request>" for name in values}
+        placeholders["pr_number"] = "<number>"
+        task_template = """
+
+            Lead the complete bug detection and fixing process for pull request #{pr_number}.
+            The review context below contains the PR details, the diff, the pre-triage results (static checks and the existing tests reaching the changes),
+            the definitions enclosing the changes, their callers and related code. Failing tests in the pre-triage are strong evidence, start from them:
+
+            {review_context}
+            {prd_section}
+            {file_access}
             **MANDATORY JOB:**
             -  **Code Review**: Delegate to Senior Code Reviewer to analyze the PR diff for bugs, focusing on functional issues only, and leave the files that don't appear in the diff untouched.
             -  **Quality Assurance**: If bugs found, have Senior QA Engineer verify fixes with writing and executing tests (do not save test files), If bugs not found, think about if tests are needed to confim the functionality works as intended.
@@ -296,13 +555,8 @@ class BugDetectionFlow(Flow[FlowState]):
             -  **Git Operations**: If bugs are found and any fixes were applied, delegate to Senior Git Specialist to generate a concise, conventional commit message summarizing the changes, and prepare a pull request description.
 
             **QA AND TESTING INSTRUCTIONS:**
-            - The quality of tests is crucial. ALWAYS think about edge cases and potential failure points, like empty inputs, boundary values, etc.
-            - Everytime you run a code snippet, you MUST analyze the output and report any errors or issues found.
             - You never change the codebase directly, **ALWAYS** ask your manager to delegate the writing code task to the Python Developer.
-            - Never save test cases to the repository, ALWAYS run them in the safe code interpreter environment, therefore you cannot import modules from the repository, you must include all necessary code in the code snippet you run.
-            - Never make up test results, ALWAYS run the tests and give feedback along with the code you have changed based on the actual results.
-            - When all the tests pass, you need to distinguish the code is the original code or the fixed code.
-
+            {qa_instructions}
             **Python Coding Guidelines:**
             - When writing code to the filesystem, **ALWAYS** use the code that has been tested by the QA Engineer.
             - You have the right to disagree with the Code Reviewer or QA Engineer, but you **must** in the end have the qa engineer approve the code changes.
@@ -323,14 +577,17 @@ class BugDetectionFlow(Flow[FlowState]):
             1. Keep going until the user’s query is completely resolved, before ending your turn and yielding back to the user. Only terminate your turn when you are sure that the problem is solved.
             2. If QA verifies that no bugs are found, you can end the task early by reporting "bugs_found": false and skipping the bug fixing step.
             3. Whereas if bugs are found, you must ensure that the bugs are fixed and verified by QA before ending the task.
-            """,
+            """
+
+        bug_detection_and_fix_task = Task(
+            description=task_template.format(**values),
             expected_output="""
             STRICT JSON ONLY (no code fences, no prose). See fields above.
             """,
         )
 
-        crew = Crew(
-            agents=[code_reviewer, python_developer, qa_engineer, git_specialist],
+        crew = PlanCachedCrew(
+            agents=[agents["reviewer"], agents["developer"], agents["qa"], agents["git"]],
             tasks=[bug_detection_and_fix_task],
             process=Process.hierarchical,
             manager_agent=manager,
@@ -340,24 +597,31 @@ class BugDetectionFlow(Flow[FlowState]):
             cache=False,
             planning=True,
             planning_llm=llm_planning,
-            output_log_file="bug_detection_crew_output.json",
+            plan_templates=[task_template.format(**placeholders)],
+            plan_shape=pr_shape(self.state.diff),
+            use_plan_cache=self.state.plan_cache or None,
+            output_log_file=os.path.join(self.state.output_dir or "", "bug_detection_crew_output.json"),
         )
-        start = time.perf_counter() 
-        result = crew.kickoff()
-        end = time.perf_counter()
-
-        elapsed_ms = (end - start) * 1000
-        print(f"Crew executed time: {elapsed_ms:.3f} ms")
-        
-        parsed: Dict[str, Any]
-        parsed = _parse_json_strict(result.raw)
-
-        model = CrewResultModel(**parsed)
+        result = await crew.kickoff_async()
+        if crew.plan_cache_hit is not None:
+            print(f"Crew plan: {'cached' if crew.plan_cache_hit else 'generated and cached'} for {crew.plan_shape}")
+        model = CrewResultModel(**_parse_json_strict(result.raw))
+        return model, result.raw, result.token_usage
+
+    async def _complete(self, model: CrewResultModel, raw: str, token_usage: UsageMetrics,
+                        elapsed_ms: float, file_cache: RunFileCache) -> str:
+        """
+        Commit and push the fixes, and record the result in the state. Fixes QA rejected are left
+        uncommitted in the work tree, without a pull request.
+        """
         print("Crew Result Model:", model.model_dump_json(indent=2))
 
-        if _repo_has_changes(self.state.repo_dir):
+        unverified = model.fixes_verified is False
+        if unverified:
+            print(f"QA did not verify the fixes, not committing them to {self.state.pr_local_branch}")
+        elif await asyncio.to_thread(_repo_has_changes, self.state.repo_dir):
             msg = model.commit_message or "fix: apply bug fixes detected by automated review"
-            commit_hash = _commit_and_push(self.state.repo_dir, self.state.pr_local_branch, msg)
+            commit_hash = await asyncio.to_thread(_commit_and_push, self.state.repo_dir, self.state.pr_local_branch, msg)
             model.commit_hash = commit_hash
             
             if not model.pull_request_summary:
@@ -373,116 +637,92 @@ class BugDetectionFlow(Flow[FlowState]):
 
         self.state.pull_request_summary = model.pull_request_summary
         self.state.bug_present = bool(model.bugs_found)
+        self.state.fixes_verified = model.fixes_verified
         self.state.fixed_files = [x.get("file") for x in (model.fixes_applied or []) if x.get("file")]
         print("Final State:", json.dumps(self.state.model_dump(), indent=2))
-        print("Crew Raw Output:", result.raw)
+        print("Crew Raw Output:", raw)
         print("Crew Result Model:", json.dumps(model.model_dump(), indent=2))
 
         print(f"{'*' * 30 } Crew Token Usage {'*' * 30 }")
-        print(result.token_usage)
+        print(token_usage)
 
         print(f"{'>' * 30 } Important Statistics {'>' * 30 }")
         print(f"Code Fix Branch: {self.state.pr_local_branch}")
         print(f"Crew Elapsed Time (ms): {elapsed_ms:.3f}")
-        print(f"Total Tokens: {result.token_usage.total_tokens}")
-        print(f"Input Tokens: {result.token_usage.prompt_tokens}")
-        print(f"Cached Tokens: {result.token_usage.cached_prompt_tokens}")
-        print(f"Output Tokens: {result.token_usage.completion_tokens}")
-        print(f"Successful Requests: {result.token_usage.successful_requests}")
+        print(f"Total Tokens: {token_usage.total_tokens}")
+        print(f"Input Tokens: {token_usage.prompt_tokens}")
+        print(f"Cached Tokens: {token_usage.cached_prompt_tokens}")
+        print(f"Output Tokens: {token_usage.completion_tokens}")
+        print(f"Successful Requests: {token_usage.successful_requests}")
+        print(f"File Reads: {file_cache.stats()}")
+        if completion_cache.active:
+            print(f"LLM Cache Hits: {completion_cache.hits}")
+            print(f"LLM Cache Misses: {completion_cache.misses}")
         print(f"{'<' * 30 } Important Statistics {'<' * 30 }")
 
+        if unverified:
+            return "Fixes not verified"
         if model.bugs_found:
             return "Bugs found"
         return "No bugs found"
 
     @listen("Bugs found")
-    def create_pull_request(self):
+    async def create_pull_request(self):
         print(f"Creating pull request with summary: {self.state.pull_request_summary}")
         pr = langchain_gh.CreatePullRequest()
-        pr_response = pr._run(repo=self.state.repo, 
-                              pr_query=self.state.pull_request_summary, 
-                              src_branch=self.state.pr_local_branch, 
-                              dest_branch=self.state.active_branch)
+        pr_response = await asyncio.to_thread(pr._run,
+                                              repo=self.state.repo,
+                                              pr_query=self.state.pull_request_summary,
+                                              src_branch=self.state.pr_local_branch,
+                                              dest_branch=self.state.active_branch)
         print(f"Pull Request created result: {pr_response}")
         return pr_response
     
-    @listen("No Bugs found")
+    @listen("No bugs found")
     def end_flow_without_creating_pr(self):
         print("No bugs found, skipping pull request creation.")
         return None
+
+    @listen("Fixes not verified")
+    def end_flow_with_unverified_fixes(self):
+        print(f"The fixes of {', '.join(self.state.fixed_files) or 'no files'} were not verified by QA, skipping pull request creation.")
+        return None
     
     @listen(create_pull_request)
-    def evaluation(self):
+    async def evaluation(self):
         print("Evaluating the results of the bug detection flow...")
         if self.state.bug_present and self.state.fixed_files:
-            run_pytest_result = run_pytest(self.state.repo_dir, self.state.fixed_files, timeout_s=60)
+            tests = []
+            try:
+                # Tests reaching the PR's changes or the fixes
+                fix_diff = await asyncio.to_thread(_diff_since, self.state.repo_dir, self.state.pr_head) if self.state.pr_head else None
+                tests = list(await asyncio.to_thread(select_tests, self.state.repo_dir, [self.state.diff, fix_diff]))
+            except Exception as e:
+                print(f"Error selecting the impacted tests: {str(e)}")
+            print(f"Selected tests: {tests or 'none, falling back to the python_testcases convention'}")
+            sandbox = self._test_sandbox()
+            try:
+                run_pytest_result = await asyncio.to_thread(
+                    run_pytest_in_sandbox, sandbox, tests or [to_test_path(f) for f in self.state.fixed_files], timeout_s=60)
+            except Exception as e:
+                print(f"Error running the tests in the sandbox: {str(e)}")
+                if not self.state.triage_host_tests:
+                    print("Tests not run, running the PR's tests on the host is not allowed.")
+                    return
+                run_pytest_result = await asyncio.to_thread(run_pytest, self.state.repo_dir, self.state.fixed_files,
+                                                            timeout_s=60, tests=tests or None)
+            finally:
+                await asyncio.to_thread(sandbox.close_pools)
             print("Pytest Result:", json.dumps(run_pytest_result, indent=2))
             if run_pytest_result.get("tests_pass"):
                 print("All tests passed.")
             else:
-                print("Some tests failed.")
+                failed = [t["nodeid"] for t in run_pytest_result.get("tests", []) if t["outcome"] in ("failed", "error")]
+                print(f"Some tests failed: {failed}")
         else:
             print("No bugs found or fixed files.")
 
 
-def to_test_path(path: str) -> str:
-    directory, filename = os.path.split(path)
-    base_dir = os.path.dirname(directory)
-    test_dir = os.path.join(base_dir, "python_testcases")
-    return os.path.join(test_dir, f"test_{filename}")
-
-def run_pytest(work_dir: str, files: List[str], timeout_s: int = 60) -> Dict[str, Any]:
-    env = os.environ.copy()
-    env["PYTHONDONTWRITEBYTECODE"] = "1"
-
-    total_failed = 0
-    total_passed = 0
-    raw_outputs = []
-
-    for f in files:
-        test_path = to_test_path(f)
-        cmd = ["pytest", test_path]
-
-        try:
-            proc = subprocess.run(
-                cmd,
-                cwd=work_dir,
-                env=env,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                timeout=timeout_s,
-                text=True,
-            )
-            out = proc.stdout
-            raw_outputs.append(f"=== {test_path} ===\n{out}")
-
-            m_fail = re.search(r"(\d+)\s+failed", out)
-            m_pass = re.search(r"(\d+)\s+passed", out)
-            failed = int(m_fail.group(1)) if m_fail else 0
-            passed = int(m_pass.group(1)) if m_pass else 0
-
-            total_failed += failed
-            total_passed += passed
-
-        except subprocess.TimeoutExpired:
-            raw_outputs.append(f"=== {test_path} ===\nTIMEOUT after {timeout_s}s")
-            return {
-                "tests_total": 0,
-                "tests_failed": 0,
-                "tests_pass": False,
-                "timeout": True,
-                "raw": "\n".join(raw_outputs),
-            }
-
-    total = total_failed + total_passed
-    return {
-        "tests_total": total,
-        "tests_failed": total_failed,
-        "tests_pass": (total_failed == 0 and total > 0),
-        "raw": "\n".join(raw_outputs),
-    }
-
-
 def main(inputs=None, mcp_tools=None):
     flow = BugDetectionFlow()
     #print("mcp_tools:", mcp_tools)
@@ -490,6 +730,17 @@ def main(inputs=None, mcp_tools=None):
         flow.get_prd_tool = mcp_tools["get_prd"]
     # Inputs will be assigned to the flow state by CrewAI
     flow.kickoff(inputs=inputs)
+    return flow
+
+async def main_async(inputs=None, mcp_tools=None):
+    """
+    main() for callers running several flows in one event loop.
+    """
+    flow = BugDetectionFlow()
+    if mcp_tools:
+        flow.get_prd_tool = mcp_tools["get_prd"]
+    await flow.kickoff_async(inputs=inputs)
+    return flow
 
 if __name__ == "__main__":
     with MCPServerAdapter(BugDetectionFlow.mcp_server_params) as mcp_tools:
@@ -0,0 +1,230 @@
+"""Deterministic bug detection pipeline.
+
+The same specialists as the hierarchical crew, but without a manager deciding who does
+what: review -> QA test -> fix -> QA verify (repeated up to max_fix_rounds while QA
+rejects the fixes) -> git summary. Every step is a single task crew with a typed output,
+the flow stops early when the review or QA finds no bugs. The result has the fields of
+the hierarchical crew's JSON output, and the token usage is summed over the steps so both
+modes can be compared.
+"""
+
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Type
+
+from crewai import Agent, Crew, Process, Task
+from crewai.types.usage_metrics import UsageMetrics
+from pydantic import BaseModel, Field
+
+MAX_FIX_ROUNDS = 2
+
+
+class Bug(BaseModel):
+    file: str
+    line: Optional[int] = None
+    description: str
+
+
+class ReviewOutput(BaseModel):
+    bugs_found: bool
+    bugs: List[Bug] = Field(default_factory=list)
+
+
+class QATestOutput(BaseModel):
+    confirmed_bugs: List[Bug] = Field(default_factory=list)  # Bugs reproduced by a failing test
+    report: str  # Tests run and their results
+
+
+class Fix(BaseModel):
+    file: str
+    summary: str
+
+
+class FixOutput(BaseModel):
+    fixes_applied: List[Fix] = Field(default_factory=list)
+
+
+class QAVerifyOutput(BaseModel):
+    verified: bool  # All tests pass with the fixes
+    report: str
+
+
+class GitOutput(BaseModel):
+    commit_message: str
+    pull_request_summary: str
+
+
+class PipelineContext(BaseModel):
+    """
+    The parts of the flow state the steps' prompts are built from.
+    """
+    pr_number: int
+    repo_dir: str
+    review_context: str
+    prd_section: str = ""
+    file_access: str = ""
+    qa_instructions: str = ""
+    output_dir: Optional[str] = None
+
+
+class PipelineResult(BaseModel):
+    output: Dict[str, Any]  # Fields of octopusai.crews.bug_detection_hierarchical.CrewResultModel
+    raw: str  # JSON of the outputs of all steps
+    token_usage: UsageMetrics
+
+
+def _parse_output(raw: str, model: Type[BaseModel]) -> BaseModel:
+    # Fallback for when crewai could not convert the output itself
+    text = re.sub(r"^```[a-zA-Z]*\n?|\n?```$", "", raw.strip()).strip()
+    m = re.search(r"\{.*\}", text, flags=re.DOTALL)
+    return model.model_validate_json(m.group(0) if m else text)
+
+
+def _bug_list(bugs: List[Bug]) -> str:
+    return "\n".join(f"- {b.file}{f':{b.line}' if b.line else ''}: {b.description}" for b in bugs)
+
+
+class _Pipeline:
+    def __init__(self, agents: Dict[str, Agent], context: PipelineContext):
+        self.agents = agents
+        self.context = context
+        self.token_usage = UsageMetrics()
+        self.steps: List[str] = []
+        self.involved_agents: List[str] = []
+        self.outputs: List[Dict[str, Any]] = []
+
+    async def step(self, name: str, agent: str, description: str, output: Type[BaseModel]) -> BaseModel:
+        print(f"Pipeline step: {name}")
+        task = Task(
+            description=description,
+            expected_output=f"JSON matching the {output.__name__} schema, no code fences, no prose.",
+            agent=self.agents[agent],
+            output_pydantic=output,
+        )
+        crew = Crew(
+            agents=[self.agents[agent]],
+            tasks=[task],
+            process=Process.sequential,
+            verbose=True,
+            cache=False,
+            output_log_file=os.path.join(self.context.output_dir or "", "bug_detection_crew_output.json"),
+        )
+        result = await crew.kickoff_async()
+        self.token_usage.add_usage_metrics(result.token_usage)
+        parsed = result.pydantic if isinstance(result.pydantic, output) else _parse_output(result.raw, output)
+        self.steps.append(name)
+        role = self.agents[agent].role
+        if role not in self.involved_agents:
+            self.involved_agents.append(role)
+        self.outputs.append({"step": name, "output": parsed.model_dump()})
+        return parsed
+
+    def result(self, **fields) -> PipelineResult:
+        output = {"involved_agents": self.involved_agents, "workflow_steps_completed": self.steps, **fields}
+        return PipelineResult(output=output, raw=json.dumps(self.outputs, indent=2), token_usage=self.token_usage)
+
+
+async def run_pipeline(agents: Dict[str, Agent], context: PipelineContext,
+                       max_fix_rounds: int = MAX_FIX_ROUNDS) -> PipelineResult:
+    """
+    Run the fixed review -> QA -> fix -> verify -> git steps with `agents` ("reviewer", "qa", "developer", "git").
+    """
+    pipeline = _Pipeline(agents, context)
+
+    review = await pipeline.step("review", "reviewer", f"""
+            Review pull request #{context.pr_number} for bugs, focusing on functional issues only.
+            The review context below contains the PR details, the diff, the pre-triage results (static checks and the existing tests reaching the changes),
+            the definitions enclosing the changes, their callers and related code. Failing tests in the pre-triage are strong evidence, start from them:
+
+            {context.review_context}
+            {context.prd_section}
+            {context.file_access}
+            Do not change any files. Report every bug with its file (relative to the repository root), line and a description
+            of the wrong behavior, or "bugs_found": false if the changes are correct.
+            """, ReviewOutput)
+    review_results = review.model_dump()
+    if not review.bugs_found or not review.bugs:
+        return pipeline.result(bugs_found=False, review_results=review_results)
+
+    qa = await pipeline.step("qa", "qa", f"""
+            The code reviewer reported these bugs in pull request #{context.pr_number}:
+
+            {_bug_list(review.bugs)}
+
+            {context.file_access}
+            For each bug, write and execute tests in the code interpreter which fail because of it. Report the bugs
+            reproduced by a failing test as confirmed, and the tests you ran with their results.
+
+            **QA AND TESTING INSTRUCTIONS:**
+            - You never change the codebase.
+            {context.qa_instructions}
+            """, QATestOutput)
+    review_results["qa_report"] = qa.report
+    if not qa.confirmed_bugs:
+        return pipeline.result(bugs_found=False, review_results=review_results)
+
+    fixes: Dict[str, Fix] = {}
+    feedback = qa.report
+    verified = False
+    for attempt in range(1, max_fix_rounds + 1):
+        fix = await pipeline.step(f"fix_{attempt}", "developer", f"""
+            Fix these bugs confirmed by QA with minimal changes, using correct absolute file paths:
+
+            {_bug_list(qa.confirmed_bugs)}
+
+            QA report{' on the previous fixes' if attempt > 1 else ''}:
+            {feedback}
+
+            {context.file_access}
+            Only change the code needed to fix the bugs, never save test files. Report each file you changed.
+            """, FixOutput)
+        for f in fix.fixes_applied:
+            fixes[f.file] = f
+        verify = await pipeline.step(f"verify_{attempt}", "qa", f"""
+            The Python developer fixed these bugs:
+
+            {_bug_list(qa.confirmed_bugs)}
+
+            Changed files:
+            {chr(10).join(f"- {f.file}: {f.summary}" for f in fix.fixes_applied) or "none reported"}
+
+            Your tests from before:
+            {qa.report}
+
+            Run the tests again against the fixed code, and the existing tests reaching the changes. Report "verified": true
+            only if all of them pass, otherwise report which tests fail and why.
+
+            **QA AND TESTING INSTRUCTIONS:**
+            - You never change the codebase.
+            {context.qa_instructions}
+            """, QAVerifyOutput)
+        review_results["verification_report"] = verify.report
+        if verify.verified:
+            verified = True
+            break
+        feedback = verify.report
+
+    fixes_applied = [f.model_dump() for f in fixes.values()]
+    if not verified:
+        # No commit message or PR for fixes QA rejected (also edits the developer did not report),
+        # the flow leaves them uncommitted
+        print(f"Pipeline: the fixes were not verified after {max_fix_rounds} rounds")
+        return pipeline.result(bugs_found=True, review_results=review_results, fixes_applied=fixes_applied,
+                               fixes_verified=False)
+    if not fixes_applied:
+        return pipeline.result(bugs_found=True, review_results=review_results, fixes_verified=True)
+
+    git = await pipeline.step("git", "git", f"""
+            Generate a concise, conventional commit message and a pull request description for the fixes of pull request #{context.pr_number}.
+
+            Bugs:
+            {_bug_list(qa.confirmed_bugs)}
+
+            Fixes:
+            {chr(10).join(f"- {f['file']}: {f['summary']}" for f in fixes_applied)}
+
+            The pull request summary starts with the title "fix: <title>", followed by an empty line and the body.
+            """, GitOutput)
+    return pipeline.result(bugs_found=True, review_results=review_results, fixes_applied=fixes_applied, fixes_verified=True,
+                           commit_message=git.commit_message, pull_request_summary=git.pull_request_summary)
@@ -0,0 +1,190 @@
+"""Opt-in on-disk cache of LLM completions.
+
+CachedLLM answers a call from the cache when the model, its parameters and the messages
+are the same as in an earlier run, so re-running a PR only pays for the completions which
+changed. Run specific strings (the temporary repository directory, the timestamped fix
+branch) are replaced by placeholders before keying and put back into cached responses.
+They are held per run in a context variable, so flows running concurrently in one event
+loop do not see each other's.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Union
+
+from crewai import LLM
+from crewai.utilities.events import crewai_event_bus
+from crewai.utilities.events.llm_events import LLMCallStartedEvent, LLMCallType
+
+from octopusai.paths import cache_path
+
+LLM_CACHE_ENABLED = os.environ.get("OCTOPUSAI_LLM_CACHE", "0") == "1"
+LLM_CACHE_MAX_MB = int(os.environ.get("OCTOPUSAI_LLM_CACHE_MAX_MB", "512"))
+
+# Parameters which change the completion, part of the key
+KEY_PARAMS = [
+    "model", "temperature", "top_p", "n", "stop", "max_completion_tokens", "max_tokens", "presence_penalty",
+    "frequency_penalty", "logit_bias", "seed", "logprobs", "top_logprobs", "reasoning_effort", "base_url", "api_base",
+]
+
+
+class _Run:
+    def __init__(self, enabled: Optional[bool] = None):
+        self.enabled = enabled  # None: the cache's process wide setting
+        self.hits = 0
+        self.misses = 0
+        self.volatile: Dict[str, str] = {}
+
+
+class CompletionCache:
+    """
+    SQLite store of completions, evicting the least recently used entries above max_bytes.
+    """
+
+    def __init__(self, path: Optional[str], max_bytes: int, enabled: bool = False):
+        self.path = path  # Defaults to <cache dir>/llm/completions.sqlite
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._default_run = _Run()
+        self._run: ContextVar[Optional[_Run]] = ContextVar(f"completion_cache_run_{id(self)}", default=None)
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.path is None:
+            self.path = os.path.join(cache_path("llm"), "completions.sqlite")
+        db = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "key TEXT PRIMARY KEY, response TEXT, size INTEGER, used REAL)"
+            )
+            self._initialized = True
+        return db
+
+    def start_run(self, enabled: Optional[bool] = None) -> None:
+        """
+        Start the counters and volatile strings of a flow run. They belong to the current context, i.e. the
+        asyncio task of the flow, the tasks it spawns and the threads started with asyncio.to_thread.
+        `enabled` overrides the process wide setting for the run.
+        """
+        self._run.set(_Run(enabled))
+
+    def _current(self) -> _Run:
+        return self._run.get() or self._default_run
+
+    @property
+    def active(self) -> bool:
+        enabled = self._current().enabled
+        return self.enabled if enabled is None else enabled
+
+    @property
+    def hits(self) -> int:
+        return self._current().hits
+
+    @property
+    def misses(self) -> int:
+        return self._current().misses
+
+    def set_volatile(self, **values: Optional[str]) -> None:
+        """
+        Register run specific strings, e.g. set_volatile(repo_dir=..., branch=...).
+        """
+        run = self._current()
+        with self._lock:
+            run.volatile.update({f"<<{name}>>": value for name, value in values.items() if value})
+
+    def normalize(self, text: str) -> str:
+        # Longest first, a branch name may be part of the repository path
+        for placeholder, value in sorted(self._current().volatile.items(), key=lambda item: -len(item[1])):
+            text = text.replace(value, placeholder)
+        return text
+
+    def restore(self, text: str) -> str:
+        for placeholder, value in self._current().volatile.items():
+            text = text.replace(placeholder, value)
+        return text
+
+    def get(self, key: str) -> Optional[str]:
+        with self._connect() as db:
+            row = db.execute("SELECT response FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                db.execute("UPDATE completions SET used = ? WHERE key = ?", (time.time(), key))
+        run = self._current()
+        with self._lock:
+            if row is None:
+                run.misses += 1
+            else:
+                run.hits += 1
+        return row[0] if row is not None else None
+
+    def put(self, key: str, response: str) -> None:
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO completions (key, response, size, used) VALUES (?, ?, ?, ?)",
+                (key, response, len(response.encode()) + len(key), time.time()),
+            )
+            db.execute(
+                "DELETE FROM completions WHERE key IN (SELECT key FROM "
+                "(SELECT key, SUM(size) OVER (ORDER BY used DESC) AS total FROM completions) WHERE total > ?)",
+                (self.max_bytes,),
+            )
+
+
+completion_cache = CompletionCache(
+    None,
+    max_bytes=LLM_CACHE_MAX_MB * 1024 * 1024,
+    enabled=LLM_CACHE_ENABLED,
+)
+
+
+class CachedLLM(LLM):
+    """
+    LLM whose plain completions go through completion_cache when it is enabled. Calls with native tools or
+    available functions, and streaming calls, are never cached.
+    """
+
+    def _cache_key(self, messages: List[Dict[str, Any]]) -> str:
+        payload = {name: getattr(self, name, None) for name in KEY_PARAMS}
+        payload["response_format"] = repr(self.response_format) if self.response_format else None
+        payload["additional_params"] = self.additional_params
+        payload["messages"] = messages
+        text = completion_cache.normalize(json.dumps(payload, sort_keys=True, default=str))
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def call(
+        self,
+        messages: Union[str, List[Dict[str, str]]],
+        tools: Optional[List[dict]] = None,
+        callbacks: Optional[List[Any]] = None,
+        available_functions: Optional[Dict[str, Any]] = None,
+        from_task: Optional[Any] = None,
+        from_agent: Optional[Any] = None,
+    ) -> Union[str, Any]:
+        if not completion_cache.active or tools or available_functions or self.stream:
+            return super().call(messages, tools, callbacks, available_functions, from_task, from_agent)
+
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        key = self._cache_key(messages)
+        cached = completion_cache.get(key)
+        if cached is not None:
+            response = completion_cache.restore(cached)
+            crewai_event_bus.emit(
+                self,
+                event=LLMCallStartedEvent(messages=messages, tools=tools, callbacks=callbacks,
+                                          available_functions=available_functions, from_task=from_task, from_agent=from_agent),
+            )
+            self._handle_emit_call_events(response, LLMCallType.LLM_CALL, from_task, from_agent, messages)
+            return response
+
+        response = super().call(messages, tools, callbacks, available_functions, from_task, from_agent)
+        if isinstance(response, str) and response.strip():
+            completion_cache.put(key, completion_cache.normalize(response))
+        return response
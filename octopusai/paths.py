@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+# Long-lived caches (repository mirrors, indexes, ...) shared by all runs.
+CACHE_DIR = os.environ.get(
+    "OCTOPUSAI_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "octopusai"),
+)
+
+# Per-run scratch space, e.g. the working copies handed to the agents.
+WORK_DIR = os.environ.get(
+    "OCTOPUSAI_WORK_DIR",
+    os.path.join(tempfile.gettempdir(), "octopusai"),
+)
+
+
+def cache_path(*parts: str) -> str:
+    """
+    Return a directory below CACHE_DIR, creating it if needed.
+    """
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def work_path(*parts: str) -> str:
+    """
+    Return a directory below WORK_DIR, creating it if needed.
+    """
+    path = os.path.join(WORK_DIR, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
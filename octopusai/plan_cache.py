@@ -0,0 +1,156 @@
+"""Opt-in on-disk cache of crew plans.
+
+With planning=True a crew asks the planning LLM for a step-by-step plan on every kickoff,
+although the task template is the same for every PR. PlanCachedCrew plans the task
+templates (the descriptions with the PR specific parts replaced by placeholders) once and
+reuses the plan for the PRs of the same shape: language, number of changed files and
+diff size. Plans expire after a TTL, and the least recently used ones are evicted above
+max_entries.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from crewai import Crew
+from crewai.utilities.planning_handler import CrewPlanner
+from pydantic import Field, PrivateAttr
+
+from octopusai.paths import cache_path
+from octopusai.tools.diff_model import PullRequestDiff
+
+PLAN_CACHE_ENABLED = os.environ.get("OCTOPUSAI_PLAN_CACHE", "0") == "1"
+PLAN_CACHE_TTL_H = float(os.environ.get("OCTOPUSAI_PLAN_CACHE_TTL_H", "168"))
+PLAN_CACHE_MAX_ENTRIES = int(os.environ.get("OCTOPUSAI_PLAN_CACHE_MAX_ENTRIES", "256"))
+
+LANGUAGES = {
+    ".py": "python", ".js": "javascript", ".jsx": "javascript", ".ts": "typescript", ".tsx": "typescript",
+    ".java": "java", ".go": "go", ".rs": "rust", ".rb": "ruby", ".c": "c", ".h": "c", ".cpp": "cpp", ".cs": "csharp",
+}
+
+
+def _bucket(value: int, bounds: List[int]) -> str:
+    for bound in bounds:
+        if value <= bound:
+            return f"<={bound}"
+    return f">{bounds[-1]}"
+
+
+def pr_shape(diff: Optional[PullRequestDiff]) -> Dict[str, str]:
+    """
+    Coarse shape of a PR for the plan cache key: main language, changed files and changed lines buckets.
+    """
+    files = diff.select().files if diff is not None else []
+    languages = Counter(LANGUAGES.get(os.path.splitext(f.path)[1].lower(), "other") for f in files)
+    return {
+        "language": languages.most_common(1)[0][0] if languages else "none",
+        "files": _bucket(len(files), [1, 3, 10]),
+        "lines": _bucket(sum(f.added + f.removed for f in files), [50, 200, 1000]),
+    }
+
+
+class PlanCache:
+    """
+    SQLite store of the plans per task, keyed by the task templates, the agents and the PR shape.
+    """
+
+    def __init__(self, path: Optional[str], ttl_s: float, max_entries: int, enabled: bool = False):
+        self.path = path  # Defaults to <cache dir>/llm/plans.sqlite
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.path is None:
+            self.path = os.path.join(cache_path("llm"), "plans.sqlite")
+        db = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS plans (key TEXT PRIMARY KEY, plans TEXT, created REAL, used REAL)")
+            self._initialized = True
+        return db
+
+    @staticmethod
+    def key(**parts: Any) -> str:
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        now = time.time()
+        with self._lock, self._connect() as db:
+            db.execute("DELETE FROM plans WHERE created < ?", (now - self.ttl_s,))
+            row = db.execute("SELECT plans FROM plans WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                db.execute("UPDATE plans SET used = ? WHERE key = ?", (now, key))
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, key: str, plans: List[str]) -> None:
+        now = time.time()
+        with self._lock, self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO plans (key, plans, created, used) VALUES (?, ?, ?, ?)",
+                       (key, json.dumps(plans), now, now))
+            db.execute("DELETE FROM plans WHERE key NOT IN (SELECT key FROM plans ORDER BY used DESC LIMIT ?)",
+                       (self.max_entries,))
+
+
+plan_cache = PlanCache(
+    None,
+    ttl_s=PLAN_CACHE_TTL_H * 3600,
+    max_entries=PLAN_CACHE_MAX_ENTRIES,
+    enabled=PLAN_CACHE_ENABLED,
+)
+
+
+class PlanCachedCrew(Crew):
+    """
+    Crew whose planning goes through plan_cache when `use_plan_cache` is enabled (or plan_cache.enabled if None).
+    `plan_templates` are the task descriptions without the run specific parts, one per task, and `plan_shape`
+    the PR shape (see pr_shape); plans are made for the templates, so that they fit any PR of the same shape.
+    """
+
+    plan_templates: Optional[List[str]] = None
+    plan_shape: Dict[str, str] = Field(default_factory=dict)
+    use_plan_cache: Optional[bool] = None
+    _plan_cache_hit: Optional[bool] = PrivateAttr(default=None)
+
+    @property
+    def plan_cache_hit(self) -> Optional[bool]:
+        """
+        Whether the plan of the last kickoff came from the cache, None if the cache was not used.
+        """
+        return self._plan_cache_hit
+
+    def _handle_crew_planning(self):
+        enabled = plan_cache.enabled if self.use_plan_cache is None else self.use_plan_cache
+        if not enabled or not self.plan_templates or len(self.plan_templates) != len(self.tasks):
+            return super()._handle_crew_planning()
+
+        agents = [self.manager_agent, *self.agents] if self.manager_agent else self.agents
+        key = plan_cache.key(
+            templates=self.plan_templates,
+            expected_outputs=[task.expected_output for task in self.tasks],
+            agents=[(agent.role, [tool.name for tool in agent.tools or []]) for agent in agents],
+            process=str(self.process),
+            planning_llm=getattr(self.planning_llm, "model", self.planning_llm),
+            shape=self.plan_shape,
+        )
+        plans = plan_cache.get(key)
+        self._plan_cache_hit = plans is not None
+        if plans is None:
+            self._logger.log("info", "Planning the crew execution")
+            templates = [task.model_copy(update={"description": template})
+                         for task, template in zip(self.tasks, self.plan_templates)]
+            result = CrewPlanner(tasks=templates, planning_agent_llm=self.planning_llm)._handle_crew_planning()
+            plans = [step_plan.plan for step_plan in result.list_of_plans_per_task]
+            plan_cache.put(key, plans)
+        else:
+            self._logger.log("info", "Using the cached plan of the crew execution")
+
+        for task, plan in zip(self.tasks, plans):
+            task.description += plan
@@ -5,21 +5,32 @@ safe isolation or directly in a restricted sandbox. It includes mechanisms for b
 potentially unsafe operations and importing restricted modules.
 """
 
+import atexit
+import hashlib
 import importlib.util
+import io
+import json
 import os
+import queue
 import subprocess
-from types import ModuleType
-from typing import Any, Dict, List, Optional, Type
+import tarfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type
 
 from crewai.tools import BaseTool
 from docker import DockerClient
 from docker import from_env as docker_from_env
-from docker.errors import ImageNotFound, NotFound
+from docker.errors import ImageNotFound
 from docker.models.containers import Container
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
 from crewai_tools.printer import Printer
 
+from octopusai.tools.sandbox import RestrictedWorkerPool, SandboxPython
+
 
 class CodeInterpreterSchema(BaseModel):
     """Schema for defining inputs to the CodeInterpreterTool.
@@ -39,92 +50,376 @@ class CodeInterpreterSchema(BaseModel):
     )
 
 
-class SandboxPython:
-    """A restricted Python execution environment for running code safely.
+# Put in the idle queue of a closed pool to wake the waiting leases
+_POOL_CLOSED: Any = object()
+
+
+class ContainerPool:
+    """A pool of pre-started sandbox containers, leased for one execution at a time.
 
-    This class provides methods to safely execute Python code by restricting access to
-    potentially dangerous modules and built-in functions. It creates a sandboxed
-    environment where harmful operations are blocked.
+    Containers get unique names, so several flows (or processes) can run sandboxes side by
+    side. A leased container is health checked before it is handed out and reset (leftover
+    processes killed, scratch files removed) when it is returned. Unhealthy containers are
+    removed and replaced on demand. The pool records when it was last used, so idle pools
+    can be closed (see _evict_container_pools).
     """
 
-    BLOCKED_MODULES = {
-        "os",
-        "sys",
-        "subprocess",
-        "shutil",
-        "importlib",
-        "inspect",
-        "tempfile",
-        "sysconfig",
-        "builtins",
-    }
-
-    UNSAFE_BUILTINS = {
-        "exec",
-        "eval",
-        "open",
-        "compile",
-        "input",
-        "globals",
-        "locals",
-        "vars",
-        "help",
-        "dir",
-    }
+    LABEL = "octopusai.sandbox"
+
+    def __init__(
+        self,
+        client: DockerClient,
+        image: str,
+        size: int = 2,
+        run_kwargs: Optional[Dict[str, Any]] = None,
+        scratch_dirs: Optional[List[str]] = None,
+    ):
+        self.client = client
+        self.image = image
+        self.size = size
+        self.run_kwargs = run_kwargs or {}
+        self.scratch_dirs = scratch_dirs or ["/tmp"]
+        self._idle: "queue.Queue[Container]" = queue.Queue()
+        self._containers: Dict[str, Container] = {}
+        self._starting = 0
+        self._leased = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self.last_used = time.monotonic()
+
+    @property
+    def in_use(self) -> bool:
+        """Whether containers of the pool are leased or waited for."""
+        return self._leased > 0
+
+    def touch(self) -> None:
+        self.last_used = time.monotonic()
+
+    def _start_container(self) -> Container:
+        """Starts a new container for the pool.
+
+        Returns:
+            The started container.
+        """
+        return self.client.containers.run(
+            self.image,
+            detach=True,
+            tty=True,
+            working_dir="/workspace",
+            name=f"code-interpreter-{uuid.uuid4().hex[:12]}",
+            labels={self.LABEL: "code-interpreter"},
+            **self.run_kwargs,
+        )
+
+    def _add(self) -> Optional[Container]:
+        """Starts a container if the pool is not full yet.
+
+        Returns:
+            The new container, or None if the pool is already at its size.
+        """
+        with self._lock:
+            if self._closed or len(self._containers) + self._starting >= self.size:
+                return None
+            self._starting += 1
+        try:
+            container = self._start_container()
+        finally:
+            with self._lock:
+                self._starting -= 1
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._containers[container.id] = container
+        if closed:
+            # Closed while the container was starting
+            container.remove(force=True)
+            return None
+        return container
+
+    def warm_up(self) -> None:
+        """Starts containers until the pool is full and marks them idle."""
+        while True:
+            container = self._add()
+            if container is None:
+                return
+            self._idle.put(container)
+
+    def _discard(self, container: Container) -> None:
+        with self._lock:
+            self._containers.pop(container.id, None)
+        try:
+            container.remove(force=True)
+        except Exception:
+            pass
 
     @staticmethod
-    def restricted_import(
-        name: str,
-        custom_globals: Optional[Dict[str, Any]] = None,
-        custom_locals: Optional[Dict[str, Any]] = None,
-        fromlist: Optional[List[str]] = None,
-        level: int = 0,
-    ) -> ModuleType:
-        """A restricted import function that blocks importing of unsafe modules.
+    def _is_healthy(container: Container) -> bool:
+        try:
+            container.reload()
+            return container.status == "running" and container.exec_run(["true"]).exit_code == 0
+        except Exception:
+            return False
+
+    def _reset(self, container: Container) -> bool:
+        """Kills every process but the container's init process and wipes the scratch directories.
+
+        Returns:
+            True if the container could be reset.
+        """
+        wipe = " ".join(f"{d}/* {d}/.[!.]*" for d in self.scratch_dirs)
+        try:
+            result = container.exec_run(
+                ["sh", "-c", f"kill -9 -1 2>/dev/null; rm -rf {wipe} 2>/dev/null; true"]
+            )
+            return result.exit_code == 0
+        except Exception:
+            return False
+
+    def lease(self, timeout: Optional[float] = None) -> Container:
+        """Takes a healthy container out of the pool, starting one if needed.
 
         Args:
-            name: The name of the module to import.
-            custom_globals: Global namespace to use.
-            custom_locals: Local namespace to use.
-            fromlist: List of items to import from the module.
-            level: The level value passed to __import__.
+            timeout: Maximum time in seconds to wait for a container to be returned.
 
         Returns:
-            The imported module if allowed.
+            A running container reserved for the caller.
 
         Raises:
-            ImportError: If the module is in the blocked modules list.
+            TimeoutError: If no container became available in time.
+            RuntimeError: If the pool is (or gets) closed.
         """
-        if name in SandboxPython.BLOCKED_MODULES:
-            raise ImportError(f"Importing '{name}' is not allowed.")
-        return __import__(name, custom_globals, custom_locals, fromlist or (), level)
-
-    @staticmethod
-    def safe_builtins() -> Dict[str, Any]:
-        """Creates a dictionary of built-in functions with unsafe ones removed.
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The sandbox container pool is closed")
+            # Counted while waiting too, so the pool is not evicted under a waiting lease
+            self._leased += 1
+        try:
+            while True:
+                if self._closed:
+                    raise RuntimeError("The sandbox container pool is closed")
+                try:
+                    container = self._idle.get_nowait()
+                except queue.Empty:
+                    container = self._add()
+                    if container is None:
+                        try:
+                            container = self._idle.get(timeout=timeout)
+                        except queue.Empty:
+                            raise TimeoutError("No sandbox container became available")
+                if container is _POOL_CLOSED:
+                    # Pass the wake-up on to the other waiters
+                    self._idle.put(_POOL_CLOSED)
+                    raise RuntimeError("The sandbox container pool is closed")
+                if self._is_healthy(container):
+                    self.touch()
+                    return container
+                self._discard(container)
+        except BaseException:
+            with self._lock:
+                self._leased -= 1
+            raise
+
+    def release(self, container: Container) -> None:
+        """Resets a leased container and returns it to the pool.
 
-        Returns:
-            A dictionary of safe built-in functions and objects.
+        Args:
+            container: A container obtained from lease().
         """
-        import builtins
+        with self._lock:
+            self._leased -= 1
+        self.touch()
+        if self._closed or not self._reset(container):
+            self._discard(container)
+            return
+        self._idle.put(container)
+
+    @contextmanager
+    def leased(self, timeout: Optional[float] = None) -> Iterator[Container]:
+        """Context manager around lease() and release()."""
+        container = self.lease(timeout=timeout)
+        try:
+            yield container
+        finally:
+            self.release(container)
 
-        safe_builtins = {
-            k: v
-            for k, v in builtins.__dict__.items()
-            if k not in SandboxPython.UNSAFE_BUILTINS
-        }
-        safe_builtins["__import__"] = SandboxPython.restricted_import
-        return safe_builtins
+    def close(self) -> None:
+        """Removes all containers of the pool and wakes the leases waiting for one."""
+        with self._lock:
+            self._closed = True
+            containers = list(self._containers.values())
+        self._idle.put(_POOL_CLOSED)
+        for container in containers:
+            self._discard(container)
 
-    @staticmethod
-    def exec(code: str, locals: Dict[str, Any]) -> None:
-        """Executes Python code in a restricted environment.
+
+# Pools of other images or mounts are closed when unused for CONTAINER_POOL_IDLE_S, or least
+# recently used first above MAX_CONTAINER_POOLS, so their containers do not pile up.
+MAX_CONTAINER_POOLS = int(os.environ.get("OCTOPUSAI_MAX_CONTAINER_POOLS", "4"))
+CONTAINER_POOL_IDLE_S = float(os.environ.get("OCTOPUSAI_CONTAINER_POOL_IDLE_S", "600"))
+
+_container_pools: Dict[Tuple[Any, ...], ContainerPool] = {}
+_container_pools_lock = threading.Lock()
+_library_image_locks: Dict[str, threading.Lock] = {}
+_restricted_pools: Dict[Tuple[int, int, int], RestrictedWorkerPool] = {}
+
+
+def _close_container_pools() -> None:
+    with _container_pools_lock:
+        pools = list(_container_pools.values())
+        _container_pools.clear()
+    for pool in pools:
+        pool.close()
+    for restricted_pool in _restricted_pools.values():
+        restricted_pool.close()
+
+
+atexit.register(_close_container_pools)
+
+
+def _evict_container_pools(keep: Optional[Tuple[Any, ...]] = None) -> None:
+    """Closes the pools idle for CONTAINER_POOL_IDLE_S, and the least recently used ones above MAX_CONTAINER_POOLS.
+
+    Pools with leased containers and the pool `keep` (the one just handed out) are kept.
+    """
+    now = time.monotonic()
+    with _container_pools_lock:
+        excess = len(_container_pools) - MAX_CONTAINER_POOLS
+        idle = sorted((key for key, pool in _container_pools.items() if not pool.in_use and key != keep),
+                      key=lambda key: _container_pools[key].last_used)
+        evicted = []
+        for key in idle:
+            if len(evicted) < excess or now - _container_pools[key].last_used > CONTAINER_POOL_IDLE_S:
+                evicted.append(_container_pools.pop(key))
+    for pool in evicted:
+        pool.close()
+
+
+# Runs inside the sandbox: executes JSON line requests from stdin in one namespace and
+# answers on the original stdout. User output (fds 1 and 2, so subprocesses included)
+# goes to a temporary file per execution, which keeps the protocol channel clean.
+KERNEL_SOURCE = r"""
+import json, os, signal, sys, tempfile, traceback
+MARKER = "\x00octopusai-kernel\x00"
+protocol = os.fdopen(os.dup(1), "w", buffering=1)
+requests = os.fdopen(os.dup(0), "r")
+os.dup2(os.open(os.devnull, os.O_RDONLY), 0)
+namespace = {"__name__": "__main__", "__builtins__": __builtins__}
+class ExecutionTimeout(BaseException):
+    pass
+def on_alarm(signum, frame):
+    raise ExecutionTimeout()
+signal.signal(signal.SIGALRM, on_alarm)
+repo_root = os.environ.get("OCTOPUSAI_REPO_ROOT")
+module_mtimes = {}
+def refresh_repo_modules():
+    # Forget modules imported from the repository whose file changed since, e.g. after a fix
+    if not repo_root:
+        return
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None) or ""
+        if not path.startswith(repo_root + "/"):
+            continue
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime = None
+        if module_mtimes.setdefault(name, mtime) != mtime:
+            del sys.modules[name]
+            del module_mtimes[name]
+for line in requests:
+    request = json.loads(line)
+    error = None
+    refresh_repo_modules()
+    with tempfile.TemporaryFile(mode="w+") as out:
+        os.dup2(out.fileno(), 1)
+        os.dup2(out.fileno(), 2)
+        signal.alarm(request.get("timeout") or 0)
+        try:
+            exec(compile(request["code"], "<snippet>", "exec"), namespace)
+        except ExecutionTimeout:
+            error = "timeout"
+        except BaseException:
+            signal.alarm(0)
+            traceback.print_exc()
+            error = "exception"
+        finally:
+            signal.alarm(0)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        out.seek(0)
+        output = out.read()
+    refresh_repo_modules()
+    protocol.write(MARKER + json.dumps({"output": output, "error": error}) + "\n")
+"""
+KERNEL_MARKER = "\x00octopusai-kernel\x00"
+
+
+class KernelSession:
+    """A long-lived Python interpreter inside a sandbox container.
+
+    Code is sent over the stdin pipe of a `docker exec -i` process and executed in one
+    namespace, so definitions made by one execution are available to the next ones.
+    Each execution is interrupted (SIGALRM) after its timeout without losing the
+    namespace; if the interpreter does not answer shortly after that, it is killed.
+    """
+
+    GRACE_SECONDS = 5
+
+    def __init__(self, container: Container):
+        self.container = container
+        self.installed_libraries: set = set()
+        self.process = subprocess.Popen(
+            ["docker", "exec", "-i", container.name, "python3", "-u", "-c", KERNEL_SOURCE],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+        )
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        threading.Thread(target=self._read_lines, daemon=True).start()
+
+    def _read_lines(self) -> None:
+        for line in self.process.stdout:
+            self._lines.put(line)
+        self._lines.put(None)
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def execute(self, code: str, timeout: int = 60) -> Tuple[str, Optional[str]]:
+        """Executes code in the session's namespace.
 
         Args:
             code: The Python code to execute as a string.
-            locals: A dictionary that will be used for local variable storage.
+            timeout: Maximum execution time in seconds.
+
+        Returns:
+            The combined stdout/stderr of the execution and None, "exception",
+            "timeout", "killed" (no answer after the timeout, the interpreter was
+            killed) or "dead" (the interpreter exited, e.g. it was OOM killed or
+            called os._exit). The namespace is lost in the last two cases.
         """
-        exec(code, {"__builtins__": SandboxPython.safe_builtins()}, locals)
+        self.process.stdin.write(json.dumps({"code": code, "timeout": timeout}) + "\n")
+        self.process.stdin.flush()
+        while True:
+            try:
+                line = self._lines.get(timeout=timeout + self.GRACE_SECONDS)
+            except queue.Empty:
+                self.close()
+                return "", "killed"
+            if line is None:
+                return "", "dead"
+            if line.startswith(KERNEL_MARKER):
+                response = json.loads(line[len(KERNEL_MARKER):])
+                return response["output"], response["error"]
+
+    def close(self) -> None:
+        """Stops the interpreter."""
+        if self.alive:
+            self.process.kill()
+        self.process.wait()
 
 
 class CodeInterpreterTool(BaseTool):
@@ -143,6 +438,27 @@ class CodeInterpreterTool(BaseTool):
     user_dockerfile_path: Optional[str] = None
     user_docker_base_url: Optional[str] = None
     unsafe_mode: bool = False
+    container_pool_size: int = 2
+    library_image_repository: str = "code-interpreter-libs"
+    pip_cache_volume: str = "octopusai-pip-cache"
+    requirements_file: Optional[str] = None
+    persistent_session: bool = False
+    repo_dir: Optional[str] = None
+    repo_mount_path: str = "/repo"
+    sandbox_pool_size: int = 2
+    sandbox_cpu_seconds: int = 30
+    sandbox_memory_mb: int = 512
+    _session: Optional[KernelSession] = PrivateAttr(default=None)
+    _session_pool: Optional[ContainerPool] = PrivateAttr(default=None)
+
+    def model_post_init(self, __context: Any) -> None:
+        if self.persistent_session:
+            self.description = (
+                "Interprets Python3 code strings with a final print statement. "
+                "The interpreter keeps its state between calls: functions, classes, imports and "
+                "variables defined by earlier code can be used again without redefining them."
+            )
+        super().model_post_init(__context)
 
     @staticmethod
     def _get_installed_package_path() -> str:
@@ -154,6 +470,13 @@ class CodeInterpreterTool(BaseTool):
         spec = importlib.util.find_spec("crewai_tools")
         return os.path.dirname(spec.origin)
 
+    def _docker_client(self) -> DockerClient:
+        return (
+            docker_from_env()
+            if self.user_docker_base_url is None
+            else DockerClient(base_url=self.user_docker_base_url)
+        )
+
     def _verify_docker_image(self) -> None:
         """Verifies if the Docker image is available or builds it if necessary.
 
@@ -164,11 +487,7 @@ class CodeInterpreterTool(BaseTool):
             FileNotFoundError: If the Dockerfile cannot be found.
         """
 
-        client = (
-            docker_from_env()
-            if self.user_docker_base_url is None
-            else DockerClient(base_url=self.user_docker_base_url)
-        )
+        client = self._docker_client()
 
         try:
             client.images.get(self.default_image_tag)
@@ -219,36 +538,157 @@ class CodeInterpreterTool(BaseTool):
         for library in libraries:
             container.exec_run(["pip", "install", library])
 
+    def _library_image(self, libraries: List[str]) -> str:
+        """Returns an image with the given libraries preinstalled, building it if needed.
+
+        Images are content addressed: the tag is a hash of the base image id, the sorted
+        library names and the contents of requirements_file (if set), so every distinct
+        set of dependencies is installed exactly once per Docker host.
+
+        Args:
+            libraries: A list of library names to install using pip.
+
+        Returns:
+            The tag of the image to run the code in.
+        """
+        libraries = sorted({library.strip() for library in libraries if library and library.strip()})
+        requirements = None
+        if self.requirements_file and os.path.isfile(self.requirements_file):
+            with open(self.requirements_file, "rb") as f:
+                requirements = f.read()
+        if not libraries and requirements is None:
+            return self.default_image_tag
+
+        client = self._docker_client()
+        self._verify_docker_image()
+        base_image_id = client.images.get(self.default_image_tag).id
+        key = json.dumps(
+            {
+                "base": base_image_id,
+                "libraries": libraries,
+                "requirements": hashlib.sha256(requirements).hexdigest() if requirements is not None else None,
+            },
+            sort_keys=True,
+        )
+        tag = hashlib.sha256(key.encode()).hexdigest()[:16]
+        image = f"{self.library_image_repository}:{tag}"
+
+        with _container_pools_lock:
+            lock = _library_image_locks.setdefault(image, threading.Lock())
+        with lock:
+            try:
+                client.images.get(image)
+                return image
+            except ImageNotFound:
+                pass
+
+            Printer.print(f"Building sandbox image {image} with {', '.join(libraries) or 'requirements'}", color="bold_blue")
+            container = client.containers.run(
+                self.default_image_tag,
+                detach=True,
+                tty=True,
+                # Wheels are kept in a named volume, so rebuilds for other library sets reuse downloads
+                volumes={self.pip_cache_volume: {"bind": "/root/.cache/pip", "mode": "rw"}},  # type: ignore
+            )
+            try:
+                install_args = list(libraries)
+                if requirements is not None:
+                    archive = io.BytesIO()
+                    with tarfile.open(fileobj=archive, mode="w") as tar:
+                        info = tarfile.TarInfo("requirements.txt")
+                        info.size = len(requirements)
+                        tar.addfile(info, io.BytesIO(requirements))
+                    container.put_archive("/tmp", archive.getvalue())
+                    install_args += ["-r", "/tmp/requirements.txt"]
+                result = container.exec_run(["pip", "install", "--no-input", *install_args])
+                if result.exit_code != 0:
+                    # Do not let one misspelled library fail the others
+                    self._install_libraries(container, libraries)
+                container.exec_run(["rm", "-f", "/tmp/requirements.txt"])
+                container.commit(repository=self.library_image_repository, tag=tag)
+            finally:
+                container.remove(force=True)
+        return image
+
+    def _container_run_kwargs(self) -> Dict[str, Any]:
+        """Returns the mounts and environment of sandbox containers.
+
+        By default the current working directory is mounted read-write at /workspace.
+        With repo_dir set, the repository is mounted read-only at repo_mount_path and put
+        on PYTHONPATH, so code can import the modules under review, while /workspace is
+        an in-memory scratch directory that is thrown away with the container.
+
+        Returns:
+            Keyword arguments for `containers.run`.
+        """
+        if self.repo_dir is None:
+            return {"volumes": {os.getcwd(): {"bind": "/workspace", "mode": "rw"}}}
+        return {
+            "volumes": {os.path.abspath(self.repo_dir): {"bind": self.repo_mount_path, "mode": "ro"}},
+            "tmpfs": {"/workspace": ""},
+            "environment": {
+                "PYTHONPATH": self.repo_mount_path,
+                "PYTHONDONTWRITEBYTECODE": "1",
+                "OCTOPUSAI_REPO_ROOT": self.repo_mount_path,
+            },
+        }
+
     def _init_docker_container(self) -> Container:
         """Initializes and returns a Docker container for code execution.
 
-        Stops and removes any existing container with the same name before creating
-        a new one. Maps the current working directory to /workspace in the container.
+        The container gets a unique name, so containers of concurrent flows do not
+        replace each other. Mounts are described in _container_run_kwargs.
 
         Returns:
             A Docker container object ready for code execution.
         """
-        container_name = "code-interpreter"
-        client = docker_from_env()
-        current_path = os.getcwd()
-
-        # Check if the container is already running
-        try:
-            existing_container = client.containers.get(container_name)
-            existing_container.stop()
-            existing_container.remove()
-        except NotFound:
-            pass  # Container does not exist, no need to remove
+        client = self._docker_client()
 
         return client.containers.run(
             self.default_image_tag,
             detach=True,
             tty=True,
             working_dir="/workspace",
-            name=container_name,
-            volumes={current_path: {"bind": "/workspace", "mode": "rw"}},  # type: ignore
+            name=f"code-interpreter-{uuid.uuid4().hex[:12]}",
+            **self._container_run_kwargs(),  # type: ignore
         )
 
+    def _get_container_pool(self, image: Optional[str] = None) -> ContainerPool:
+        """Returns the process wide container pool for an image and this tool's mounts.
+
+        The pool is created (and the image verified or built) on first use, and warmed
+        up in the background so later executions find a running container. Idle pools
+        of other images or mounts are closed on the way.
+
+        Args:
+            image: The image to run, defaults to default_image_tag.
+
+        Returns:
+            The shared ContainerPool.
+        """
+        image = image or self.default_image_tag
+        run_kwargs = self._container_run_kwargs()
+        key = (self.user_docker_base_url, image, json.dumps(run_kwargs, sort_keys=True))
+        with _container_pools_lock:
+            pool = _container_pools.get(key)
+            if pool is not None:
+                pool.touch()
+            else:
+                if image == self.default_image_tag:
+                    self._verify_docker_image()
+                pool = ContainerPool(
+                    self._docker_client(),
+                    image,
+                    size=self.container_pool_size,
+                    run_kwargs=run_kwargs,
+                    # Only wipe /workspace when it is the container's own scratch space
+                    scratch_dirs=["/tmp"] if self.repo_dir is None else ["/tmp", "/workspace"],
+                )
+                _container_pools[key] = pool
+                threading.Thread(target=pool.warm_up, daemon=True).start()
+        _evict_container_pools(keep=key)
+        return pool
+
     def _check_docker_available(self) -> bool:
         """Checks if Docker is available and running on the system.
 
@@ -294,6 +734,8 @@ class CodeInterpreterTool(BaseTool):
         """
         Printer.print(f"Running code: {code}")
         if self._check_docker_available():
+            if self.persistent_session:
+                return self.run_code_in_session(code, libraries_used)
             return self.run_code_in_docker_with_timeout(code, libraries_used)
         else:
             return self.run_code_in_restricted_sandbox(code)
@@ -340,51 +782,173 @@ class CodeInterpreterTool(BaseTool):
             The output of the executed code as a string, or an error message.
         """
         Printer.print("Running code in Docker environment", color="bold_blue")
-        self._verify_docker_image()
-        container = self._init_docker_container()
-        self._install_libraries(container, libraries_used)
+        pool = self._get_container_pool(self._library_image(libraries_used))
 
-        try:
-            result = subprocess.run(
-                ["docker", "exec", container.name, "python3", "-c", code],
-                capture_output=True,
-                text=True,
-                timeout=timeout,
-            )
-            if result.returncode != 0:
-                return f"Something went wrong while running the code: \n{result.stderr}"
-            return result.stdout
-        except subprocess.TimeoutExpired:
-            container.kill()
-            return f"Execution timed out after {timeout} seconds"
-        finally:
+        with pool.leased() as container:
             try:
-                container.stop()
-                container.remove()
-            except Exception:
-                pass
+                result = subprocess.run(
+                    ["docker", "exec", container.name, "python3", "-c", code],
+                    capture_output=True,
+                    text=True,
+                    timeout=timeout,
+                )
+                if result.returncode != 0:
+                    return f"Something went wrong while running the code: \n{result.stderr}"
+                return result.stdout
+            except subprocess.TimeoutExpired:
+                # The code keeps running inside the container, releasing the container kills it
+                return f"Execution timed out after {timeout} seconds"
+
+    def run_pytest_in_docker(self, tests: List[str], timeout: int = 60) -> Tuple[Optional[int], str, Optional[str]]:
+        """Runs pytest on the mounted repository in a sandbox container.
+
+        The tests of the repository under review are untrusted code: they run in a
+        container of the pool, with the repository mounted read-only and without the
+        host's environment (API keys, tokens).
+
+        Args:
+            tests: Test paths or node ids relative to the repository root.
+            timeout: Maximum execution time in seconds.
+
+        Returns:
+            The exit code of pytest (None on timeout), its output and the JUnit XML
+            report (junit_family=xunit1), None if pytest did not write it.
+
+        Raises:
+            RuntimeError: If repo_dir is not set or Docker is not available.
+        """
+        if self.repo_dir is None:
+            raise RuntimeError("repo_dir is required to run the repository's tests")
+        if not self._check_docker_available():
+            raise RuntimeError("Docker is not available")
+        Printer.print("Running pytest in Docker environment", color="bold_blue")
+        pool = self._get_container_pool(self._library_image(["pytest"]))
+        report = "/tmp/octopusai_junit.xml"
+
+        with pool.leased() as container:
+            try:
+                result = subprocess.run(
+                    # The mount is read-only, no .pytest_cache
+                    ["docker", "exec", "-w", self.repo_mount_path, container.name,
+                     "python3", "-m", "pytest", "-p", "no:cacheprovider", f"--junitxml={report}",
+                     "-o", "junit_family=xunit1", *tests],
+                    capture_output=True,
+                    text=True,
+                    timeout=timeout,
+                )
+            except subprocess.TimeoutExpired as e:
+                # Releasing the container kills pytest
+                output = e.stdout.decode("utf-8", errors="replace") if isinstance(e.stdout, bytes) else (e.stdout or "")
+                return None, output, None
+            xml = container.exec_run(["cat", report])
+            return (result.returncode, result.stdout + result.stderr,
+                    xml.output.decode("utf-8", errors="replace") if xml.exit_code == 0 else None)
+
+
+    def run_code_in_session(self, code: str, libraries_used: List[str], timeout: int = 60) -> str:
+        """Runs Python code in this tool's persistent kernel session.
 
+        The session is started on first use in a container leased from the pool of
+        the image for the first libraries requested; libraries requested later are
+        installed into the running container. If the kernel died, a new session
+        (with an empty namespace) is started and the caller is told so.
 
-    def run_code_in_restricted_sandbox(self, code: str) -> str:
+        Args:
+            code: The Python code to execute as a string.
+            libraries_used: A list of Python library names to install before execution.
+            timeout: Maximum execution time in seconds.
+
+        Returns:
+            The output of the executed code as a string, or an error message.
+        """
+        Printer.print("Running code in Docker kernel session", color="bold_blue")
+        notice = ""
+        if self._session is not None and not self._session.alive:
+            self.close()
+            notice = "Note: the interpreter was restarted, earlier definitions are lost.\n"
+        if self._session is None:
+            self._session_pool = self._get_container_pool(self._library_image(libraries_used))
+            self._session = KernelSession(self._session_pool.lease())
+            self._session.installed_libraries.update(libraries_used)
+
+        missing = [library for library in libraries_used if library not in self._session.installed_libraries]
+        self._install_libraries(self._session.container, missing)
+        self._session.installed_libraries.update(missing)
+
+        output, error = self._session.execute(code, timeout=timeout)
+        if error == "timeout":
+            return f"{notice}Execution timed out after {timeout} seconds\n{output}"
+        if error == "killed":
+            self.close()
+            return f"{notice}Execution timed out after {timeout} seconds, the interpreter was restarted and earlier definitions are lost"
+        if error == "dead":
+            self.close()
+            return (f"{notice}The interpreter exited while running the code (e.g. out of memory or os._exit), "
+                    "it was restarted and earlier definitions are lost")
+        if error is not None:
+            return f"{notice}Something went wrong while running the code: \n{output}"
+        return notice + output
+
+    def close(self) -> None:
+        """Stops the persistent kernel session, if any, and returns its container to the pool."""
+        if self._session is None:
+            return
+        self._session.close()
+        self._session_pool.release(self._session.container)
+        self._session = None
+        self._session_pool = None
+
+    def close_pools(self) -> None:
+        """Closes the container pools mounting this tool's repo_dir, once no run uses the repository anymore.
+
+        Pools are keyed by their mounts, so every repository (every run's clone) gets its own pools;
+        the pools without a repo_dir mount (the working directory) are shared and left open.
+        """
+        if self.repo_dir is None:
+            return
+        mounts = json.dumps(self._container_run_kwargs(), sort_keys=True)
+        with _container_pools_lock:
+            pools = [_container_pools.pop(key) for key in list(_container_pools) if key[2] == mounts]
+        for pool in pools:
+            pool.close()
+
+    def _get_restricted_pool(self) -> RestrictedWorkerPool:
+        """Returns the process wide restricted worker pool for this tool's limits."""
+        key = (self.sandbox_pool_size, self.sandbox_cpu_seconds, self.sandbox_memory_mb)
+        with _container_pools_lock:
+            pool = _restricted_pools.get(key)
+            if pool is None:
+                pool = RestrictedWorkerPool(
+                    size=self.sandbox_pool_size,
+                    cpu_seconds=self.sandbox_cpu_seconds,
+                    memory_bytes=self.sandbox_memory_mb * 1024 * 1024,
+                )
+                _restricted_pools[key] = pool
+                threading.Thread(target=pool.warm_up, daemon=True).start()
+        return pool
+
+    def run_code_in_restricted_sandbox(self, code: str, timeout: int = 60) -> str:
         """Runs Python code in a restricted sandbox environment.
 
         Executes the code with restricted access to potentially dangerous modules and
-        built-in functions for basic safety when Docker is not available.
+        built-in functions for basic safety when Docker is not available. The code runs
+        in a pooled worker process with CPU time, memory and wall-clock limits.
 
         Args:
             code: The Python code to execute as a string.
+            timeout: Maximum execution time in seconds.
 
         Returns:
-            The value of the 'result' variable from the executed code,
-            or an error message if execution failed.
+            The value of the 'result' variable from the executed code (or its printed
+            output if there is none), or an error message if execution failed.
         """
         Printer.print("Running code in restricted sandbox", color="yellow")
-        exec_locals = {}
-        try:
-            SandboxPython.exec(code=code, locals=exec_locals)
-            return exec_locals.get("result", "No result variable found.")
-        except Exception as e:
-            return f"An error occurred: {str(e)}"
+        response = self._get_restricted_pool().run(code, timeout=timeout)
+        if response["error"]:
+            return f"An error occurred: {response['error']}\n{response['stdout']}{response['stderr']}"
+        if response["result"] is not None:
+            return response["result"]
+        return response["stdout"] or "No result variable found."
 
     def run_code_unsafe(self, code: str, libraries_used: List[str]) -> str:
         """Runs code directly on the host machine without any safety restrictions.
@@ -0,0 +1,324 @@
+"""Offline BM25 search over function level chunks of a repository.
+
+Python files are split into functions, methods and class headers with ast, other source
+files into fixed line windows. Term counts are kept per blob in the cache directory of the
+repository (see git_tool.index_store_dir), shared by all runs' clones, so an index for
+another commit only tokenizes changed files.
+The postings are numpy arrays sorted by term, a query is a handful of vectorized slices.
+In a partial clone (sparse clone mode) only the files present locally are indexed.
+"""
+
+import ast
+import functools
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple, Type
+
+import numpy as np
+from crewai.tools import BaseTool
+from pydantic import BaseModel, Field
+
+from octopusai.tools.diff_model import PullRequestDiff
+from octopusai.tools.git_tool import head_blobs, index_store_dir, read_blobs
+
+INDEX_VERSION = 1
+SOURCE_EXTENSIONS = (
+    ".py", ".pyi", ".js", ".jsx", ".ts", ".tsx", ".java", ".kt", ".go", ".rs", ".rb", ".php", ".c", ".h",
+    ".cc", ".cpp", ".hpp", ".cs", ".swift", ".scala", ".sh",
+)
+MAX_FILE_BYTES = 512 * 1024
+WINDOW_LINES = 60
+CLASS_HEADER_LINES = 30
+
+K1 = 1.2
+B = 0.75
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+_STOPWORDS = {
+    "self", "cls", "def", "class", "return", "import", "from", "as", "if", "else", "elif", "for", "while", "in",
+    "is", "not", "and", "or", "none", "true", "false", "pass", "the", "to", "of", "a", "an", "with", "try",
+    "except", "raise", "var", "let", "const", "function", "this", "new", "null", "int", "str",
+}
+
+
+@functools.lru_cache(maxsize=200000)
+def _identifier_tokens(identifier: str) -> Tuple[str, ...]:
+    parts = {p.lower() for piece in identifier.split("_") for p in _CAMEL.findall(piece)}
+    parts.add(identifier.lower())
+    return tuple(t for t in parts if len(t) > 1 and t not in _STOPWORDS)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower case identifiers plus their snake_case / camelCase parts.
+    """
+    tokens = []
+    for identifier in _IDENTIFIER.findall(text):
+        tokens.extend(_identifier_tokens(identifier))
+    return tokens
+
+
+def _python_chunks(lines: List[str], source: str) -> Optional[List[Tuple[int, int, str]]]:
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+    chunks = []
+    covered = [False] * (len(lines) + 2)
+
+    def visit(node: ast.AST, scope: List[str]):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                start = min([child.lineno] + [d.lineno for d in child.decorator_list])
+                chunks.append((start, child.end_lineno, ".".join(scope + [child.name])))
+                covered[start:child.end_lineno + 1] = [True] * (child.end_lineno + 1 - start)
+            elif isinstance(child, ast.ClassDef):
+                start = min([child.lineno] + [d.lineno for d in child.decorator_list])
+                methods = [n.lineno for n in child.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+                end = min([child.end_lineno, start + CLASS_HEADER_LINES - 1] + [m - 1 for m in methods])
+                chunks.append((start, max(end, child.lineno), ".".join(scope + [child.name])))
+                covered[start:end + 1] = [True] * max(end + 1 - start, 0)
+                visit(child, scope + [child.name])
+
+    visit(tree, [])
+    # Module level code, in windows of consecutive lines outside of the definitions
+    runs: List[List[int]] = []
+    for line in range(1, len(lines) + 1):
+        if covered[line]:
+            continue
+        if runs and runs[-1][1] == line - 1 and line - runs[-1][0] < WINDOW_LINES:
+            runs[-1][1] = line
+        else:
+            runs.append([line, line])
+    for start, end in runs:
+        if any(lines[i - 1].strip() for i in range(start, end + 1)):
+            chunks.append((start, end, "<module>"))
+    return chunks
+
+
+def _window_chunks(lines: List[str]) -> List[Tuple[int, int, str]]:
+    return [(start, min(start + WINDOW_LINES - 1, len(lines)), "")
+            for start in range(1, len(lines) + 1, WINDOW_LINES)]
+
+
+def chunk_file(path: str, source: str) -> List[Tuple[int, int, str, Dict[str, int]]]:
+    """
+    (start_line, end_line, name, term counts) of the chunks of a file.
+    """
+    lines = source.splitlines()
+    spans = (_python_chunks(lines, source) if path.endswith((".py", ".pyi")) else None) or _window_chunks(lines)
+    chunks = []
+    for start, end, name in spans:
+        counts = Counter(tokenize("\n".join(lines[start - 1:end])))
+        if counts:
+            chunks.append((start, end, name, dict(counts)))
+    return chunks
+
+
+class SearchHit(BaseModel):
+    path: str
+    start_line: int
+    end_line: int
+    name: str
+    score: float
+
+
+class CodeSearchIndex:
+    def __init__(self, repo_dir: str, commit: str, chunks: List[Tuple[str, int, int, str, Dict[str, int]]]):
+        self.repo_dir = repo_dir
+        self.commit = commit
+        self.chunks = [(path, start, end, name) for path, start, end, name, _ in chunks]
+        self.path_docs: Dict[str, List[int]] = {}
+        for doc, (path, _, _, _) in enumerate(self.chunks):
+            self.path_docs.setdefault(path, []).append(doc)
+
+        vocabulary: Dict[str, int] = {}
+        term_ids, doc_ids, tfs = [], [], []
+        doc_lengths = np.zeros(len(chunks), dtype=np.float32)
+        for doc, (_, _, _, _, counts) in enumerate(chunks):
+            for term, tf in counts.items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_ids.append(doc)
+                tfs.append(tf)
+            doc_lengths[doc] = sum(counts.values())
+
+        term_ids = np.asarray(term_ids, dtype=np.int32)
+        order = np.argsort(term_ids, kind="stable")
+        self.vocabulary = vocabulary
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)[order]
+        tfs = np.asarray(tfs, dtype=np.float32)[order]
+        self.offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)), out=self.offsets[1:])
+
+        # Precomputed BM25 term weights, a query only sums slices
+        n = max(len(chunks), 1)
+        df = np.diff(self.offsets).astype(np.float32)
+        idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+        average = doc_lengths.mean() if len(chunks) else 1.0
+        norm = K1 * (1 - B + B * doc_lengths / average)
+        term_of_posting = np.repeat(np.arange(len(vocabulary)), np.diff(self.offsets))
+        self.weights = (idf[term_of_posting] * tfs * (K1 + 1) / (tfs + norm[self.doc_ids])).astype(np.float32)
+
+    def search(self, query: str, top_k: int = 5, exclude: Optional[List[Tuple[str, int, int]]] = None) -> List[SearchHit]:
+        """
+        Best `top_k` chunks for `query`, skipping chunks overlapping the (path, start, end) ranges in `exclude`.
+        """
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            lo, hi = self.offsets[term_id], self.offsets[term_id + 1]
+            scores[self.doc_ids[lo:hi]] += self.weights[lo:hi]
+
+        for path, start, end in exclude or []:
+            for doc in self.path_docs.get(path, []):
+                if self.chunks[doc][1] <= end and start <= self.chunks[doc][2]:
+                    scores[doc] = 0
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k)[:top_k]]
+        hits = []
+        for doc in sorted(candidates, key=lambda d: -scores[d]):
+            path, start, end, name = self.chunks[doc]
+            hits.append(SearchHit(path=path, start_line=start, end_line=end, name=name, score=round(float(scores[doc]), 3)))
+        return hits
+
+    def read(self, hit: SearchHit) -> str:
+        try:
+            with open(os.path.join(self.repo_dir, hit.path), encoding="utf-8", errors="replace") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return ""
+        return "\n".join(lines[hit.start_line - 1:hit.end_line])
+
+
+def _git(repo_dir: str, *args: str) -> str:
+    return subprocess.run(["git", "-C", repo_dir, *args], capture_output=True, text=True, check=True).stdout.strip()
+
+
+def _store_path(repo_dir: str) -> str:
+    return os.path.join(index_store_dir(repo_dir), "bm25.json")
+
+
+def build_index(repo_dir: str) -> CodeSearchIndex:
+    """
+    Index the HEAD commit of `repo_dir`, reusing the stored chunks of unchanged blobs.
+    """
+    commit = _git(repo_dir, "rev-parse", "HEAD")
+    store = _store_path(repo_dir)
+    stored: Dict[str, list] = {}
+    try:
+        with open(store) as f:
+            data = json.load(f)
+        if data.get("version") == INDEX_VERSION:
+            stored = data["blobs"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    files = [(path, blob) for path, blob in head_blobs(repo_dir) if path.endswith(SOURCE_EXTENSIONS)]
+    missing = [blob for _, blob in files if blob not in stored]
+    blob_chunks = {blob: stored[blob] for _, blob in files if blob in stored}
+    paths = {blob: path for path, blob in files}
+    for blob, source in zip(missing, read_blobs(repo_dir, missing)):
+        if source is None:
+            continue
+        if len(source) > MAX_FILE_BYTES:
+            blob_chunks[blob] = []
+            continue
+        blob_chunks[blob] = [list(c) for c in chunk_file(paths[blob], source)]
+
+    if missing:
+        os.makedirs(os.path.dirname(store), exist_ok=True)
+        tmp = f"{store}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(json.dumps({"version": INDEX_VERSION, "blobs": blob_chunks}))
+        os.replace(tmp, store)
+
+    # Path tokens are added per file, the stored chunks are keyed by content only
+    chunks = []
+    for path, blob in files:
+        path_tokens = Counter(tokenize(path.replace("/", " ").replace(".", " ")))
+        for start, end, name, counts in blob_chunks.get(blob, ()):
+            chunks.append((path, start, end, name, dict(path_tokens + Counter(counts))))
+    return CodeSearchIndex(repo_dir, commit, chunks)
+
+
+_indexes: Dict[Tuple[str, str], CodeSearchIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_code_search_index(repo_dir: str) -> CodeSearchIndex:
+    """
+    The index of `repo_dir`'s HEAD, built on first use and shared by the tools of the process.
+    """
+    repo_dir = os.path.realpath(repo_dir)
+    commit = _git(repo_dir, "rev-parse", "HEAD")
+    with _indexes_lock:
+        index = _indexes.get((repo_dir, commit))
+        if index is None:
+            start = time.perf_counter()
+            index = build_index(repo_dir)
+            print(f"Code search index of {commit[:12]}: {len(index.chunks)} chunks in {time.perf_counter() - start:.2f}s")
+            _indexes[(repo_dir, commit)] = index
+    return index
+
+
+class CodeSearchToolSchema(BaseModel):
+    """Input for CodeSearchTool."""
+
+    query: str = Field(..., description="Identifiers or words describing the code to find, e.g. 'parse config timeout'")
+    top_k: Optional[int] = Field(default=5, description="Number of results")
+
+
+class CodeSearchTool(BaseTool):
+    name: str = "Search related code"
+    description: str = (
+        "Full text search over the functions and classes of the repository (as of the PR commit). "
+        "Returns the best matching code chunks with their file and line range."
+    )
+    args_schema: Type[BaseModel] = CodeSearchToolSchema
+    repo_dir: str
+    max_lines: int = 40  # Per result
+
+    def _run(self, query: str, top_k: Optional[int] = 5) -> str:
+        try:
+            index = get_code_search_index(self.repo_dir)
+        except Exception as e:
+            return f"Error building the code search index: {str(e)}"
+        hits = index.search(query, top_k=min(top_k or 5, 20))
+        if not hits:
+            return f"No code found for: {query}"
+        results = []
+        for hit in hits:
+            lines = index.read(hit).splitlines()
+            more = f"\n... {len(lines) - self.max_lines} more lines" if len(lines) > self.max_lines else ""
+            results.append(f"### {hit.path}:{hit.start_line}-{hit.end_line} {hit.name} (score {hit.score})\n"
+                           + "\n".join(lines[:self.max_lines]) + more)
+        return "\n\n".join(results)
+
+
+def related_code(repo_dir: str, diff: PullRequestDiff, top_k: int = 5, max_query_terms: int = 40) -> List[Tuple[str, str]]:
+    """
+    (title, code) of the chunks most related to the changed lines of `diff`, excluding the changed code itself.
+    """
+    index = get_code_search_index(repo_dir)
+    terms: Counter = Counter()
+    exclude = []
+    for f in diff.select().files:
+        for hunk in f.hunks:
+            terms.update(tokenize(hunk.section))
+            terms.update(tokenize("\n".join(line[1:] for line in hunk.lines if line[:1] in ("+", "-"))))
+            exclude.append((f.path, hunk.new_start, hunk.new_start + max(hunk.new_lines - 1, 0)))
+    if not terms:
+        return []
+    query = " ".join(term for term, _ in terms.most_common(max_query_terms))
+    return [(f"{hit.path}:{hit.start_line}-{hit.end_line} {hit.name}", index.read(hit))
+            for hit in index.search(query, top_k=top_k, exclude=exclude)]
@@ -0,0 +1,288 @@
+"""Token budgeted review context.
+
+pack_review_context assembles what the reviewer needs to look at a pull request, most
+important first, until the token budget is spent: the PR header, the changed hunks,
+the pre-triage report, the bodies of the functions/classes enclosing them, their callers,
+related code found by search, review comments, PR comments and commits. Whatever does
+not fit is listed as omitted, so the agents know it exists and can read it with their tools.
+"""
+
+import ast
+import functools
+import os
+import subprocess
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from octopusai.tools.diff_model import DiffHunk, FileDiff, PullRequestDiff
+
+# Cap for a single comment, commit message or PR body, the rest of the budget goes to code
+MAX_TEXT_TOKENS = 400
+MAX_EVIDENCE_TOKENS = 2000
+MAX_CALLERS_PER_SYMBOL = 3
+MAX_CALLER_SOURCE_FILES = 2000
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # tiktoken missing or its encoding cannot be downloaded
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _encoding()
+    if encoding is None:
+        return text[: max_tokens * 4] + " [...]"
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens]) + " [...]"
+
+
+class _Budget:
+    def __init__(self, tokens: int):
+        self.remaining = tokens
+        self.omitted: List[str] = []
+
+    def take(self, text: str, description: str, required: bool = False) -> bool:
+        tokens = count_tokens(text)
+        if tokens > self.remaining and not required:
+            self.omitted.append(f"{description} (~{tokens} tokens)")
+            return False
+        self.remaining -= tokens
+        return True
+
+
+def _is_test_path(path: str) -> bool:
+    name = os.path.basename(path)
+    return name.startswith("test_") or name.endswith("_test.py") or "/tests/" in f"/{path}" or "testcases" in path
+
+
+def _changed_lines(hunk: DiffHunk) -> List[int]:
+    """
+    Line numbers in the new file touched by the hunk; removals count as the line they were removed before.
+    """
+    lines, line = [], hunk.new_start
+    for text in hunk.lines:
+        if text.startswith("+"):
+            lines.append(line)
+            line += 1
+        elif text.startswith("-"):
+            lines.append(line)
+        elif not text.startswith("\\"):
+            line += 1
+    return lines or [hunk.new_start]
+
+
+@functools.lru_cache(maxsize=256)
+def _parse(path: str, mtime: float) -> Optional[Tuple[ast.AST, List[str]]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            source = f.read()
+        return ast.parse(source), source.splitlines()
+    except (OSError, SyntaxError, UnicodeDecodeError, ValueError):
+        return None
+
+
+def _parse_file(path: str) -> Optional[Tuple[ast.AST, List[str]]]:
+    try:
+        return _parse(path, os.path.getmtime(path))
+    except OSError:
+        return None
+
+
+def _definitions(tree: ast.AST) -> Iterable[ast.AST]:
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            yield node
+
+
+def _innermost_definition(tree: ast.AST, line: int) -> Optional[ast.AST]:
+    best = None
+    for node in _definitions(tree):
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        if start <= line <= node.end_lineno and (best is None or node.lineno >= best.lineno):
+            best = node
+    return best
+
+
+def _source(lines: List[str], node: ast.AST) -> str:
+    start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+    return "\n".join(lines[start - 1: node.end_lineno])
+
+
+def _python_files(repo_dir: str) -> List[str]:
+    res = subprocess.run(["git", "-C", repo_dir, "ls-files", "--", "*.py"], capture_output=True, text=True)
+    if res.returncode == 0:
+        return res.stdout.splitlines()[:MAX_CALLER_SOURCE_FILES]
+    files = []
+    for root, dirs, names in os.walk(repo_dir):
+        dirs[:] = [d for d in dirs if not d.startswith(".") and d != "__pycache__"]
+        files += [os.path.relpath(os.path.join(root, n), repo_dir) for n in names if n.endswith(".py")]
+    return files[:MAX_CALLER_SOURCE_FILES]
+
+
+def _find_callers(repo_dir: str, names: Dict[str, str]) -> List[Tuple[str, str, str]]:
+    """
+    Find calls of the functions in `names` (name -> defining file). Returns (symbol, location, source of the caller),
+    callers outside of tests first.
+    """
+    found: Dict[str, List[Tuple[bool, str, str]]] = {name: [] for name in names}
+    for path in _python_files(repo_dir):
+        parsed = _parse_file(os.path.join(repo_dir, path))
+        if parsed is None:
+            continue
+        tree, lines = parsed
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.Call):
+                continue
+            func = node.func
+            name = func.id if isinstance(func, ast.Name) else func.attr if isinstance(func, ast.Attribute) else None
+            if name not in found:
+                continue
+            caller = _innermost_definition(tree, node.lineno)
+            if caller is not None and caller.name == name and path == names[name]:
+                continue  # Recursion
+            location = f"{path}:{node.lineno}"
+            source = _source(lines, caller) if caller is not None else lines[node.lineno - 1]
+            if all(s != source for _, _, s in found[name]):
+                found[name].append((_is_test_path(path), location, source))
+
+    callers = []
+    for name, entries in found.items():
+        for _, location, source in sorted(entries, key=lambda e: e[0])[:MAX_CALLERS_PER_SYMBOL]:
+            callers.append((name, location, source))
+    return callers
+
+
+def _fence(text: str, lang: str = "") -> str:
+    return f"```{lang}\n{text}\n```"
+
+
+def _ranked_files(diff: PullRequestDiff) -> List[FileDiff]:
+    # Source before tests, Python first (the enclosing definitions and callers only exist for Python)
+    return sorted(diff.select().files, key=lambda f: (_is_test_path(f.path), not f.path.endswith(".py")))
+
+
+def pack_review_context(repo_dir: str, pr_details: dict, diff: Optional[PullRequestDiff] = None,
+                        budget: int = 12000, raw_diff: Optional[str] = None,
+                        related: Optional[List[Tuple[str, str]]] = None, evidence: Optional[str] = None) -> str:
+    """
+    Build the review context for a pull request within `budget` tokens. `pr_details` is PullRequestInfo.summary(),
+    `repo_dir` must have the PR branch checked out. Without a parsed `diff`, `raw_diff` is included truncated to the budget.
+    `related` are (title, code) of further relevant code, e.g. from the code search index.
+    `evidence` is the pre-triage report (octopusai.tools.triage), included right after the diff.
+    """
+    budget_ = _Budget(budget)
+    sections: List[str] = []
+
+    # 1. PR header
+    header = [f"Title: {pr_details.get('title', '')}", f"Number: {pr_details.get('number', '')}"]
+    for key in ("base", "head"):
+        if pr_details.get(key):
+            header.append(f"{key.capitalize()}: {pr_details[key]}")
+    if pr_details.get("body"):
+        header.append("Description:\n" + truncate_tokens(pr_details["body"], MAX_TEXT_TOKENS))
+    header_text = "## Pull request\n" + "\n".join(header)
+    budget_.take(header_text, "PR header", required=True)
+    sections.append(header_text)
+
+    # 2. Changed hunks
+    files = _ranked_files(diff) if diff is not None else []
+    if diff is not None:
+        parts = []
+        for f in files:
+            included = [h for h in f.hunks if budget_.take(h.render(), f"hunk {f.path} @@ -{h.old_start} +{h.new_start}")]
+            if included or not f.hunks:
+                parts.append("\n".join(f.header + [h.render() for h in included]))
+        omitted = [f.summary() for f in diff.files if f.filtered]
+        if omitted:
+            parts.append("Omitted from this diff:\n" + "\n".join(f"  {s}" for s in omitted))
+        sections.append("## Diff\n" + _fence("\n".join(parts), "diff"))
+    elif raw_diff:
+        text = truncate_tokens(raw_diff, max(budget_.remaining, 0))
+        budget_.take(text, "diff")
+        sections.append("## Diff\n" + _fence(text, "diff"))
+
+    # 3. Pre-triage evidence: static check findings and failing tests
+    if evidence:
+        text = "## Pre-triage\n" + truncate_tokens(evidence, max(min(budget_.remaining, MAX_EVIDENCE_TOKENS), 0))
+        if budget_.take(text, "pre-triage report"):
+            sections.append(text)
+
+    # 4. Enclosing definitions of the changed lines (new version)
+    enclosing: Dict[str, str] = {}  # function name -> file, for the caller search
+    parts = []
+    for f in files:
+        if not f.path.endswith(".py") or f.new_path is None:
+            continue
+        parsed = _parse_file(os.path.join(repo_dir, f.path))
+        if parsed is None:
+            continue
+        tree, lines = parsed
+        seen = set()
+        for hunk in f.hunks:
+            for line in _changed_lines(hunk):
+                node = _innermost_definition(tree, line)
+                if node is None or node in seen:
+                    continue
+                seen.add(node)
+                if not isinstance(node, ast.ClassDef):
+                    enclosing.setdefault(node.name, f.path)
+                text = f"### {f.path}:{node.lineno} {node.name}\n" + _fence(_source(lines, node), "python")
+                if budget_.take(text, f"body of {node.name} ({f.path}:{node.lineno})"):
+                    parts.append(text)
+    if parts:
+        sections.append("## Definitions enclosing the changes (PR version)\n" + "\n".join(parts))
+
+    # 5. Callers of the changed functions
+    if enclosing and budget_.remaining > 0:
+        parts = []
+        for name, location, source in _find_callers(repo_dir, enclosing):
+            text = f"### {name} called at {location}\n" + _fence(source, "python")
+            if budget_.take(text, f"caller of {name} at {location}"):
+                parts.append(text)
+        if parts:
+            sections.append("## Callers of the changed functions\n" + "\n".join(parts))
+
+    # 6. Related code found by search
+    if related:
+        parts = []
+        for title, code in related:
+            text = f"### {title}\n" + _fence(code)
+            if budget_.take(text, f"related code {title}"):
+                parts.append(text)
+        if parts:
+            sections.append("## Related code\n" + "\n".join(parts))
+
+    # 7. Discussion and commits, in priority order
+    review_comments = pr_details.get("review_comments") or []
+    comments = pr_details.get("comments") or []
+    commits = pr_details.get("commits") or []
+    for title, items in (
+        ("Review comments", [f"- {c.get('user')} on {c.get('path')}:{c.get('line')}: {c.get('body')}" for c in review_comments]),
+        ("PR comments", [f"- {c.get('user')}: {c.get('body')}" for c in comments]),
+        ("Commits", [f"- {c}" for c in commits]),
+    ):
+        parts = []
+        for i, item in enumerate(items):
+            text = truncate_tokens(item, MAX_TEXT_TOKENS)
+            if not budget_.take(text, f"{title.lower()} {i + 1}-{len(items)}"):
+                break
+            parts.append(text)
+        if parts:
+            sections.append(f"## {title}\n" + "\n".join(parts))
+
+    if budget_.omitted:
+        sections.append("## Not included (token budget), read with the tools if needed\n"
+                        + "\n".join(f"- {o}" for o in budget_.omitted))
+    return "\n\n".join(sections)
@@ -0,0 +1,228 @@
+"""Structured view of a unified `git diff`.
+
+parse_diff splits the diff into files and hunks and classifies every file, so that
+lockfiles, vendored code, binaries and generated files can be summarized instead of
+being pasted into prompts and logs.
+"""
+
+import fnmatch
+import re
+from typing import List, Optional, Sequence
+
+from pydantic import BaseModel, Field
+
+LOCKFILES = {
+    "package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml", "bun.lockb",
+    "poetry.lock", "uv.lock", "Pipfile.lock", "pdm.lock", "Cargo.lock", "Gemfile.lock",
+    "composer.lock", "go.sum", "mix.lock", "pubspec.lock", "packages.lock.json",
+}
+VENDORED_DIRS = {"vendor", "vendors", "third_party", "thirdparty", "node_modules", "site-packages"}
+GENERATED_PATTERNS = [
+    "*.min.js", "*.min.css", "*.map", "*_pb2.py", "*_pb2_grpc.py", "*.pb.go", "*.pb.cc", "*.pb.h",
+    "*.generated.*", "*.g.dart", "*.designer.cs",
+    # Build output at the repository root only, build/ and dist/ packages elsewhere are source
+    "dist/*", "build/*",
+]
+GENERATED_MARKERS = ("@generated", "do not edit", "auto-generated", "autogenerated", "code generated by")
+
+# File kinds which are summarized instead of rendered
+FILTERED_KINDS = ("lockfile", "vendored", "binary", "generated")
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@ ?(.*)$")
+
+
+class DiffHunk(BaseModel):
+    old_start: int
+    old_lines: int
+    new_start: int
+    new_lines: int
+    section: str = ""  # Text after the @@ markers, usually the enclosing function
+    lines: List[str] = Field(default_factory=list)
+
+    @property
+    def added(self) -> int:
+        return sum(1 for line in self.lines if line.startswith("+"))
+
+    @property
+    def removed(self) -> int:
+        return sum(1 for line in self.lines if line.startswith("-"))
+
+    def render(self) -> str:
+        old = f"{self.old_start},{self.old_lines}"
+        new = f"{self.new_start},{self.new_lines}"
+        header = f"@@ -{old} +{new} @@" + (f" {self.section}" if self.section else "")
+        return "\n".join([header] + self.lines)
+
+
+class FileDiff(BaseModel):
+    old_path: Optional[str] = None  # None for added files
+    new_path: Optional[str] = None  # None for deleted files
+    status: str = "modified"  # added | deleted | modified | renamed
+    kind: str = "source"  # source | lockfile | vendored | binary | generated
+    header: List[str] = Field(default_factory=list)  # `diff --git` line and extended headers
+    hunks: List[DiffHunk] = Field(default_factory=list)
+
+    @property
+    def path(self) -> str:
+        return self.new_path or self.old_path or ""
+
+    @property
+    def added(self) -> int:
+        return sum(h.added for h in self.hunks)
+
+    @property
+    def removed(self) -> int:
+        return sum(h.removed for h in self.hunks)
+
+    @property
+    def filtered(self) -> bool:
+        return self.kind in FILTERED_KINDS
+
+    def summary(self) -> str:
+        name = self.path if self.status != "renamed" else f"{self.old_path} -> {self.new_path}"
+        return f"{name} ({self.status}, {self.kind}): +{self.added} -{self.removed} in {len(self.hunks)} hunks"
+
+    def render(self) -> str:
+        return "\n".join(self.header + [h.render() for h in self.hunks])
+
+
+class PullRequestDiff(BaseModel):
+    files: List[FileDiff] = Field(default_factory=list)
+
+    @property
+    def added(self) -> int:
+        return sum(f.added for f in self.files)
+
+    @property
+    def removed(self) -> int:
+        return sum(f.removed for f in self.files)
+
+    def file(self, path: str) -> Optional[FileDiff]:
+        return next((f for f in self.files if path in (f.new_path, f.old_path)), None)
+
+    def select(self, paths: Optional[Sequence[str]] = None, include_filtered: bool = False,
+               max_hunk_lines: Optional[int] = None) -> "PullRequestDiff":
+        """
+        Return a diff with the files matching `paths` (glob patterns, all files if None), without lockfiles,
+        vendored, binary and generated files unless `include_filtered`, and without hunks longer than `max_hunk_lines`.
+        """
+        files = []
+        for f in self.files:
+            if f.filtered and not include_filtered:
+                continue
+            if paths is not None and not any(fnmatch.fnmatch(f.path, p) for p in paths):
+                continue
+            hunks = [h for h in f.hunks if max_hunk_lines is None or len(h.lines) <= max_hunk_lines]
+            files.append(f.model_copy(update={"hunks": hunks}))
+        return PullRequestDiff(files=files)
+
+    def summary(self) -> str:
+        lines = [f"{len(self.files)} files changed, +{self.added} -{self.removed}"]
+        lines += [f"  {f.summary()}" for f in self.files]
+        return "\n".join(lines)
+
+    def render(self) -> str:
+        """
+        Render the diff for prompts: source files verbatim, filtered files as one summary line each.
+        """
+        parts = [f.render() for f in self.files if not f.filtered]
+        omitted = [f for f in self.files if f.filtered]
+        if omitted:
+            parts.append("Omitted from this diff:\n" + "\n".join(f"  {f.summary()}" for f in omitted))
+        return "\n".join(parts)
+
+
+def _strip_prefix(path: str) -> Optional[str]:
+    path = path.split("\t")[0]
+    if path.startswith('"') and path.endswith('"'):
+        path = path[1:-1].encode("latin-1", "backslashreplace").decode("unicode_escape").encode("latin-1").decode("utf-8", "replace")
+    if path == "/dev/null":
+        return None
+    if path[:2] in ("a/", "b/"):
+        return path[2:]
+    return path
+
+
+def _paths_from_git_line(line: str) -> List[Optional[str]]:
+    """
+    Best effort paths from the `diff --git` line, the ---/+++ and rename headers take precedence.
+    """
+    rest = line[len("diff --git "):]
+    # "a/P b/P" with identical paths, the only case where a space in P makes the split ambiguous
+    half = (len(rest) - 1) // 2
+    if len(rest) % 2 == 1 and rest[half] == " " and rest[2:half] == rest[half + 3:]:
+        return [rest[2:half], rest[half + 3:]]
+    old, sep, new = rest.rpartition(" b/")
+    if not sep:
+        old, sep, new = rest.rpartition(' "b/')
+        new = '"b/' + new
+    return [_strip_prefix(old), _strip_prefix(new)]
+
+
+def classify(path: str, hunks: Sequence[DiffHunk], binary: bool) -> str:
+    name = path.rsplit("/", 1)[-1]
+    if binary:
+        return "binary"
+    if name in LOCKFILES:
+        return "lockfile"
+    if VENDORED_DIRS.intersection(path.split("/")[:-1]):
+        return "vendored"
+    if any(fnmatch.fnmatch(path, p) for p in GENERATED_PATTERNS):
+        return "generated"
+    # Markers in the file header only, i.e. a first hunk at the start of the file (0 for deleted files)
+    if hunks and hunks[0].new_start <= 1:
+        head = " ".join(line.lower() for line in hunks[0].lines[:10])
+        if any(marker in head for marker in GENERATED_MARKERS):
+            return "generated"
+    return "source"
+
+
+def parse_diff(text: str) -> PullRequestDiff:
+    """
+    Parse the output of `git diff` into files and hunks.
+    """
+    files: List[FileDiff] = []
+    current: Optional[FileDiff] = None
+    binary = False
+
+    def finish():
+        if current is not None:
+            current.kind = classify(current.path, current.hunks, binary)
+            files.append(current)
+
+    for line in text.splitlines():
+        if line.startswith("diff --git "):
+            finish()
+            old, new = _paths_from_git_line(line)
+            current, binary = FileDiff(old_path=old, new_path=new, header=[line]), False
+            continue
+        if current is None:
+            continue
+        hunk = _HUNK_HEADER.match(line)
+        if hunk:
+            old_start, old_lines, new_start, new_lines, section = hunk.groups()
+            current.hunks.append(DiffHunk(
+                old_start=int(old_start), old_lines=int(old_lines if old_lines is not None else 1),
+                new_start=int(new_start), new_lines=int(new_lines if new_lines is not None else 1),
+                section=section,
+            ))
+        elif current.hunks and line[:1] in (" ", "+", "-", "\\", ""):
+            current.hunks[-1].lines.append(line)
+        else:
+            current.header.append(line)
+            if line.startswith("new file mode"):
+                current.status, current.old_path = "added", None
+            elif line.startswith("deleted file mode"):
+                current.status, current.new_path = "deleted", None
+            elif line.startswith("rename from "):
+                current.status, current.old_path = "renamed", line[len("rename from "):]
+            elif line.startswith("rename to "):
+                current.new_path = line[len("rename to "):]
+            elif line.startswith("--- "):
+                current.old_path = _strip_prefix(line[4:])
+            elif line.startswith("+++ "):
+                current.new_path = _strip_prefix(line[4:])
+            elif line.startswith("Binary files ") or line == "GIT binary patch":
+                binary = True
+    finish()
+    return PullRequestDiff(files=files)
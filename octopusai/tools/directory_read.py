@@ -1,5 +1,10 @@
+import fnmatch
 import os
-from typing import Any, Optional, Type, List
+import subprocess
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple, Type
 
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
@@ -8,6 +13,12 @@ from pydantic import BaseModel, Field
 class FixedDirectoryReadToolSchema(BaseModel):
     """Input for DirectoryReadTool."""
 
+    path: Optional[str] = Field(default="", description="Sub-directory to list, relative to the directory (default: all of it)")
+    pattern: Optional[str] = Field(default=None, description="Glob the paths must match, e.g. 'src/**/*.py' or 'test_*'")
+    extensions: Optional[List[str]] = Field(default=None, description="File extensions to include, e.g. ['.py', '.md']")
+    max_depth: Optional[int] = Field(default=None, description="Maximum depth, deeper directories are shown with their file count")
+    cursor: Optional[str] = Field(default=None, description="Cursor from the previous page to get the next entries")
+
 
 class DirectoryReadToolSchema(FixedDirectoryReadToolSchema):
     """Input for DirectoryReadTool."""
@@ -19,20 +30,114 @@ class DirectoryReadToolSchema(FixedDirectoryReadToolSchema):
     )
 
 
+# (work tree, HEAD, index mtime, directory) -> tracked files relative to directory
+_tracked_files: "OrderedDict[Tuple[str, str, int, str], List[str]]" = OrderedDict()
+_tracked_files_lock = threading.Lock()
+_TRACKED_FILES_ENTRIES = 32
+
+
+def _git(directory: str, *args: str) -> Optional[str]:
+    res = subprocess.run(["git", "-C", directory, *args], capture_output=True, text=True)
+    return res.stdout if res.returncode == 0 else None
+
+
+def _git_files(directory: str) -> Optional[List[str]]:
+    """
+    Files below `directory` known to git: tracked files (memoized per commit and index) plus untracked, not ignored ones.
+    None if `directory` is not in a git work tree.
+    """
+    out = _git(directory, "rev-parse", "--show-toplevel", "--git-dir", "HEAD")
+    if out is None:
+        return None
+    toplevel, git_dir, head = out.splitlines()[:3]
+    try:
+        index_mtime = os.stat(os.path.join(directory, git_dir, "index")).st_mtime_ns
+    except OSError:
+        index_mtime = 0
+
+    key = (toplevel, head, index_mtime, os.path.realpath(directory))
+    with _tracked_files_lock:
+        tracked = _tracked_files.get(key)
+        if tracked is not None:
+            _tracked_files.move_to_end(key)
+    if tracked is None:
+        # Paths are relative to the directory git runs in
+        out = _git(directory, "-c", "core.quotePath=false", "ls-files", "-z", "--cached")
+        if out is None:
+            return None
+        tracked = [p for p in out.split("\0") if p]
+        with _tracked_files_lock:
+            _tracked_files[key] = tracked
+            while len(_tracked_files) > _TRACKED_FILES_ENTRIES:
+                _tracked_files.popitem(last=False)
+
+    out = _git(directory, "-c", "core.quotePath=false", "ls-files", "-z", "--others", "--exclude-standard")
+    untracked = [p for p in (out or "").split("\0") if p]
+    # Deleted but still tracked files are listed by --cached
+    return [p for p in tracked if os.path.lexists(os.path.join(directory, p))] + untracked
+
+
+def _gitignore_patterns(path: str) -> List[str]:
+    try:
+        with open(path) as f:
+            return [line.strip() for line in f if line.strip() and not line.startswith(("#", "!"))]
+    except OSError:
+        return []
+
+
+def _ignored_by(patterns: List[Tuple[str, str]], rel_path: str, is_dir: bool) -> bool:
+    for base, pattern in patterns:
+        if base and not rel_path.startswith(base + "/"):
+            continue
+        rel = rel_path[len(base) + 1:] if base else rel_path
+        if pattern.endswith("/"):
+            if not is_dir:
+                continue
+            pattern = pattern.rstrip("/")
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        if fnmatch.fnmatch(rel, pattern) or (not anchored and fnmatch.fnmatch(os.path.basename(rel), pattern)):
+            return True
+    return False
+
+
+def _walk_files(directory: str) -> List[str]:
+    """
+    Walk `directory` honouring .gitignore files (basic patterns, no negation) for trees which are not git work trees.
+    """
+    files = []
+    patterns: List[Tuple[str, str]] = []  # (directory relative to root, pattern)
+    for root, dirs, names in os.walk(directory):
+        rel_root = os.path.relpath(root, directory)
+        rel_root = "" if rel_root == "." else rel_root
+        if ".gitignore" in names:
+            patterns += [(rel_root, p) for p in _gitignore_patterns(os.path.join(root, ".gitignore"))]
+        join = (lambda n: f"{rel_root}/{n}") if rel_root else (lambda n: n)
+        dirs[:] = sorted(d for d in dirs if d != ".git" and not _ignored_by(patterns, join(d), True))
+        files += [join(n) for n in names if not _ignored_by(patterns, join(n), False)]
+    return files
+
+
 class DirectoryReadTool(BaseTool):
     name: str = "List files in directory"
     description: str = (
-        "A tool that can be used to recursively list a directory's content."
+        "A tool that can be used to recursively list a directory's content, page by page. "
+        "Supports a sub-directory, a glob pattern, file extensions and a maximum depth."
     )
     args_schema: Type[BaseModel] = DirectoryReadToolSchema
     directory: Optional[str] = None
     ignored: List[str] = []
+    page_size: int = 200
+    file_cache: Optional[Any] = None  # RunFileCache memoizing listings until the next write
 
     def __init__(self, directory: Optional[str] = None, ignored: Optional[List[str]] = None, **kwargs):
         super().__init__(**kwargs)
         if directory is not None:
             self.directory = directory
-            self.description = f"A tool that can be used to list {directory}'s content."
+            self.description = (
+                f"A tool that can be used to list {directory}'s content, page by page. "
+                "Supports a sub-directory, a glob pattern, file extensions and a maximum depth."
+            )
             self.args_schema = FixedDirectoryReadToolSchema
             self._generate_description()
         if ignored:
@@ -42,19 +147,58 @@ class DirectoryReadTool(BaseTool):
         self,
         **kwargs: Any,
     ) -> Any:
-        directory = kwargs.get("directory", self.directory)
-        ignored = kwargs.get("ignored", self.ignored) or []
+        directory = kwargs.get("directory") or self.directory
+        ignored = kwargs.get("ignored") or self.ignored or []
+        directory = directory.rstrip("/") or "/"
+        try:
+            if self.file_cache is not None:
+                files = self.file_cache.listing((directory, tuple(ignored)), lambda: self._list(directory, ignored))
+            else:
+                files = self._list(directory, ignored)
+        except Exception as e:
+            return f"Error listing directory {directory}: {str(e)}"
+        return self._render(directory, files, kwargs)
+
+    def _list(self, directory: str, ignored: List[str]) -> List[str]:
+        files = _git_files(directory)
+        if files is None:
+            files = _walk_files(directory)
+        ignored = set(ignored)
+        return sorted(f for f in files if not ignored.intersection(f.split("/")[:-1]))
 
-        if directory[-1] == "/":
-            directory = directory[:-1]
+    def _render(self, directory: str, files: List[str], options: Dict[str, Any]) -> str:
+        path = (options.get("path") or "").strip("/")
+        if path in (".", directory.strip("/")):
+            path = ""
+        pattern = options.get("pattern")
+        extensions = [e if e.startswith(".") else f".{e}" for e in options.get("extensions") or []]
+        max_depth = options.get("max_depth")
 
-        files_list = []
-        for root, dirs, files in os.walk(directory):
-            dirs[:] = [d for d in dirs if d not in ignored]
+        entries: List[str] = []
+        collapsed: Dict[str, int] = {}
+        for f in files:
+            if path and not f.startswith(path + "/"):
+                continue
+            if extensions and not f.endswith(tuple(extensions)):
+                continue
+            if pattern and not (fnmatch.fnmatch(f, pattern) or ("/" not in pattern and fnmatch.fnmatch(os.path.basename(f), pattern))):
+                continue
+            parts = f[len(path) + 1:].split("/") if path else f.split("/")
+            if max_depth and len(parts) > max_depth:
+                prefix = "/".join(([path] if path else []) + parts[:max_depth]) + "/"
+                collapsed[prefix] = collapsed.get(prefix, 0) + 1
+                continue
+            entries.append(f)
+        entries = sorted(entries + list(collapsed))
 
-            for filename in files:
-                rel_path = os.path.join(root, filename).replace(directory, "").lstrip(os.path.sep)
-                files_list.append(f"{directory}/{rel_path}")
+        cursor = options.get("cursor")
+        start = bisect_right(entries, cursor) if cursor else 0
+        page = entries[start:start + self.page_size]
+        if not page:
+            return f"No files found in {directory}/{path}".rstrip("/")
 
-        files = "\n- ".join(files_list)
-        return f"File paths: \n-{files}"
+        lines = [f"{directory}/{e}" + (f" ({collapsed[e]} files)" if e in collapsed else "") for e in page]
+        result = f"File paths ({start + 1}-{start + len(page)} of {len(entries)}): \n- " + "\n- ".join(lines)
+        if start + len(page) < len(entries):
+            result += f"\nMore entries available, call again with cursor=\"{page[-1]}\""
+        return result
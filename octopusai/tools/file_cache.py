@@ -0,0 +1,177 @@
+"""Run scoped file cache shared by the file tools of all agents.
+
+Reads by octopusai.tools.file_read.FileReadTool are served from memory while a file's
+(mtime, size) is unchanged. When an agent reads a whole file again that did not change
+since its own last read, it gets a short marker instead of the content, which is
+already in its context. The marker memory of an
+agent is dropped when it starts a new task (e.g. a new delegation from the manager), as
+the new execution does not see the earlier observations. Writes through
+CachedFileWriterTool and CachedFileEditTool invalidate the file and the cached directory
+listings.
+"""
+
+import os
+import threading
+import weakref
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, Type
+
+from crewai.tools import BaseTool
+from crewai.utilities.events import crewai_event_bus
+from crewai.utilities.events.agent_events import AgentExecutionStartedEvent
+from crewai_tools import FileWriterTool
+from pydantic import BaseModel, Field
+
+_caches: "weakref.WeakSet[RunFileCache]" = weakref.WeakSet()
+_handler_registered = False
+_handler_lock = threading.Lock()
+
+
+def _on_agent_execution_started(source: Any, event: AgentExecutionStartedEvent) -> None:
+    for cache in list(_caches):
+        cache.forget_reader(event.agent.role)
+
+
+class RunFileCache:
+    def __init__(self):
+        self.step = 0
+        self.reads = 0
+        self.hits = 0  # Served from memory
+        self.unchanged = 0  # Answered with the unchanged marker
+        self._files: Dict[str, Tuple[Tuple[int, int], str]] = {}  # path -> ((mtime_ns, size), content)
+        self._seen: Dict[Tuple[str, str], Tuple[int, Tuple[int, int]]] = {}  # (reader, path) -> (step, signature)
+        self._listings: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()
+
+        global _handler_registered
+        with _handler_lock:
+            if not _handler_registered:
+                crewai_event_bus.register_handler(AgentExecutionStartedEvent, _on_agent_execution_started)
+                _handler_registered = True
+        _caches.add(self)
+
+    def read(self, path: str, reader: str = "", whole_file: bool = True) -> Tuple[str, Optional[int]]:
+        """
+        Return the content of `path` and, for whole file reads, the step of `reader`'s last read if the file
+        is unchanged since then (None otherwise).
+        """
+        path = os.path.realpath(path)
+        st = os.stat(path)
+        signature = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            self.step += 1
+            self.reads += 1
+            step = self.step
+            entry = self._files.get(path)
+        if entry is not None and entry[0] == signature:
+            content = entry[1]
+            with self._lock:
+                self.hits += 1
+        else:
+            with open(path, "r") as f:
+                content = f.read()
+            with self._lock:
+                self._files[path] = (signature, content)
+
+        if not whole_file:
+            return content, None
+        with self._lock:
+            previous = self._seen.get((reader, path))
+            self._seen[(reader, path)] = (step, signature)
+            if previous is not None and previous[1] == signature:
+                self.unchanged += 1
+                return content, previous[0]
+        return content, None
+
+    def invalidate(self, path: str) -> None:
+        path = os.path.realpath(path)
+        with self._lock:
+            self._files.pop(path, None)
+            for key in [key for key in self._seen if key[1] == path]:
+                del self._seen[key]
+            self._listings.clear()
+
+    def forget_reader(self, reader: str) -> None:
+        with self._lock:
+            for key in [key for key in self._seen if key[0] == reader]:
+                del self._seen[key]
+
+    def listing(self, key: Hashable, produce: Callable[[], Any]) -> Any:
+        """
+        Directory listing memoized until the next write.
+        """
+        with self._lock:
+            if key in self._listings:
+                return self._listings[key]
+        result = produce()
+        with self._lock:
+            self._listings[key] = result
+        return result
+
+    def stats(self) -> str:
+        return f"{self.reads} reads, {self.hits} served from memory, {self.unchanged} answered as unchanged"
+
+
+class CachedFileWriterTool(FileWriterTool):
+    """
+    FileWriterTool invalidating the written file in a RunFileCache.
+    """
+
+    file_cache: RunFileCache
+
+    def _run(self, **kwargs: Any) -> str:
+        result = super()._run(**kwargs)
+        if "filename" in kwargs:
+            self.file_cache.invalidate(os.path.join(kwargs.get("directory") or "", kwargs["filename"]))
+        return result
+
+
+class FileEditToolSchema(BaseModel):
+    """Input for CachedFileEditTool."""
+
+    file_path: str = Field(..., description="Path of the file to change")
+    old_text: str = Field(..., description="Exact text to replace, including indentation; it must occur exactly once in the file")
+    new_text: str = Field(..., description="Text to put in its place")
+
+
+class CachedFileEditTool(BaseTool):
+    """
+    Replaces one snippet of a file, so that a file read in parts (a symbol or a line range) can be changed
+    without writing it whole. Invalidates the file in a RunFileCache.
+    """
+
+    name: str = "Edit a file"
+    description: str = (
+        "Change an existing file by replacing an exact snippet of it (old_text, which must occur exactly once, "
+        "with enough surrounding lines to be unique) with new_text. The rest of the file is kept as is."
+    )
+    args_schema: Type[BaseModel] = FileEditToolSchema
+    file_cache: RunFileCache
+    root_dir: Optional[str] = None  # Relative paths are resolved against it
+
+    def _run(self, file_path: str, old_text: str, new_text: str) -> str:
+        if self.root_dir and not os.path.isabs(file_path):
+            file_path = os.path.join(self.root_dir, file_path)
+        if not old_text:
+            return "Error: old_text must not be empty, use the file writer tool to create files"
+        try:
+            with open(file_path, "r") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return f"Error: File not found at path: {file_path}"
+        except Exception as e:
+            return f"Error: Failed to read file {file_path}. {str(e)}"
+        count = content.count(old_text)
+        if count == 0:
+            return f"Error: old_text not found in {file_path}"
+        if count > 1:
+            return f"Error: old_text found {count} times in {file_path}, add surrounding lines to make it unique"
+        try:
+            with open(file_path, "w") as f:
+                f.write(content.replace(old_text, new_text, 1))
+        except Exception as e:
+            return f"Error: Failed to write file {file_path}. {str(e)}"
+        finally:
+            self.file_cache.invalidate(file_path)
+        line = content[:content.index(old_text)].count("\n") + 1
+        lines = len(old_text.splitlines())
+        return f"Replaced {lines} line(s) at line {line} of {file_path}"
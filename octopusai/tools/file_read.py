@@ -0,0 +1,201 @@
+import ast
+import bisect
+import mmap
+import os
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple, Type
+
+from crewai.tools import BaseTool
+from pydantic import BaseModel, Field
+
+from octopusai.tools.context_packer import count_tokens
+
+# Files above this size are sliced through mmap instead of being read whole
+MMAP_THRESHOLD = 1024 * 1024
+# Bytes decoded per token of the read's budget, the rest of a large slice is left to the cursor
+MMAP_BYTES_PER_TOKEN = 8
+
+_DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+class FileReadToolSchema(BaseModel):
+    """Input for FileReadTool."""
+
+    file_path: str = Field(..., description="Path of the file to read")
+    start_line: Optional[int] = Field(default=None, description="First line to read (1-indexed)")
+    end_line: Optional[int] = Field(default=None, description="Last line to read (inclusive)")
+    symbol: Optional[str] = Field(default=None, description="Read only the definition of this function/class, e.g. 'MyClass.method'")
+    cursor: Optional[str] = Field(default=None, description="Cursor from a truncated read to get the next part")
+
+
+# (path, mtime_ns, size) -> offsets of the line starts
+_line_indexes: "OrderedDict[Tuple[str, int, int], array]" = OrderedDict()
+_line_indexes_lock = threading.Lock()
+_LINE_INDEX_ENTRIES = 16
+
+
+def _line_index(path: str, mm: mmap.mmap, st: os.stat_result) -> array:
+    key = (path, st.st_mtime_ns, st.st_size)
+    with _line_indexes_lock:
+        index = _line_indexes.get(key)
+        if index is not None:
+            _line_indexes.move_to_end(key)
+            return index
+    index = array("q", [0])
+    pos = mm.find(b"\n")
+    while pos != -1:
+        index.append(pos + 1)
+        pos = mm.find(b"\n", pos + 1)
+    if index[-1] == len(mm):
+        index.pop()  # Trailing newline
+    with _line_indexes_lock:
+        _line_indexes[key] = index
+        while len(_line_indexes) > _LINE_INDEX_ENTRIES:
+            _line_indexes.popitem(last=False)
+    return index
+
+
+def _read_lines_mmap(path: str, start: int, end: Optional[int], max_bytes: int) -> Tuple[List[str], int, int]:
+    """
+    Lines start..end (1-indexed, inclusive) of a large file, but only as many whole lines as fit in `max_bytes`
+    (at least one), the total number of lines and the end of the range.
+    """
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            index = _line_index(path, mm, st)
+            total = len(index)
+            end = total if end is None else min(end, total)
+            if start > end:
+                return [], total, end
+            # Lines ending within the budget: line k ends where line k + 1 starts, the last one at the end of the file
+            limit = index[start - 1] + max_bytes
+            last = end if limit >= len(mm) else min(end, max(start, bisect.bisect_right(index, limit) - 1))
+            stop = index[last] if last < total else len(mm)
+            text = mm[index[start - 1]:stop].decode("utf-8", errors="replace")
+    return text.splitlines(keepends=True), total, end
+
+
+def _python_symbol(source: str, symbol: str) -> Optional[Tuple[int, int]]:
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return None
+    node: ast.AST = tree
+    for name in symbol.split("."):
+        # Breadth first, the outermost definition with the name wins
+        node = next((n for n in ast.walk(node) if n is not node and isinstance(n, _DEFINITIONS) and n.name == name), None)
+        if node is None:
+            return None
+    start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+    return start, node.end_lineno
+
+
+def _indented_symbol(lines: List[str], symbol: str) -> Optional[Tuple[int, int]]:
+    """
+    Fallback for other languages: from the line defining the name to the next line at the same or a lower indentation.
+    """
+    name = re.escape(symbol.split(".")[-1])
+    definition = re.compile(rf"^\s*(?:[\w@]+\s+)*(?:def|class|function|func|fn|interface|struct|enum|type)\s+{name}\b")
+    for i, line in enumerate(lines):
+        if definition.match(line):
+            indent = len(line) - len(line.lstrip())
+            for j in range(i + 1, len(lines)):
+                stripped = lines[j].strip()
+                if not stripped:
+                    continue
+                if len(lines[j]) - len(lines[j].lstrip()) <= indent:
+                    # Keep a closing brace with the definition
+                    return i + 1, j + 1 if stripped[0] in "}])" else j
+            return i + 1, len(lines)
+    return None
+
+
+class FileReadTool(BaseTool):
+    name: str = "Read a file's content"
+    description: str = (
+        "A tool that reads the content of a file. Provide 'file_path', and optionally 'start_line'/'end_line' "
+        "to read a range of lines or 'symbol' to read the definition of a function or class. "
+        "Long results are truncated with a 'cursor' to read the rest."
+    )
+    args_schema: Type[BaseModel] = FileReadToolSchema
+    root_dir: Optional[str] = None  # Relative paths are resolved against it
+    max_tokens: int = 4000
+    file_cache: Optional[Any] = None  # RunFileCache shared with the other agents' tools
+    reader: str = ""  # Agent role, for the file_cache's unchanged markers
+
+    def _run(
+        self,
+        file_path: str,
+        start_line: Optional[int] = None,
+        end_line: Optional[int] = None,
+        symbol: Optional[str] = None,
+        cursor: Optional[str] = None,
+    ) -> str:
+        if self.root_dir and not os.path.isabs(file_path):
+            file_path = os.path.join(self.root_dir, file_path)
+        if cursor:
+            try:
+                start_line, end_line = (int(x) if x else None for x in cursor.split(":"))
+            except ValueError:
+                return f"Error: Invalid cursor {cursor}"
+        try:
+            whole_file = not (start_line or end_line or symbol)
+            start = max(start_line or 1, 1)
+
+            size = os.path.getsize(file_path)
+            if size > MMAP_THRESHOLD and not symbol:
+                lines, total, end = _read_lines_mmap(file_path, start, end_line,
+                                                     max_bytes=self.max_tokens * MMAP_BYTES_PER_TOKEN)
+            else:
+                if self.file_cache is not None:
+                    content, unchanged_since = self.file_cache.read(file_path, self.reader, whole_file=whole_file)
+                    if unchanged_since is not None and count_tokens(content) <= self.max_tokens:
+                        return (f"{file_path} is unchanged since your last read at step {unchanged_since}, "
+                                f"use the content from that observation.")
+                else:
+                    with open(file_path, "r", errors="replace") as f:
+                        content = f.read()
+                all_lines = content.splitlines(keepends=True)
+                total = len(all_lines)
+                if symbol and not cursor:
+                    found = _python_symbol(content, symbol) if file_path.endswith(".py") else None
+                    found = found or _indented_symbol(all_lines, symbol)
+                    if found is None:
+                        return f"Error: Symbol {symbol} not found in {file_path}"
+                    start, end_line = found
+                end = total if end_line is None else min(end_line, total)
+                lines = all_lines[start - 1:end]
+        except FileNotFoundError:
+            return f"Error: File not found at path: {file_path}"
+        except PermissionError:
+            return f"Error: Permission denied when trying to read file: {file_path}"
+        except Exception as e:
+            return f"Error: Failed to read file {file_path}. {str(e)}"
+
+        if not lines:
+            if start > 1:
+                return f"Error: Start line {start} exceeds the number of lines in the file ({total})."
+            return ""
+
+        # Token cap, always returning at least one line
+        budget, taken = self.max_tokens, 0
+        for line in lines:
+            budget -= count_tokens(line)
+            if budget < 0 and taken:
+                break
+            taken += 1
+        text = "".join(lines[:taken])
+        last = start + taken - 1
+
+        if whole_file and last == end:
+            return text
+        header = f"[{file_path} lines {start}-{last} of {total}]\n"
+        if last < end:
+            remaining_end = "" if end_line is None or end == total else str(end)
+            text += (f"\n[Truncated at line {last} of {end} (token limit), "
+                     f"call again with cursor=\"{last + 1}:{remaining_end}\" to read the rest]")
+        return header + text
@@ -1,27 +1,282 @@
+import fcntl
+import hashlib
+import os
+import re
+import shutil
+import subprocess
 import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Set, Tuple
+from urllib.parse import urlparse
 import git
 from crewai.tools import BaseTool
+from octopusai.paths import cache_path, work_path
+
+_locks_guard = threading.Lock()
+_locks: dict[str, "_RepoLock"] = {}
+
+class _RepoLock:
+    """
+    Re-entrant lock which is held across threads (RLock) and processes (flock).
+    """
+
+    def __init__(self, lock_file: str):
+        self.lock_file = lock_file
+        self.rlock = threading.RLock()
+        self.depth = 0
+        self.handle = None
+
+    def acquire(self):
+        self.rlock.acquire()
+        if self.depth == 0:
+            self.handle = open(self.lock_file, "w")
+            fcntl.flock(self.handle, fcntl.LOCK_EX)
+        self.depth += 1
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
+            self.handle = None
+        self.rlock.release()
+
+@contextmanager
+def repo_lock(path: str):
+    """
+    Serialize git operations on the repository at `path`, within and across processes.
+    """
+    key = os.path.realpath(path)
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            digest = hashlib.sha1(key.encode()).hexdigest()
+            lock = _locks[key] = _RepoLock(os.path.join(cache_path("locks"), f"{digest}.lock"))
+    lock.acquire()
+    try:
+        yield
+    finally:
+        lock.release()
+
+def repo_slug(repository_url: str) -> str:
+    """
+    Return the owner/repo part of a GitHub URL, e.g. https://github.com/owner/repo.git -> owner/repo.
+    """
+    path = urlparse(repository_url).path or repository_url
+    path = path.strip("/")
+    if path.endswith(".git"):
+        path = path[:-4]
+    return "/".join(path.split("/")[-2:])
+
+# Working copies of earlier runs are removed after this many hours (0 keeps them), they are kept for a while
+# to inspect a run's result, e.g. fixes QA did not verify which are left uncommitted
+WORK_TTL_H = float(os.environ.get("OCTOPUSAI_WORK_TTL_H", "24"))
+
+def prune_work_dirs(ttl_s: float = WORK_TTL_H * 3600) -> None:
+    """
+    Remove the working copies (apr_* directories of work_path()) not modified for `ttl_s` seconds.
+    """
+    if ttl_s <= 0:
+        return
+    root = work_path()
+    now = time.time()
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            if name.startswith("apr_") and os.path.isdir(path) and now - os.path.getmtime(path) > ttl_s:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+def index_store_dir(repo_dir: str) -> str:
+    """
+    Directory of the persisted indexes of the repository cloned in `repo_dir`, keyed by owner/repo (of origin's
+    push URL, which is GitHub for mirrored clones too) so that the per-run clones of a repository share them.
+    Falls back to the clone's git directory without an origin.
+    """
+    res = subprocess.run(["git", "-C", repo_dir, "remote", "get-url", "--push", "origin"], capture_output=True, text=True)
+    if res.returncode == 0 and res.stdout.strip():
+        return cache_path("indexes", repo_slug(res.stdout.strip()))
+    git_dir = subprocess.run(["git", "-C", repo_dir, "rev-parse", "--absolute-git-dir"],
+                             capture_output=True, text=True, check=True).stdout.strip()
+    return os.path.join(git_dir, "octopusai")
+
+def update_mirror(repository_url: str) -> str:
+    """
+    Create or incrementally update the local bare mirror of a repository.
+    Mirrors are keyed by owner/repo, so all runs against the same repository share one object store.
+    """
+    mirror_dir = os.path.join(cache_path("mirrors"), f"{repo_slug(repository_url)}.git")
+    with repo_lock(mirror_dir):
+        if os.path.isdir(mirror_dir):
+            # The mirror refspec (+refs/*:refs/*) also brings in refs/pull/*, so PR heads are local afterwards.
+            git.Repo(mirror_dir).git.fetch("origin", "--prune")
+        else:
+            os.makedirs(os.path.dirname(mirror_dir), exist_ok=True)
+            partial_dir = tempfile.mkdtemp(prefix=".partial_", dir=os.path.dirname(mirror_dir))
+            try:
+                mirror = git.Repo.clone_from(repository_url, partial_dir, mirror=True)
+                # Working copies borrow objects from the mirror, never let gc drop them.
+                with mirror.config_writer() as config:
+                    config.set_value("gc", "pruneExpire", "never")
+                    config.set_value("gc", "reflogExpireUnreachable", "never")
+                os.rename(partial_dir, mirror_dir)
+            except Exception:
+                shutil.rmtree(partial_dir, ignore_errors=True)
+                raise
+    return mirror_dir
+
+def is_partial_clone(repo_dir: str) -> bool:
+    # extensions.partialClone, or a promisor remote as written by older git versions
+    res = subprocess.run(["git", "-C", repo_dir, "config", "--get-regexp", r"^(extensions\.partialclone|remote\..*\.promisor)$"],
+                         capture_output=True, text=True)
+    return any(value.lower() not in ("false", "0", "no", "off") for _, _, value in
+               (line.partition(" ") for line in res.stdout.splitlines()))
+
+
+def local_blobs(repo_dir: str) -> Set[str]:
+    """
+    Ids of the blobs present in the object store of `repo_dir`, without fetching missing ones.
+    """
+    out = subprocess.run(
+        ["git", "-C", repo_dir, "cat-file", "--batch-all-objects", "--unordered",
+         "--batch-check=%(objecttype) %(objectname)"],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return {line[5:] for line in out.splitlines() if line.startswith("blob ")}
+
+
+def head_blobs(repo_dir: str, local_only: bool = True) -> List[Tuple[str, str]]:
+    """
+    (path, blob id) of every file in the HEAD commit of `repo_dir`. In a partial clone (sparse clone mode)
+    only the blobs present locally unless `local_only` is False, as reading the others would fetch them
+    from the remote one by one.
+    """
+    out = subprocess.run(
+        ["git", "-C", repo_dir, "-c", "core.quotePath=false", "ls-tree", "-r", "--full-tree", "HEAD"],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    blobs = []
+    # <mode> SP <type> SP <blob> TAB <path>
+    for line in out.splitlines():
+        meta, _, path = line.partition("\t")
+        _, kind, blob = meta.split()
+        if kind == "blob":
+            blobs.append((path, blob))
+    if local_only and is_partial_clone(repo_dir):
+        present = local_blobs(repo_dir)
+        blobs = [(path, blob) for path, blob in blobs if blob in present]
+    return blobs
+
+
+def read_blobs(repo_dir: str, blobs: List[str]) -> List[Optional[str]]:
+    """
+    Contents of `blobs` with a single `git cat-file --batch`, None for blobs missing from a partial clone
+    (never fetched, with git >= 2.44).
+    """
+    if not blobs:
+        return []
+    env = {**os.environ, "GIT_NO_LAZY_FETCH": "1"}
+    out = subprocess.run(["git", "-C", repo_dir, "cat-file", "--batch"], input=("\n".join(blobs) + "\n").encode(),
+                         capture_output=True, check=True, env=env).stdout
+    contents: List[Optional[str]] = []
+    pos = 0
+    for _ in blobs:
+        header_end = out.index(b"\n", pos)
+        header = out[pos:header_end].split()
+        if header[-1] == b"missing":
+            contents.append(None)
+            pos = header_end + 1
+            continue
+        size = int(header[2])
+        contents.append(out[header_end + 1:header_end + 1 + size].decode("utf-8", errors="replace"))
+        pos = header_end + 1 + size + 1
+    return contents
+
+
+def sparse_pattern(path: str) -> str:
+    """
+    Non-cone sparse checkout pattern matching exactly `path` (a file or directory relative to the repository root).
+    The patterns are gitignore patterns: without the leading "/" `util.py` would match util.py in every directory,
+    and glob characters or a leading "#"/"!" in the path would be read as pattern syntax.
+    """
+    path = re.sub(r"([\\*?\[\]!#])", r"\\\1", path.strip("/"))
+    if path.endswith(" "):
+        path = path[:-1] + "\\ "
+    return "/" + path
+
 
 class Clone(BaseTool):
     name: str = "Git Clone Tool"
     description: str = "Clones a GitHub repository with the given URL to a temporary directory."
     repository_url: str = ""
+    use_mirror: bool = True
+    sparse_paths: Optional[List[str]] = None
+    pr_number: Optional[int] = None
+    depth: int = 50
+    max_deepen: int = 10
 
-    def __init__(self, repository_url: str):
+    def __init__(self, repository_url: str, use_mirror: bool = True, sparse_paths: Optional[List[str]] = None,
+                 pr_number: Optional[int] = None, depth: int = 50):
         super().__init__()
         self.repository_url = repository_url
+        self.use_mirror = use_mirror
+        self.sparse_paths = sparse_paths
+        self.pr_number = pr_number
+        self.depth = depth
 
     def _run(self) -> str:
         """
         Clone a GitHub repository to a temporary directory.
+
+        With use_mirror, the repository is fetched incrementally into a bare mirror under the cache directory
+        and the working copy is a --shared clone of it: only the checkout is written, objects are borrowed.
+        The working copy's origin fetches from the mirror and pushes to GitHub.
+
+        With sparse_paths, a partial clone is made instead (see _sparse_clone), the mirror is not used.
         """
         try:
-            temp_dir = tempfile.mkdtemp(prefix="apr_", dir="/Users/kun/tmp/octopusai")
-            git.Repo.clone_from(self.repository_url, temp_dir)
+            prune_work_dirs()
+            temp_dir = tempfile.mkdtemp(prefix="apr_", dir=work_path())
+            if self.sparse_paths is not None:
+                self._sparse_clone(temp_dir)
+                return temp_dir
+            if not self.use_mirror:
+                git.Repo.clone_from(self.repository_url, temp_dir)
+                return temp_dir
+            mirror_dir = update_mirror(self.repository_url)
+            repo = git.Repo.clone_from(mirror_dir, temp_dir, shared=True)
+            repo.remote("origin").set_url(self.repository_url, push=True)
             return temp_dir
         except Exception as e:
             return f"Error cloning repository: {str(e)}"
 
+    def _sparse_clone(self, temp_dir: str) -> None:
+        """
+        Blobless (--filter=blob:none), shallow clone of the default branch, deepened until the merge base with
+        the PR head is reachable, with only sparse_paths checked out. Blobs of other files are fetched lazily
+        by git if something (e.g. git diff) needs them.
+        """
+        repo = git.Repo.clone_from(self.repository_url, temp_dir, filter="blob:none", no_checkout=True,
+                                   depth=self.depth)
+        base_branch = repo.active_branch.name
+        if self.pr_number is not None:
+            pr_ref = f"pull/{self.pr_number}/head"
+            repo.git.fetch("origin", f"--depth={self.depth}", pr_ref)
+            pr_head = repo.git.rev_parse("FETCH_HEAD")
+            for _ in range(self.max_deepen):
+                try:
+                    repo.git.merge_base(base_branch, pr_head)
+                    break
+                except git.GitCommandError:
+                    repo.git.fetch("origin", f"--deepen={self.depth}", base_branch, pr_ref)
+            else:
+                repo.git.fetch("origin", "--unshallow", base_branch, pr_ref)
+        repo.git.sparse_checkout("set", "--no-cone", *[sparse_pattern(p) for p in self.sparse_paths])
+        repo.git.checkout(base_branch)
+
 class Diff(BaseTool):
     name: str = "Git Diff Tool"
     description: str = "Generates a diff of the changes in the cloned repository."
@@ -36,9 +291,10 @@ class Diff(BaseTool):
             # Go to repo
             repo = git.Repo(repo_dir)
             assert not repo.bare, "Repository is invalid"
-            # Fetch the PR from GitHub
+            # Fetch the PR from origin (the local mirror for mirrored clones, GitHub otherwise)
             fetch_ref = f"pull/{pr_number}/head:{pr_local_branch}"
-            repo.git.fetch(remote_name, fetch_ref)
+            with repo_lock(repo_dir):
+                repo.git.fetch(remote_name, fetch_ref)
             # Generate the diff
             if incremental:
                 diff = repo.git.diff(f"{base_branch}...{pr_local_branch}")
@@ -58,7 +314,8 @@ class Checkout(BaseTool):
         """
         try:
             repo = git.Repo(repo_dir)
-            repo.git.checkout(branch_name)
+            with repo_lock(repo_dir):
+                repo.git.checkout(branch_name)
             return f"Checked out to branch: {branch_name}"
         except Exception as e:
             return f"Error checking out branch: {str(e)}"
@@ -76,7 +333,8 @@ class PatchApply(BaseTool):
             patch_file = tempfile.NamedTemporaryFile(delete=False, suffix=".patch")
             patch_file.write(patch_content.encode())
             patch_file.close()
-            repo.git.apply(patch_file.name)
+            with repo_lock(repo_dir):
+                repo.git.apply(patch_file.name)
             return f"Patch applied successfully."
         except Exception as e:
             return f"Error applying patch: {str(e)}"
@@ -91,8 +349,9 @@ class Commit(BaseTool):
         """
         try:
             repo = git.Repo(repo_dir)
-            repo.git.add(A=True)  # Stage all changes
-            repo.index.commit(commit_message)
+            with repo_lock(repo_dir):
+                repo.git.add(A=True)  # Stage all changes
+                repo.index.commit(commit_message)
             return f"Changes committed with message: {commit_message}"
         except Exception as e:
             return f"Error committing changes: {str(e)}"
@@ -108,7 +367,8 @@ class Push(BaseTool):
         try:
             repo = git.Repo(repo_dir)
             origin = repo.remote(name='origin')
-            origin.push(branch_name)
+            with repo_lock(repo_dir):
+                origin.push(branch_name)
             return f"Changes pushed to branch: {branch_name}"
         except Exception as e:
             return f"Error pushing changes: {str(e)}"
\ No newline at end of file
@@ -0,0 +1,175 @@
+"""Process wide GitHub client shared by the GitHub tools.
+
+Building a GitHubAPIWrapper authenticates the GitHub App (several API calls) and opens a
+new HTTP session, so wrappers are created once per repository and reused. Their HTTP
+session keeps connections alive and answers GET requests from an on-disk cache
+validated with ETag / If-None-Match: an unchanged resource costs a 304, which does not
+count against the rate limit.
+"""
+
+import importlib.metadata
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import requests
+from github.Requester import HTTPRequestsConnectionClass, HTTPSRequestsConnectionClass, Requester
+from langchain_community.utilities.github import GitHubAPIWrapper
+from requests.structures import CaseInsensitiveDict
+
+from octopusai.paths import cache_path
+
+HTTP_CACHE_ENABLED = os.environ.get("OCTOPUSAI_GITHUB_HTTP_CACHE", "1") != "0"
+# PyGithub versions whose connection classes (session, retry, pool_size) CachingHTTPSConnectionClass is written against
+PYGITHUB_SUPPORTED = ((2, 0), (3, 0))
+
+
+def _pygithub_supported() -> bool:
+    try:
+        version = tuple(int(x) for x in importlib.metadata.version("PyGithub").split(".")[:2])
+    except (importlib.metadata.PackageNotFoundError, ValueError):
+        return False
+    return PYGITHUB_SUPPORTED[0] <= version < PYGITHUB_SUPPORTED[1] and hasattr(Requester, "injectConnectionClasses")
+
+
+class HttpCache:
+    """
+    ETag keyed store of GET responses in a SQLite file, trimmed to the most recently used max_entries.
+    """
+
+    def __init__(self, path: str, max_entries: int = 20000):
+        self.path = path
+        self.max_entries = max_entries
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, etag TEXT, headers TEXT, body BLOB, used REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key: str) -> Optional[Tuple[str, Dict[str, str], bytes]]:
+        with self._connect() as db:
+            row = db.execute("SELECT etag, headers, body FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE responses SET used = ? WHERE key = ?", (time.time(), key))
+        return row[0], json.loads(row[1]), row[2]
+
+    def put(self, key: str, etag: str, headers: Dict[str, str], body: bytes) -> None:
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, etag, headers, body, used) VALUES (?, ?, ?, ?, ?)",
+                (key, etag, json.dumps(headers), body, time.time()),
+            )
+            db.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+
+class ETagCacheAdapter(requests.adapters.HTTPAdapter):
+    """
+    HTTP adapter which revalidates cached GET responses with If-None-Match and turns a 304 back into the cached 200.
+    """
+
+    def __init__(self, cache: HttpCache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if request.method != "GET":
+            return super().send(request, **kwargs)
+
+        # GitHub validates the ETag per caller, so the token does not need to be part of the key
+        key = f"{request.url} {request.headers.get('Accept', '')}"
+        cached = self.cache.get(key)
+        if cached is not None:
+            request.headers["If-None-Match"] = cached[0]
+        response = super().send(request, **kwargs)
+
+        if response.status_code == 304 and cached is not None:
+            etag, headers, body = cached
+            replay = requests.Response()
+            replay.status_code = 200
+            replay.reason = "OK"
+            replay.headers = CaseInsensitiveDict(headers)
+            # Rate limit and date headers are fresh
+            replay.headers.update(response.headers)
+            replay._content = body
+            replay.encoding = requests.utils.get_encoding_from_headers(replay.headers)
+            replay.url = response.url
+            replay.request = request
+            replay.connection = self
+            return replay
+
+        etag = response.headers.get("ETag")
+        if response.status_code == 200 and etag:
+            self.cache.put(key, etag, dict(response.headers), response.content)
+        return response
+
+
+_http_cache: Optional[HttpCache] = None
+
+
+def _get_http_cache() -> HttpCache:
+    global _http_cache
+    if _http_cache is None:
+        _http_cache = HttpCache(os.path.join(cache_path("http"), "github.sqlite"))
+    return _http_cache
+
+
+class CachingHTTPSConnectionClass(HTTPSRequestsConnectionClass):
+    """
+    PyGithub connection whose session uses the ETagCacheAdapter.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.adapter = ETagCacheAdapter(
+            _get_http_cache(),
+            max_retries=self.retry,
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+        )
+        self.session.mount("https://", self.adapter)
+
+
+_wrappers: Dict[str, GitHubAPIWrapper] = {}
+_wrappers_lock = threading.Lock()
+
+
+def get_github_wrapper(repo: str, active_branch: Optional[str] = None, base_branch: Optional[str] = None) -> GitHubAPIWrapper:
+    """
+    Return the shared GitHubAPIWrapper for `repo`. Branches are per call settings, a copy sharing the client is returned
+    when they are given.
+    """
+    with _wrappers_lock:
+        gh = _wrappers.get(repo)
+        if gh is None:
+            if HTTP_CACHE_ENABLED and _pygithub_supported():
+                # Requesters take the connection class when they are created. The injection also disables
+                # persistent connections while it is active, it is reset once the wrapper's requester exists.
+                Requester.injectConnectionClasses(HTTPRequestsConnectionClass, CachingHTTPSConnectionClass)
+                try:
+                    gh = GitHubAPIWrapper(github_repository=repo)
+                finally:
+                    Requester.resetConnectionClasses()
+            else:
+                if HTTP_CACHE_ENABLED:
+                    print("GitHub HTTP cache disabled: unsupported PyGithub version")
+                gh = GitHubAPIWrapper(github_repository=repo)
+            _wrappers[repo] = gh
+
+    update = {}
+    if active_branch is not None:
+        update["active_branch"] = active_branch
+    if base_branch is not None:
+        update["github_base_branch"] = base_branch
+    return gh.model_copy(update=update) if update else gh
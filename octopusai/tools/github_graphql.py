@@ -0,0 +1,194 @@
+"""Pull request metadata in one GraphQL round-trip.
+
+The REST based GetPullRequest issues separate requests for the PR, its comments and
+commits, and the changed files need yet another one. fetch_pull_request asks for all
+of it in a single GraphQL query and only goes back for further pages of connections
+which did not fit in the first response.
+"""
+
+from typing import Any, Dict, List, Optional, Type
+
+from crewai.tools import BaseTool
+from pydantic import BaseModel, Field
+
+from octopusai.tools.github_client import get_github_wrapper
+
+PAGE_SIZE = 100
+
+PULL_REQUEST_QUERY = """
+query(
+  $owner: String!, $name: String!, $number: Int!,
+  $withFiles: Boolean!, $filesCursor: String,
+  $withCommits: Boolean!, $commitsCursor: String,
+  $withComments: Boolean!, $commentsCursor: String,
+  $withThreads: Boolean!, $threadsCursor: String
+) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      number title body url state
+      baseRefName headRefName baseRefOid headRefOid
+      additions deletions changedFiles
+      files(first: %(page)d, after: $filesCursor) @include(if: $withFiles) {
+        pageInfo { hasNextPage endCursor }
+        nodes { path additions deletions changeType }
+      }
+      commits(first: %(page)d, after: $commitsCursor) @include(if: $withCommits) {
+        pageInfo { hasNextPage endCursor }
+        nodes { commit { oid messageHeadline author { name } } }
+      }
+      comments(first: %(page)d, after: $commentsCursor) @include(if: $withComments) {
+        pageInfo { hasNextPage endCursor }
+        nodes { author { login } body }
+      }
+      reviewThreads(first: %(page)d, after: $threadsCursor) @include(if: $withThreads) {
+        pageInfo { hasNextPage endCursor }
+        nodes { comments(first: %(page)d) { nodes { author { login } body path line } } }
+      }
+    }
+  }
+}
+""" % {"page": PAGE_SIZE}
+
+
+class PullRequestFile(BaseModel):
+    path: str
+    additions: int = 0
+    deletions: int = 0
+    change_type: str = "MODIFIED"
+
+
+class PullRequestCommit(BaseModel):
+    oid: str
+    message: str = ""
+    author: Optional[str] = None
+
+
+class PullRequestComment(BaseModel):
+    author: Optional[str] = None
+    body: str = ""
+    # Set for review comments on the diff
+    path: Optional[str] = None
+    line: Optional[int] = None
+
+
+class PullRequestInfo(BaseModel):
+    number: int
+    title: str
+    body: str = ""
+    url: str = ""
+    state: str = ""
+    base_ref: str = ""
+    head_ref: str = ""
+    base_sha: str = ""
+    head_sha: str = ""
+    additions: int = 0
+    deletions: int = 0
+    files: List[PullRequestFile] = Field(default_factory=list)
+    commits: List[PullRequestCommit] = Field(default_factory=list)
+    comments: List[PullRequestComment] = Field(default_factory=list)
+    review_comments: List[PullRequestComment] = Field(default_factory=list)
+
+    def file_paths(self) -> List[str]:
+        return [f.path for f in self.files]
+
+    def has_renames(self) -> bool:
+        return any(f.change_type == "RENAMED" for f in self.files)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Compact dict for prompts and logs: the fields of the former REST based pr_details plus file stats.
+        """
+        return {
+            "title": self.title,
+            "number": str(self.number),
+            "body": self.body,
+            "base": f"{self.base_ref} ({self.base_sha[:12]})",
+            "head": f"{self.head_ref} ({self.head_sha[:12]})",
+            "files": [f"{f.path} (+{f.additions} -{f.deletions})" for f in self.files],
+            "comments": [{"body": c.body, "user": c.author} for c in self.comments],
+            "review_comments": [{"body": c.body, "user": c.author, "path": c.path, "line": c.line}
+                                for c in self.review_comments],
+            "commits": [c.message for c in self.commits],
+        }
+
+
+# connection name -> (include variable, cursor variable)
+_CONNECTIONS = {
+    "files": ("withFiles", "filesCursor"),
+    "commits": ("withCommits", "commitsCursor"),
+    "comments": ("withComments", "commentsCursor"),
+    "reviewThreads": ("withThreads", "threadsCursor"),
+}
+
+
+def fetch_pull_request(repo: str, pr_number: int) -> PullRequestInfo:
+    """
+    Fetch a pull request with its files, commits, comments and review comments.
+    The first query fetches everything; only connections with more pages are queried again.
+    """
+    owner, name = repo.split("/", 1)
+    requester = get_github_wrapper(repo).github.requester
+
+    pending = {connection: None for connection in _CONNECTIONS}  # connection -> cursor
+    nodes: Dict[str, List[Dict[str, Any]]] = {connection: [] for connection in _CONNECTIONS}
+    pr: Dict[str, Any] = {}
+    while pending:
+        variables: Dict[str, Any] = {"owner": owner, "name": name, "number": int(pr_number)}
+        for connection, (include, cursor) in _CONNECTIONS.items():
+            variables[include] = connection in pending
+            variables[cursor] = pending.get(connection)
+        _, data = requester.graphql_query(PULL_REQUEST_QUERY, variables)
+        pr = data["data"]["repository"]["pullRequest"]
+
+        for connection in list(pending):
+            page = pr[connection]
+            nodes[connection].extend(page["nodes"])
+            if page["pageInfo"]["hasNextPage"]:
+                pending[connection] = page["pageInfo"]["endCursor"]
+            else:
+                del pending[connection]
+
+    def author(node: Dict[str, Any], key: str) -> Optional[str]:
+        return (node.get("author") or {}).get(key)
+
+    return PullRequestInfo(
+        number=pr["number"],
+        title=pr["title"],
+        body=pr["body"] or "",
+        url=pr["url"],
+        state=pr["state"],
+        base_ref=pr["baseRefName"],
+        head_ref=pr["headRefName"],
+        base_sha=pr["baseRefOid"],
+        head_sha=pr["headRefOid"],
+        additions=pr["additions"],
+        deletions=pr["deletions"],
+        files=[
+            PullRequestFile(path=f["path"], additions=f["additions"], deletions=f["deletions"], change_type=f["changeType"])
+            for f in nodes["files"]
+        ],
+        commits=[
+            PullRequestCommit(oid=c["commit"]["oid"], message=c["commit"]["messageHeadline"], author=author(c["commit"], "name"))
+            for c in nodes["commits"]
+        ],
+        comments=[PullRequestComment(author=author(c, "login"), body=c["body"]) for c in nodes["comments"]],
+        review_comments=[
+            PullRequestComment(author=author(c, "login"), body=c["body"], path=c["path"], line=c["line"])
+            for thread in nodes["reviewThreads"]
+            for c in thread["comments"]["nodes"]
+        ],
+    )
+
+
+class PullRequestInput(BaseModel):
+    repo: str = Field(..., description="owner/repo string")
+    pr_number: int = Field(..., description="Pull request number")
+
+
+class GetPullRequestInfo(BaseTool):
+    name: str = "Get Pull Request Info"
+    description: str = "Retrieve title, body, base/head commits, changed files, commits, comments and review comments of a pull request."
+    args_schema: Type[BaseModel] = PullRequestInput
+
+    def _run(self, repo: str, pr_number: int) -> PullRequestInfo:
+        return fetch_pull_request(repo, pr_number)
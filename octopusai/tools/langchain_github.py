@@ -1,7 +1,7 @@
-from typing import Type
-from langchain_community.utilities.github import GitHubAPIWrapper
+from typing import List, Type
 from crewai.tools import BaseTool
 from pydantic import Field, BaseModel
+from octopusai.tools.github_client import get_github_wrapper
 
 class RepoInput(BaseModel):
     repo: str = Field(..., description="owner/repo string")
@@ -12,7 +12,7 @@ class ListOpenPullRequests(BaseTool):
     args_schema: Type[BaseModel] = RepoInput
 
     def _run(self, repo: str) -> str:
-        gh = GitHubAPIWrapper(github_repository=repo)
+        gh = get_github_wrapper(repo)
         return gh.list_open_pull_requests()
 
 
@@ -26,7 +26,7 @@ class GetPullRequest(BaseTool):
     args_schema: Type[BaseModel] = PullRequestInput
 
     def _run(self, repo: str, pr_number: int) -> str:
-        gh = GitHubAPIWrapper(github_repository=repo)
+        gh = get_github_wrapper(repo)
         return gh.get_pull_request(pr_number)
 
 class ListPullRequestFiles(BaseTool):
@@ -35,9 +35,23 @@ class ListPullRequestFiles(BaseTool):
     args_schema: Type[BaseModel] = PullRequestInput
 
     def _run(self, repo: str, pr_number: int) -> str:
-        gh = GitHubAPIWrapper(github_repository=repo)
+        gh = get_github_wrapper(repo)
         return gh.list_pull_request_files(pr_number)
 
+class ListPullRequestFilePaths(BaseTool):
+    name: str = "List Pull Request File Paths"
+    description: str = "List the paths of files changed in a specific pull request, without their contents."
+    args_schema: Type[BaseModel] = PullRequestInput
+
+    def _run(self, repo: str, pr_number: int) -> List[str]:
+        gh = get_github_wrapper(repo)
+        paths = []
+        for file in gh.github_repo_instance.get_pull(number=int(pr_number)).get_files():
+            paths.append(file.filename)
+            if file.previous_filename:
+                paths.append(file.previous_filename)
+        return paths
+
 class CreatePullRequestInput(BaseModel):
     repo: str = Field(..., description="owner/repo string")
     pr_query: str = Field(..., description="Pull request query")
@@ -50,5 +64,5 @@ class CreatePullRequest(BaseTool):
     args_schema: Type[BaseModel] = CreatePullRequestInput
 
     def _run(self, repo: str, pr_query: str, src_branch: str, dest_branch: str) -> str:
-        gh = GitHubAPIWrapper(github_repository=repo, active_branch=src_branch, github_base_branch=dest_branch)
+        gh = get_github_wrapper(repo, active_branch=src_branch, base_branch=dest_branch)
         return gh.create_pull_request(pr_query=pr_query)
\ No newline at end of file
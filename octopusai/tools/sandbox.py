@@ -0,0 +1,311 @@
+"""Restricted in-process Python execution, used when Docker is not available.
+
+SandboxPython blocks unsafe modules and builtins. RestrictedWorkerPool runs it in a
+pool of pre-started worker processes with CPU time and address space limits and a
+wall-clock timeout, so generated code can neither hang nor crash the agent process.
+
+Workers run this file as a script. It only depends on the standard library, so a
+worker starts in milliseconds and does not import crewai or docker.
+"""
+
+import io
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+from contextlib import redirect_stderr, redirect_stdout
+from types import ModuleType
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, limits are skipped there
+    resource = None
+
+
+class SandboxPython:
+    """A restricted Python execution environment for running code safely.
+
+    This class provides methods to safely execute Python code by restricting access to
+    potentially dangerous modules and built-in functions. It creates a sandboxed
+    environment where harmful operations are blocked.
+    """
+
+    BLOCKED_MODULES = {
+        "os",
+        "sys",
+        "subprocess",
+        "shutil",
+        "importlib",
+        "inspect",
+        "tempfile",
+        "sysconfig",
+        "builtins",
+    }
+
+    UNSAFE_BUILTINS = {
+        "exec",
+        "eval",
+        "open",
+        "compile",
+        "input",
+        "globals",
+        "locals",
+        "vars",
+        "help",
+        "dir",
+    }
+
+    @staticmethod
+    def restricted_import(
+        name: str,
+        custom_globals: Optional[Dict[str, Any]] = None,
+        custom_locals: Optional[Dict[str, Any]] = None,
+        fromlist: Optional[List[str]] = None,
+        level: int = 0,
+    ) -> ModuleType:
+        """A restricted import function that blocks importing of unsafe modules.
+
+        Args:
+            name: The name of the module to import.
+            custom_globals: Global namespace to use.
+            custom_locals: Local namespace to use.
+            fromlist: List of items to import from the module.
+            level: The level value passed to __import__.
+
+        Returns:
+            The imported module if allowed.
+
+        Raises:
+            ImportError: If the module is in the blocked modules list.
+        """
+        if name in SandboxPython.BLOCKED_MODULES:
+            raise ImportError(f"Importing '{name}' is not allowed.")
+        return __import__(name, custom_globals, custom_locals, fromlist or (), level)
+
+    @staticmethod
+    def safe_builtins() -> Dict[str, Any]:
+        """Creates a dictionary of built-in functions with unsafe ones removed.
+
+        Returns:
+            A dictionary of safe built-in functions and objects.
+        """
+        import builtins
+
+        safe_builtins = {
+            k: v
+            for k, v in builtins.__dict__.items()
+            if k not in SandboxPython.UNSAFE_BUILTINS
+        }
+        safe_builtins["__import__"] = SandboxPython.restricted_import
+        return safe_builtins
+
+    @staticmethod
+    def exec(code: str, locals: Dict[str, Any]) -> None:
+        """Executes Python code in a restricted environment.
+
+        Args:
+            code: The Python code to execute as a string.
+            locals: A dictionary that will be used for local variable storage.
+        """
+        exec(code, {"__builtins__": SandboxPython.safe_builtins()}, locals)
+
+
+
+def _set_cpu_limit(cpu_seconds: int) -> None:
+    """Allows the calling process `cpu_seconds` more seconds of CPU time (RLIMIT_CPU counts from process start)."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = int(usage.ru_utime + usage.ru_stime) + cpu_seconds
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _worker_main(cpu_seconds: int, memory_bytes: int) -> None:
+    """Worker process main loop: executes JSON line requests from stdin with SandboxPython.
+
+    Args:
+        cpu_seconds: CPU time allowed per execution, exceeding it kills the worker (SIGXCPU).
+        memory_bytes: Address space limit of the worker.
+    """
+    protocol = os.fdopen(os.dup(1), "w", buffering=1)
+    # Keep stray writes to fd 1 (e.g. from C extensions) off the protocol channel
+    os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+    if resource is not None and memory_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+
+    for line in sys.stdin:
+        code = json.loads(line)["code"]
+        if resource is not None and cpu_seconds:
+            _set_cpu_limit(cpu_seconds)
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        exec_locals: Dict[str, Any] = {}
+        error = None
+        try:
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                SandboxPython.exec(code=code, locals=exec_locals)
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+        result = exec_locals.get("result")
+        protocol.write(
+            json.dumps(
+                {
+                    "stdout": stdout.getvalue(),
+                    "stderr": stderr.getvalue(),
+                    "result": None if result is None else str(result),
+                    "error": error,
+                }
+            )
+            + "\n"
+        )
+
+
+class _Worker:
+    def __init__(self, cpu_seconds: int, memory_bytes: int):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), str(cpu_seconds), str(memory_bytes)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+        )
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        threading.Thread(target=self._read_lines, daemon=True).start()
+
+    def _read_lines(self) -> None:
+        for line in self.process.stdout:
+            self._lines.put(line)
+        self._lines.put(None)
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def request(self, code: str, timeout: float) -> Optional[Dict[str, Optional[str]]]:
+        """Sends code to the worker and waits for the response.
+
+        Raises:
+            TimeoutError: If the worker did not answer in time.
+            EOFError: If the worker died.
+        """
+        try:
+            self.process.stdin.write(json.dumps({"code": code}) + "\n")
+            self.process.stdin.flush()
+        except OSError:
+            raise EOFError()
+        try:
+            line = self._lines.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError()
+        if line is None:
+            raise EOFError()
+        return json.loads(line)
+
+    def kill(self) -> None:
+        if self.alive:
+            self.process.kill()
+        self.process.wait()
+
+
+class RestrictedWorkerPool:
+    """A pool of pre-started processes executing code with SandboxPython.
+
+    Each worker has an address space limit and a per-execution CPU time limit; the pool
+    adds a wall-clock timeout. A worker that times out, exceeds a limit or crashes is
+    killed and replaced, the others keep serving.
+    """
+
+    def __init__(self, size: int = 2, cpu_seconds: int = 30, memory_bytes: int = 512 * 1024 * 1024):
+        self.size = size
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._count = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _spawn(self) -> Optional[_Worker]:
+        with self._lock:
+            if self._closed or self._count >= self.size:
+                return None
+            self._count += 1
+        try:
+            return _Worker(self.cpu_seconds, self.memory_bytes)
+        except BaseException:
+            with self._lock:
+                self._count -= 1
+            raise
+
+    def _discard(self, worker: _Worker) -> None:
+        worker.kill()
+        with self._lock:
+            self._count -= 1
+
+    def warm_up(self) -> None:
+        """Starts workers until the pool is full and marks them idle."""
+        while True:
+            worker = self._spawn()
+            if worker is None:
+                return
+            self._idle.put(worker)
+
+    def _lease(self) -> _Worker:
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                worker = self._spawn() or self._idle.get()
+            if worker.alive:
+                return worker
+            self._discard(worker)
+
+    def run(self, code: str, timeout: int = 60) -> Dict[str, Optional[str]]:
+        """Executes code in a worker process.
+
+        Args:
+            code: The Python code to execute as a string.
+            timeout: Maximum wall-clock time in seconds.
+
+        Returns:
+            A dictionary with the execution's stdout, stderr, the string value of its
+            `result` variable (or None) and an error message (or None).
+        """
+        worker = self._lease()
+        try:
+            response = worker.request(code, timeout)
+        except TimeoutError:
+            self._discard(worker)
+            return {"stdout": "", "stderr": "", "result": None,
+                    "error": f"Execution timed out after {timeout} seconds"}
+        except EOFError:
+            # The worker died: CPU or memory limit exceeded, or the interpreter crashed
+            returncode = worker.process.wait()
+            self._discard(worker)
+            return {"stdout": "", "stderr": "", "result": None,
+                    "error": f"The sandbox process was terminated (exit code {returncode}), "
+                             f"limits are {self.cpu_seconds}s CPU time and {self.memory_bytes // (1024 * 1024)} MB memory"}
+        if self._closed:
+            self._discard(worker)
+        else:
+            self._idle.put(worker)
+        return response
+
+    def close(self) -> None:
+        """Stops all idle workers, busy ones are stopped when they are returned."""
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+if __name__ == "__main__":
+    # Do not let sandboxed code import the sibling modules of this script
+    sys.path.pop(0)
+    _worker_main(int(sys.argv[1]), int(sys.argv[2]))
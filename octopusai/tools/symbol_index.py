@@ -0,0 +1,345 @@
+"""Symbol index of a cloned repository and a code search tool over it.
+
+The index holds definitions, call references and imports of every supported file. It is
+built per commit and persisted in the cache directory of the repository (see
+git_tool.index_store_dir), shared by all runs' clones; entries are keyed by blob id, so
+indexing another commit only parses changed files.
+Files modified in the working tree (e.g. by applied fixes) are re-indexed at query time.
+In a partial clone (sparse clone mode) only the files present locally are indexed, the
+others would be fetched from the remote one by one.
+
+Languages are pluggable: subclass LanguageIndexer and register_indexer() it.
+"""
+
+import abc
+import ast
+import fnmatch
+import json
+import os
+import subprocess
+import threading
+from typing import Dict, List, Optional, Tuple, Type
+
+from crewai.tools import BaseTool
+from pydantic import BaseModel, Field
+
+from octopusai.tools.git_tool import head_blobs, index_store_dir, is_partial_clone, read_blobs
+
+INDEX_VERSION = 1
+
+
+class Definition(BaseModel):
+    name: str
+    qualname: str
+    kind: str  # class | function | method | variable
+    path: str
+    line: int
+    end_line: int
+
+
+class Reference(BaseModel):
+    name: str
+    path: str
+    line: int
+    context: str = ""  # Qualified name of the enclosing definition, "" at module level
+
+
+class Import(BaseModel):
+    module: str
+    name: Optional[str] = None  # None for `import module`
+    alias: Optional[str] = None
+    path: str
+    line: int
+
+
+class FileSymbols(BaseModel):
+    blob: str = ""
+    definitions: List[Definition] = Field(default_factory=list)
+    references: List[Reference] = Field(default_factory=list)
+    imports: List[Import] = Field(default_factory=list)
+
+
+class LanguageIndexer(abc.ABC):
+    """
+    Extracts the symbols of one language. `extensions` selects the files it is used for.
+    """
+
+    extensions: Tuple[str, ...] = ()
+
+    @abc.abstractmethod
+    def index(self, path: str, source: str) -> FileSymbols:
+        ...
+
+
+class PythonIndexer(LanguageIndexer):
+    extensions = (".py", ".pyi")
+
+    def index(self, path: str, source: str) -> FileSymbols:
+        symbols = FileSymbols()
+        try:
+            tree = ast.parse(source)
+        except (SyntaxError, ValueError):
+            return symbols
+
+        def visit(node: ast.AST, scope: List[str], in_class: bool):
+            for child in ast.iter_child_nodes(node):
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    is_class = isinstance(child, ast.ClassDef)
+                    qualname = ".".join(scope + [child.name])
+                    kind = "class" if is_class else "method" if in_class else "function"
+                    start = min([child.lineno] + [d.lineno for d in child.decorator_list])
+                    symbols.definitions.append(Definition(
+                        name=child.name, qualname=qualname, kind=kind, path=path, line=start, end_line=child.end_lineno,
+                    ))
+                    visit(child, scope + [child.name], is_class)
+                    continue
+                if isinstance(child, (ast.Assign, ast.AnnAssign)) and len(scope) <= 1 and (not scope or in_class):
+                    targets = child.targets if isinstance(child, ast.Assign) else [child.target]
+                    for target in targets:
+                        if isinstance(target, ast.Name):
+                            symbols.definitions.append(Definition(
+                                name=target.id, qualname=".".join(scope + [target.id]), kind="variable",
+                                path=path, line=child.lineno, end_line=child.end_lineno,
+                            ))
+                elif isinstance(child, ast.Import):
+                    for alias in child.names:
+                        symbols.imports.append(Import(module=alias.name, alias=alias.asname, path=path, line=child.lineno))
+                elif isinstance(child, ast.ImportFrom):
+                    module = "." * child.level + (child.module or "")
+                    for alias in child.names:
+                        symbols.imports.append(Import(module=module, name=alias.name, alias=alias.asname, path=path, line=child.lineno))
+                elif isinstance(child, ast.Call):
+                    func = child.func
+                    name = func.id if isinstance(func, ast.Name) else func.attr if isinstance(func, ast.Attribute) else None
+                    if name:
+                        symbols.references.append(Reference(name=name, path=path, line=child.lineno, context=".".join(scope)))
+                visit(child, scope, in_class if not isinstance(child, ast.Lambda) else False)
+
+        visit(tree, [], False)
+        return symbols
+
+
+_indexers: List[LanguageIndexer] = [PythonIndexer()]
+
+
+def register_indexer(indexer: LanguageIndexer) -> None:
+    _indexers.insert(0, indexer)
+
+
+def _indexer_for(path: str) -> Optional[LanguageIndexer]:
+    return next((i for i in _indexers if path.endswith(i.extensions)), None)
+
+
+def _git(repo_dir: str, *args: str) -> str:
+    return subprocess.run(["git", "-C", repo_dir, *args], capture_output=True, text=True, check=True).stdout
+
+
+class SymbolIndex:
+    def __init__(self, repo_dir: str, commit: str, files: Dict[str, FileSymbols], partial: bool = False):
+        self.repo_dir = repo_dir
+        self.commit = commit
+        self.files = files
+        self.partial = partial  # Built in a partial clone, without the files not present locally
+        self._head_files = dict(files)
+        self._worktree_paths: set = set()
+        self.version = 0  # Incremented whenever refresh_worktree changes files
+
+    @staticmethod
+    def _store_path(repo_dir: str) -> str:
+        return os.path.join(index_store_dir(repo_dir), "symbols.json")
+
+    @classmethod
+    def build(cls, repo_dir: str) -> "SymbolIndex":
+        """
+        Load the index of HEAD, updating the persisted index of a previous commit for the changed blobs.
+        """
+        commit = _git(repo_dir, "rev-parse", "HEAD").strip()
+        store = cls._store_path(repo_dir)
+        partial = is_partial_clone(repo_dir)
+        previous: Dict[str, FileSymbols] = {}
+        try:
+            with open(store) as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                previous = {path: FileSymbols.model_validate(s) for path, s in data["files"].items()}
+                # The index of a partial clone lacks files, reuse it whole only in another partial clone
+                if data.get("commit") == commit and (partial or not data.get("partial")):
+                    return cls(repo_dir, commit, previous, partial=bool(data.get("partial")))
+        except (OSError, ValueError, KeyError):
+            pass
+
+        by_blob = {s.blob: (path, s) for path, s in previous.items()}
+        files: Dict[str, FileSymbols] = {}
+        changed: List[Tuple[str, str, LanguageIndexer]] = []
+        # Files of HEAD rather than the index or work tree
+        for path, blob in head_blobs(repo_dir):
+            indexer = _indexer_for(path)
+            if indexer is None:
+                continue
+            if blob in by_blob:
+                old_path, symbols = by_blob[blob]
+                files[path] = symbols if old_path == path else _relocate(symbols, path)
+            else:
+                changed.append((path, blob, indexer))
+
+        for (path, blob, indexer), source in zip(changed, read_blobs(repo_dir, [blob for _, blob, _ in changed])):
+            if source is None:
+                continue
+            symbols = indexer.index(path, source)
+            symbols.blob = blob
+            files[path] = symbols
+
+        index = cls(repo_dir, commit, files, partial=partial)
+        index.save(store)
+        return index
+
+    def save(self, store: str) -> None:
+        os.makedirs(os.path.dirname(store), exist_ok=True)
+        tmp = f"{store}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({
+                "version": INDEX_VERSION,
+                "commit": self.commit,
+                "partial": self.partial,
+                "files": {path: s.model_dump() for path, s in self.files.items()},
+            }, f)
+        os.replace(tmp, store)
+
+    def refresh_worktree(self) -> None:
+        """
+        Re-index files which differ from HEAD in the working tree.
+        """
+        # NUL separated entries keep paths unquoted, a rename or copy is followed by its source path
+        entries = iter(_git(self.repo_dir, "status", "--porcelain", "-z", "--untracked-files=all").split("\0"))
+        dirty = []
+        for entry in entries:
+            if not entry:
+                continue
+            dirty.append(entry[3:])
+            if entry[0] in "RC":
+                source = next(entries, "")
+                if source and entry[0] == "R":
+                    dirty.append(source)
+        before = {path: self.files.get(path) for path in self._worktree_paths}
+        # Files reverted to their HEAD version
+        for path in self._worktree_paths - set(dirty):
+            if path in self._head_files:
+                self.files[path] = self._head_files[path]
+            else:
+                self.files.pop(path, None)
+        self._worktree_paths = set()
+        for path in dirty:
+            indexer = _indexer_for(path)
+            if indexer is None:
+                continue
+            self._worktree_paths.add(path)
+            full_path = os.path.join(self.repo_dir, path)
+            try:
+                st = os.stat(full_path)
+                marker = f"worktree:{st.st_mtime_ns}:{st.st_size}"
+                if self.files.get(path) is not None and self.files[path].blob == marker:
+                    continue
+                with open(full_path, encoding="utf-8", errors="replace") as f:
+                    symbols = indexer.index(path, f.read())
+                symbols.blob = marker
+                self.files[path] = symbols
+            except OSError:
+                self.files.pop(path, None)
+        if before.keys() != self._worktree_paths or any(self.files.get(path) is not s for path, s in before.items()):
+            self.version += 1
+
+    def definitions(self, name: str) -> List[Definition]:
+        return [d for s in self.files.values() for d in s.definitions if _matches(name, d.name, d.qualname)]
+
+    def references(self, name: str) -> List[Reference]:
+        # Call sites are only known by name, `Class.method` finds all calls of `method`
+        short = name if any(c in name for c in "*?[") else name.rsplit(".", 1)[-1]
+        return [r for s in self.files.values() for r in s.references if _matches(short, r.name, r.name)]
+
+    def importers(self, name: str) -> List[Import]:
+        """
+        Imports of a module or of a name from a module.
+        """
+        return [i for s in self.files.values() for i in s.imports
+                if _matches(name, i.module, i.module)
+                or (i.name and _matches(name, i.name, f"{i.module}.{i.name}"))]
+
+
+def _relocate(symbols: FileSymbols, path: str) -> FileSymbols:
+    # Same content under a new path (renamed or copied file)
+    data = symbols.model_dump()
+    for key in ("definitions", "references", "imports"):
+        for entry in data[key]:
+            entry["path"] = path
+    return FileSymbols.model_validate(data)
+
+
+def _matches(query: str, name: str, qualname: str) -> bool:
+    if any(c in query for c in "*?["):
+        return fnmatch.fnmatchcase(name, query) or fnmatch.fnmatchcase(qualname, query)
+    return query in (name, qualname) or qualname.endswith("." + query)
+
+
+_indexes: Dict[Tuple[str, str], SymbolIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_symbol_index(repo_dir: str) -> SymbolIndex:
+    """
+    The index of `repo_dir`'s HEAD, built on first use and shared by all tools of the process.
+    """
+    repo_dir = os.path.realpath(repo_dir)
+    commit = _git(repo_dir, "rev-parse", "HEAD").strip()
+    with _indexes_lock:
+        index = _indexes.get((repo_dir, commit))
+        if index is None:
+            index = SymbolIndex.build(repo_dir)
+            _indexes[(repo_dir, commit)] = index
+        index.refresh_worktree()
+    return index
+
+
+class SymbolSearchToolSchema(BaseModel):
+    """Input for SymbolSearchTool."""
+
+    symbol: str = Field(..., description="Name of a function, class, method or variable, e.g. 'parse', 'Parser.parse' or 'parse_*'")
+    kind: Optional[str] = Field(default="all", description="'definitions', 'references' (call sites), 'imports' or 'all'")
+
+
+class SymbolSearchTool(BaseTool):
+    name: str = "Search code symbols"
+    description: str = (
+        "Find where a function, class, method or variable is defined, called and imported in the repository. "
+        "Returns file:line locations, read them with the file read tool."
+    )
+    args_schema: Type[BaseModel] = SymbolSearchToolSchema
+    repo_dir: str
+    max_results: int = 50
+
+    def _run(self, symbol: str, kind: Optional[str] = "all") -> str:
+        try:
+            index = get_symbol_index(self.repo_dir)
+        except Exception as e:
+            return f"Error building the symbol index: {str(e)}"
+        kind = kind or "all"
+        sections = []
+        if kind in ("all", "definitions"):
+            found = index.definitions(symbol)
+            sections.append(_section("Definitions", [f"{d.path}:{d.line}-{d.end_line} {d.kind} {d.qualname}" for d in found], self.max_results))
+        if kind in ("all", "references"):
+            found = index.references(symbol)
+            sections.append(_section("References", [f"{r.path}:{r.line} in {r.context or '<module>'}" for r in found], self.max_results))
+        if kind in ("all", "imports"):
+            found = index.importers(symbol)
+            sections.append(_section("Imports", [
+                f"{i.path}:{i.line} " + (f"from {i.module} import {i.name}" if i.name else f"import {i.module}")
+                + (f" as {i.alias}" if i.alias else "") for i in found
+            ], self.max_results))
+        return "\n\n".join(sections)
+
+
+def _section(title: str, lines: List[str], limit: int) -> str:
+    if not lines:
+        return f"{title}: none"
+    more = f"\n... {len(lines) - limit} more" if len(lines) > limit else ""
+    return f"{title} ({len(lines)}):\n" + "\n".join(lines[:limit]) + more
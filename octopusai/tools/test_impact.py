@@ -0,0 +1,244 @@
+"""Test impact analysis: which tests reach the changed code.
+
+The graph is derived from the symbol index (octopusai.tools.symbol_index): a call of
+`name` in file F is an edge to the definition of `name` in file D if F is D or imports
+D's module (or something from it). Starting from the definitions touched by a diff, the
+callers are followed up to the test functions reaching them. Calls are resolved by name,
+so the selection errs on the side of including too many tests rather than too few.
+The graph is built once per commit (and work tree state) of the index.
+"""
+
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Type
+
+from crewai.tools import BaseTool
+from pydantic import BaseModel, Field
+
+from octopusai.tools.diff_model import PullRequestDiff
+from octopusai.tools.symbol_index import Import, SymbolIndex, get_symbol_index
+
+MAX_DEPTH = 5
+
+
+def is_test_file(path: str) -> bool:
+    name = os.path.basename(path)
+    return name.endswith(".py") and (name.startswith("test_") or name.endswith("_test.py"))
+
+
+def module_name(path: str) -> str:
+    parts = os.path.splitext(path)[0].split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return ".".join(parts)
+
+
+def _imported_names(imp: Import) -> List[str]:
+    """
+    Absolute dotted names an import refers to: the module and, for `from module import name`, module.name.
+    """
+    module = imp.module
+    if module.startswith("."):
+        level = len(module) - len(module.lstrip("."))
+        package = module_name(imp.path).split(".")
+        if not imp.path.endswith("__init__.py"):
+            package = package[:-1]
+        package = package[:len(package) - level + 1]
+        module = ".".join(package + ([module.lstrip(".")] if module.lstrip(".") else []))
+    names = [module]
+    if imp.name and imp.name != "*":
+        names.append(f"{module}.{imp.name}")
+    return names
+
+
+def _is_module(imported: str, dotted: str) -> bool:
+    # `pkg.a` is the module `src.pkg.a` (src layout)
+    return bool(imported) and f".{dotted}".endswith(f".{imported}")
+
+
+def _matches_module(imported: str, dotted: str) -> bool:
+    # Also `pkg` for the names of its submodules, which it may re-export
+    return bool(imported) and f".{imported}." in f".{dotted}."
+
+
+def _test_node(path: str, qualname: str) -> Optional[str]:
+    """
+    pytest node id of the test enclosing `qualname` in a test file, None if it is not inside a test.
+    """
+    parts = qualname.split(".") if qualname else []
+    for i, part in enumerate(parts):
+        if part.startswith("test"):
+            if i == 0:
+                return f"{path}::{part}"
+            if i == 1 and parts[0].startswith("Test"):
+                return f"{path}::{parts[0]}::{part}"
+            return None
+    return None
+
+
+class ImpactGraph:
+    def __init__(self, index: SymbolIndex):
+        self.index = index
+        self.callers: Dict[str, List[Tuple[str, str]]] = defaultdict(list)  # name -> (path, enclosing qualname)
+        self.imports: Dict[str, List[str]] = {}  # path -> imported dotted names
+        for path, symbols in index.files.items():
+            for ref in symbols.references:
+                self.callers[ref.name].append((path, ref.context))
+            self.imports[path] = [name for imp in symbols.imports for name in _imported_names(imp)]
+
+    def _imports(self, path: str, target: str, qualname: str = "") -> bool:
+        """
+        Whether `path` can see `qualname` (module level if empty) defined in `target`.
+        """
+        if path == target:
+            return True
+        module = module_name(target)
+        if not qualname:
+            return any(_is_module(imported, module) for imported in self.imports.get(path, ()))
+        return any(_matches_module(imported, module) for imported in self.imports.get(path, ()))
+
+    def changed_definitions(self, diff: PullRequestDiff) -> List[Tuple[str, str]]:
+        """
+        (path, qualname) of the innermost functions/classes with changed lines, qualname "" for module level changes.
+        """
+        changed = []
+        for f in diff.select().files:
+            symbols = self.index.files.get(f.path)
+            if symbols is None or f.status == "deleted":
+                continue
+            definitions = [d for d in symbols.definitions if d.kind != "variable"]
+            for line in sorted(_changed_lines(f.hunks)):
+                enclosing = [d for d in definitions if d.line <= line <= d.end_line]
+                innermost = max(enclosing, key=lambda d: d.line, default=None)
+                target = (f.path, innermost.qualname if innermost else "")
+                if target not in changed:
+                    changed.append(target)
+        return changed
+
+    def tests_reaching(self, targets: Iterable[Tuple[str, str]], max_depth: int = MAX_DEPTH) -> Dict[str, str]:
+        """
+        pytest node ids of the tests reaching `targets` ((path, qualname) pairs, see changed_definitions),
+        mapped to the target they reach. Test files reached from module level or outside of a test function
+        (e.g. from helpers or fixtures) are selected as a whole.
+        """
+        tests: Dict[str, str] = {}
+        seen: Set[Tuple[str, str]] = set()
+        frontier = [(path, qualname, f"{path}::{qualname}" if qualname else path) for path, qualname in targets]
+        for _ in range(max_depth + 1):
+            next_frontier = []
+            for path, qualname, origin in frontier:
+                if (path, qualname) in seen:
+                    continue
+                seen.add((path, qualname))
+                if is_test_file(path):
+                    node = _test_node(path, qualname)
+                    tests.setdefault(node or path, origin)
+                    if node:
+                        continue
+                if not qualname:
+                    # Module level code runs on import
+                    next_frontier += [(other, "", origin) for other in self.imports
+                                      if other != path and self._imports(other, path)]
+                    continue
+                name = qualname.rsplit(".", 1)[-1]
+                next_frontier += [(caller, context, origin) for caller, context in self.callers.get(name, ())
+                                  if self._imports(caller, path, qualname)]
+            frontier = next_frontier
+        # A whole test file covers its single tests
+        files = {node for node in tests if "::" not in node}
+        return {node: origin for node, origin in tests.items() if node.split("::")[0] not in files or node in files}
+
+
+def _changed_lines(hunks) -> Set[int]:
+    # New side line numbers of added lines, and of the line following removed ones
+    lines = set()
+    for hunk in hunks:
+        line = hunk.new_start
+        for text in hunk.lines:
+            if text.startswith("+"):
+                lines.add(line)
+                line += 1
+            elif text.startswith("-"):
+                lines.add(line)
+            elif not text.startswith("\\"):
+                line += 1
+    return lines
+
+
+_graphs: Dict[str, Tuple[Tuple[str, int], ImpactGraph]] = {}
+_graphs_lock = threading.Lock()
+
+
+def get_impact_graph(repo_dir: str) -> ImpactGraph:
+    """
+    The impact graph of `repo_dir`'s HEAD and work tree, rebuilt when either changes.
+    """
+    index = get_symbol_index(repo_dir)
+    key = (index.commit, index.version)
+    with _graphs_lock:
+        cached = _graphs.get(index.repo_dir)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+    graph = ImpactGraph(index)
+    with _graphs_lock:
+        _graphs[index.repo_dir] = (key, graph)
+    return graph
+
+
+def select_tests(repo_dir: str, diffs: Iterable[Optional[PullRequestDiff]], max_depth: int = MAX_DEPTH) -> Dict[str, str]:
+    """
+    Tests reaching the code changed by `diffs` in `repo_dir` (new side paths and lines), as pytest node ids
+    relative to the repository root mapped to the changed definition they reach.
+    """
+    graph = get_impact_graph(repo_dir)
+    targets = []
+    for diff in diffs:
+        if diff is not None:
+            targets += [t for t in graph.changed_definitions(diff) if t not in targets]
+    return graph.tests_reaching(targets, max_depth=max_depth)
+
+
+class TestImpactToolSchema(BaseModel):
+    """Input for TestImpactTool."""
+
+    symbol: Optional[str] = Field(default=None, description="Function, class or method whose tests to find, e.g. 'parse' or 'Parser.parse'")
+    file_path: Optional[str] = Field(default=None, description="File (relative to the repository root) whose tests to find, or to which the symbol belongs")
+
+
+class TestImpactTool(BaseTool):
+    __test__ = False  # Not a pytest test class
+
+    name: str = "Find tests for code"
+    description: str = (
+        "Find the existing tests which call a function, class or method, directly or through other code, "
+        "or which exercise a file. Returns pytest node ids relative to the repository root."
+    )
+    args_schema: Type[BaseModel] = TestImpactToolSchema
+    repo_dir: str
+    max_results: int = 50
+
+    def _run(self, symbol: Optional[str] = None, file_path: Optional[str] = None) -> str:
+        if not symbol and not file_path:
+            return "Error: Provide a symbol or a file_path"
+        try:
+            graph = get_impact_graph(self.repo_dir)
+        except Exception as e:
+            return f"Error building the test impact graph: {str(e)}"
+        if file_path:
+            file_path = os.path.relpath(os.path.join(self.repo_dir, file_path), self.repo_dir)
+        if symbol:
+            targets = [(d.path, d.qualname) for d in graph.index.definitions(symbol)
+                       if d.kind != "variable" and (not file_path or d.path == file_path)]
+        else:
+            symbols = graph.index.files.get(file_path)
+            targets = [(file_path, "")] + [(file_path, d.qualname) for d in symbols.definitions
+                                           if d.kind != "variable"] if symbols else []
+        if not targets:
+            return f"No definition of {symbol or file_path} found"
+        tests = graph.tests_reaching(targets)
+        if not tests:
+            return f"No tests found reaching {symbol or file_path}"
+        lines = [f"{node} (reaches {origin})" for node, origin in sorted(tests.items())]
+        more = f"\n... {len(lines) - self.max_results} more" if len(lines) > self.max_results else ""
+        return f"Tests ({len(lines)}):\n" + "\n".join(lines[:self.max_results]) + more
@@ -0,0 +1,187 @@
+"""Evaluation of applied fixes with the repository's tests.
+
+The tests of all fixed files run in one pytest session (spread over the cores with
+pytest-xdist when it is installed), and the outcomes are read from its JUnit XML report
+instead of the console output. The tests are code of the repository under review: on the
+host they run without the process environment's secrets (API keys, tokens), and
+run_pytest_in_sandbox runs them in a sandbox container instead.
+"""
+
+import importlib.util
+import os
+import subprocess
+import tempfile
+import xml.etree.ElementTree as ET
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+if TYPE_CHECKING:
+    from octopusai.tools.code_interpreter_with_timeout import CodeInterpreterTool
+
+# Variables of the process environment passed on to the tests run on the host
+TEST_ENV_VARS = ("PATH", "HOME", "USER", "LANG", "LC_ALL", "LC_CTYPE", "TERM", "TMPDIR", "TEMP", "TMP",
+                 "VIRTUAL_ENV", "SYSTEMROOT", "PYTHONHASHSEED")
+
+
+class TestOutcome(BaseModel):
+    __test__ = False  # Not a pytest test class
+
+    nodeid: str
+    outcome: str  # passed | failed | error | skipped
+    duration_s: float = 0.0
+    message: Optional[str] = None
+
+
+def to_test_path(path: str) -> str:
+    directory, filename = os.path.split(path)
+    base_dir = os.path.dirname(directory)
+    test_dir = os.path.join(base_dir, "python_testcases")
+    return os.path.join(test_dir, f"test_{filename}")
+
+
+def _nodeid(classname: str, name: str, file: Optional[str], root_dir: Optional[str]) -> str:
+    # The JUnit classname is the node id's path with "/" as "." and without ".py", followed by the test classes
+    # (tests/test_core.py::TestCore::test_api -> tests.test_core.TestCore), map it back to the pytest node id
+    if not classname:
+        return name
+    parts = classname.split(".")
+    if file and file.endswith(".py"):
+        module = file[:-3].replace("/", ".").replace(os.sep, ".")
+        if classname == module or classname.startswith(module + "."):
+            return "::".join([file.replace(os.sep, "/")] + parts[len(module.split(".")):] + [name])
+    if root_dir is not None:
+        for i in range(len(parts), 0, -1):
+            candidate = "/".join(parts[:i]) + ".py"
+            if os.path.isfile(os.path.join(root_dir, candidate)):
+                return "::".join([candidate] + parts[i:] + [name])
+    return f"{classname}::{name}"
+
+
+def parse_junit_xml(path: str, root_dir: Optional[str] = None) -> List[TestOutcome]:
+    """
+    Outcomes of a pytest JUnit XML report, with pytest node ids (e.g. tests/test_core.py::TestCore::test_api).
+    The test files are taken from the `file` attributes of junit_family=xunit1 reports, else looked up in `root_dir`.
+    """
+    return _parse_junit(ET.parse(path).getroot(), root_dir)
+
+
+def _parse_junit(root: ET.Element, root_dir: Optional[str]) -> List[TestOutcome]:
+    outcomes = []
+    for case in root.iter("testcase"):
+        classname, name = case.get("classname", ""), case.get("name", "")
+        nodeid = _nodeid(classname, name, case.get("file"), root_dir)
+        outcome, message = "passed", None
+        for tag in ("failure", "error", "skipped"):
+            element = case.find(tag)
+            if element is not None:
+                outcome = "failed" if tag == "failure" else tag
+                message = element.get("message")
+                break
+        outcomes.append(TestOutcome(nodeid=nodeid, outcome=outcome, duration_s=float(case.get("time") or 0), message=message))
+    return outcomes
+
+
+def _xdist_available() -> bool:
+    return importlib.util.find_spec("xdist") is not None
+
+
+def run_pytest(work_dir: str, files: List[str], timeout_s: int = 60, workers: Optional[int] = None,
+               tests: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Run the tests of the fixed `files` (see to_test_path), or the given `tests` (paths or node ids relative to
+    `work_dir`, e.g. from octopusai.tools.test_impact), in one pytest session in `work_dir`.
+    `workers` > 1 distributes the test files with pytest-xdist, if installed (default: one per core,
+    at most one per test file).
+    """
+    env = {name: os.environ[name] for name in TEST_ENV_VARS if name in os.environ}
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    # Import the code under test from the work tree as `python -m pytest` would, also without a root conftest.py
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (os.path.abspath(work_dir), os.environ.get("PYTHONPATH")) if p)
+
+    existing, raw_outputs = _existing_tests(work_dir, tests or [to_test_path(f) for f in files])
+    if not existing:
+        return {"tests_total": 0, "tests_failed": 0, "tests_pass": False, "tests": [], "raw": "\n".join(raw_outputs)}
+
+    if workers is None:
+        workers = min(os.cpu_count() or 1, len({p.split("::")[0] for p in existing}))
+    with tempfile.TemporaryDirectory(prefix="octopusai_pytest_") as report_dir:
+        report = os.path.join(report_dir, "junit.xml")
+        cmd = ["pytest", f"--junitxml={report}", "-o", "junit_family=xunit1"]
+        if workers > 1 and _xdist_available():
+            cmd += ["-p", "xdist", "-n", str(workers)]
+        cmd += existing
+        try:
+            proc = subprocess.run(
+                cmd,
+                cwd=work_dir,
+                env=env,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                timeout=timeout_s,
+                text=True,
+            )
+        except subprocess.TimeoutExpired:
+            raw_outputs.append(f"=== {' '.join(existing)} ===\nTIMEOUT after {timeout_s}s")
+            return _timeout_result(raw_outputs)
+        raw_outputs.append(f"=== {' '.join(existing)} ===\n{proc.stdout}")
+        try:
+            outcomes = parse_junit_xml(report, work_dir)
+        except (OSError, ET.ParseError):
+            # pytest failed before writing the report (e.g. usage error)
+            outcomes = []
+
+    return _result(outcomes, proc.returncode, raw_outputs)
+
+
+def run_pytest_in_sandbox(interpreter: "CodeInterpreterTool", tests: List[str], timeout_s: int = 60) -> Dict[str, Any]:
+    """
+    Run the `tests` (paths or node ids relative to the interpreter's repo_dir) in one pytest session in a sandbox
+    container of `interpreter` (see CodeInterpreterTool.run_pytest_in_docker). Same result as run_pytest.
+    Raises RuntimeError if Docker is not available.
+    """
+    # The container sees the repository at another path
+    tests = [os.path.relpath(t, interpreter.repo_dir) if os.path.isabs(t) else t for t in tests]
+    existing, raw_outputs = _existing_tests(interpreter.repo_dir, tests)
+    if not existing:
+        return {"tests_total": 0, "tests_failed": 0, "tests_pass": False, "tests": [], "raw": "\n".join(raw_outputs)}
+
+    returncode, output, report = interpreter.run_pytest_in_docker(existing, timeout=timeout_s)
+    if returncode is None:
+        raw_outputs.append(f"=== {' '.join(existing)} ===\n{output}\nTIMEOUT after {timeout_s}s")
+        return _timeout_result(raw_outputs)
+    raw_outputs.append(f"=== {' '.join(existing)} ===\n{output}")
+    try:
+        outcomes = _parse_junit(ET.fromstring(report), interpreter.repo_dir) if report else []
+    except ET.ParseError:
+        outcomes = []
+    return _result(outcomes, returncode, raw_outputs)
+
+
+def _existing_tests(work_dir: str, tests: List[str]):
+    test_paths = list(dict.fromkeys(tests))
+    existing = [p for p in test_paths if os.path.exists(os.path.join(work_dir, p.split("::")[0]))]
+    return existing, [f"=== {p} ===\nNot found" for p in test_paths if p not in existing]
+
+
+def _timeout_result(raw_outputs: List[str]) -> Dict[str, Any]:
+    return {
+        "tests_total": 0,
+        "tests_failed": 0,
+        "tests_pass": False,
+        "timeout": True,
+        "tests": [],
+        "raw": "\n".join(raw_outputs),
+    }
+
+
+def _result(outcomes: List[TestOutcome], returncode: int, raw_outputs: List[str]) -> Dict[str, Any]:
+    ran = [t for t in outcomes if t.outcome != "skipped"]
+    failed = [t for t in ran if t.outcome in ("failed", "error")]
+    return {
+        "tests_total": len(ran),
+        "tests_failed": len(failed),
+        "tests_pass": (not failed and len(ran) > 0 and returncode == 0),
+        "tests": [t.model_dump() for t in outcomes],
+        "raw": "\n".join(raw_outputs),
+    }
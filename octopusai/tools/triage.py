@@ -0,0 +1,183 @@
+"""Deterministic pre-triage of a pull request before the crew starts.
+
+Runs the existing tests reaching the changed code (octopusai.tools.test_impact) and cheap
+static checks of the changed Python files: compilation (syntax errors and SyntaxWarnings
+such as `is` with a literal), duplicate definitions in a scope, and ruff's error rules if
+ruff is installed. The report is evidence for the crew, and with the skip_clean policy a
+PR whose impacted tests pass without findings does not start the crew at all.
+
+The tests are code of the PR: they run in a sandbox container of the code interpreter, and
+on the host (without the environment's secrets) only if explicitly allowed when Docker is
+not available.
+"""
+
+import ast
+import json
+import os
+import shutil
+import subprocess
+import time
+import warnings
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from octopusai.tools.diff_model import PullRequestDiff
+from octopusai.tools.test_runner import run_pytest, run_pytest_in_sandbox
+
+if TYPE_CHECKING:
+    from octopusai.tools.code_interpreter_with_timeout import CodeInterpreterTool
+
+# off: no pre-triage | evidence: always run the crew with the report | skip_clean: no crew for clean PRs
+TRIAGE_POLICIES = ("off", "evidence", "skip_clean")
+
+# pyflakes/pycodestyle rules which are almost always bugs (flake8's "serious" set)
+RUFF_RULES = "E9,F63,F7,F82"
+MAX_OUTPUT_CHARS = 4000
+
+
+class TriageFinding(BaseModel):
+    path: str
+    line: int
+    check: str  # compile | duplicate-definition | ruff:<code>
+    message: str
+
+
+class TriageReport(BaseModel):
+    findings: List[TriageFinding] = Field(default_factory=list)
+    tests: List[str] = Field(default_factory=list)  # Impacted tests which were run
+    test_result: Optional[Dict[str, Any]] = None  # run_pytest result
+    tests_skipped_reason: Optional[str] = None  # Why the impacted tests were not run
+    duration_s: float = 0.0
+
+    @property
+    def failed_tests(self) -> List[Dict[str, Any]]:
+        return [t for t in (self.test_result or {}).get("tests", []) if t["outcome"] in ("failed", "error")]
+
+    @property
+    def clean(self) -> bool:
+        """
+        Impacted tests ran and passed, and the static checks found nothing.
+        """
+        return not self.findings and bool(self.test_result and self.test_result.get("tests_pass"))
+
+    def render(self) -> str:
+        lines = []
+        if self.findings:
+            lines.append("Static checks of the changed files:")
+            lines += [f"- {f.path}:{f.line} [{f.check}] {f.message}" for f in self.findings]
+        else:
+            lines.append("Static checks of the changed files: no findings")
+        if not self.tests:
+            lines.append("Existing tests reaching the changes: none found")
+        elif self.tests_skipped_reason is not None:
+            lines.append(f"Existing tests reaching the changes ({len(self.tests)}): not run, {self.tests_skipped_reason}")
+        elif self.test_result is not None:
+            result = self.test_result
+            if result.get("timeout"):
+                lines.append(f"Existing tests reaching the changes ({len(self.tests)}): timed out")
+            else:
+                lines.append(f"Existing tests reaching the changes: {result['tests_total']} run, {result['tests_failed']} failed")
+            for t in self.failed_tests:
+                lines.append(f"- {t['outcome'].upper()} {t['nodeid']}: {t.get('message') or ''}".rstrip(": "))
+            if self.failed_tests or result.get("timeout"):
+                raw = result.get("raw", "")
+                lines.append("pytest output:\n" + (raw if len(raw) <= MAX_OUTPUT_CHARS else "...\n" + raw[-MAX_OUTPUT_CHARS:]))
+        return "\n".join(lines)
+
+
+def _compile_findings(path: str, source: str) -> List[TriageFinding]:
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        try:
+            compile(source, path, "exec", dont_inherit=True)
+        except SyntaxError as e:
+            return [TriageFinding(path=path, line=e.lineno or 0, check="compile", message=f"{type(e).__name__}: {e.msg}")]
+        except ValueError as e:  # e.g. null bytes
+            return [TriageFinding(path=path, line=0, check="compile", message=str(e))]
+    return [TriageFinding(path=path, line=getattr(w, "lineno", 0) or 0, check="compile", message=f"{w.category.__name__}: {w.message}")
+            for w in caught if issubclass(w.category, SyntaxWarning)]
+
+
+def _duplicate_definitions(path: str, source: str) -> List[TriageFinding]:
+    """
+    Functions/classes defined twice in the same scope, where the first one is silently replaced.
+    """
+    findings = []
+    for scope in ast.walk(ast.parse(source)):
+        seen: Dict[str, int] = {}
+        for node in getattr(scope, "body", []):
+            if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                continue
+            # Overloads and property setters legitimately reuse the name
+            if any(isinstance(d, ast.Attribute) or getattr(d, "id", None) == "overload" for d in node.decorator_list):
+                continue
+            if node.name in seen:
+                findings.append(TriageFinding(path=path, line=node.lineno, check="duplicate-definition",
+                                              message=f"{node.name} redefines the definition at line {seen[node.name]}"))
+            seen[node.name] = node.lineno
+    return findings
+
+
+def _ruff_findings(repo_dir: str, paths: List[str]) -> List[TriageFinding]:
+    ruff = shutil.which("ruff")
+    if ruff is None or not paths:
+        return []
+    res = subprocess.run([ruff, "check", "--no-cache", "--isolated", "--select", RUFF_RULES, "--output-format", "json", *paths],
+                         cwd=repo_dir, capture_output=True, text=True, timeout=60)
+    try:
+        issues = json.loads(res.stdout or "[]")
+    except ValueError:
+        return []
+    return [TriageFinding(path=os.path.relpath(i["filename"], repo_dir), line=(i.get("location") or {}).get("row", 0),
+                          check=f"ruff:{i.get('code')}", message=i.get("message", "")) for i in issues]
+
+
+def static_checks(repo_dir: str, diff: PullRequestDiff) -> List[TriageFinding]:
+    paths = [f.path for f in diff.select().files if f.path.endswith(".py") and f.status != "deleted"]
+    findings: List[TriageFinding] = []
+    checked = []
+    for path in paths:
+        try:
+            with open(os.path.join(repo_dir, path), encoding="utf-8", errors="replace") as f:
+                source = f.read()
+        except OSError:
+            continue
+        checked.append(path)
+        compiled = _compile_findings(path, source)
+        findings += compiled
+        if not any(f.message.startswith(("SyntaxError", "IndentationError", "TabError")) for f in compiled):
+            findings += _duplicate_definitions(path, source)
+    try:
+        findings += _ruff_findings(repo_dir, checked)
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Error running ruff: {str(e)}")
+    # ruff reports syntax errors as well
+    unique = {(f.path, f.line, f.message): f for f in findings}
+    return list(unique.values())
+
+
+def triage(repo_dir: str, diff: PullRequestDiff, tests: List[str], timeout_s: int = 60,
+           sandbox: Optional["CodeInterpreterTool"] = None, allow_host: bool = False) -> TriageReport:
+    """
+    Run the static checks on the changed files of `diff` and the impacted `tests` in `repo_dir`.
+    The tests run in a container of `sandbox` (a code interpreter mounting `repo_dir`); without Docker they are
+    only run on the host with `allow_host`.
+    """
+    start = time.perf_counter()
+    report = TriageReport(findings=static_checks(repo_dir, diff), tests=tests)
+    if tests:
+        reason = "no sandbox"
+        if sandbox is not None:
+            try:
+                report.test_result = run_pytest_in_sandbox(sandbox, tests, timeout_s=timeout_s)
+            except Exception as e:
+                reason = f"the sandbox failed: {str(e)}"
+                print(f"Error running the impacted tests in the sandbox: {str(e)}")
+        if report.test_result is None:
+            if allow_host:
+                report.test_result = run_pytest(repo_dir, [], timeout_s=timeout_s, tests=tests)
+            else:
+                report.tests_skipped_reason = f"{reason} and running the PR's tests on the host is not allowed"
+    report.duration_s = round(time.perf_counter() - start, 3)
+    return report